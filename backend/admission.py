@@ -0,0 +1,227 @@
+# admission.py
+import os
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))                      # concurrent supervisor runs per process
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))                 # waiting requests, all users
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "2"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "20"))                 # seconds before a queued request gives up
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is not admitted; status is the HTTP status to answer with."""
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, user, loop=None):
+        self.user = user
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self._loop = loop
+        self._event = None if loop else threading.Event()
+        self._future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self._loop:
+            self._loop.call_soon_threadsafe(self._set_future)
+        else:
+            self._event.set()
+
+    def _set_future(self):
+        if not self._future.done():
+            self._future.set_result(None)
+
+
+class Ticket:
+    """An admitted request's slot. release() is idempotent."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(time.monotonic() - self._started)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Caps concurrent LLM-backed requests at max_in_flight. Extra requests wait in
+    a bounded queue that is served round-robin across users, so one user's burst
+    cannot starve everybody else. Requests are rejected straight away (503) when
+    the queue is full, (429) when their user already has max_queue_per_user
+    waiting, and (503) when they wait longer than max_wait.
+    Works from threads (acquire) and from asyncio (aacquire).
+    """
+
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, max_queue=ADMISSION_MAX_QUEUE,
+                 max_queue_per_user=ADMISSION_MAX_QUEUE_PER_USER, max_wait=ADMISSION_MAX_WAIT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queues = OrderedDict()   # user -> deque of waiters, in round-robin order
+        self._queued = 0
+        self._avg_service = 5.0        # seconds, moving average of how long a slot is held
+        self._waits = deque(maxlen=500)
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0,
+                       "rejected_user_limit": 0, "timed_out": 0}
+
+    # ---------------------------
+    # Acquire / release
+    # ---------------------------
+    def acquire(self, user):
+        """Block until a slot is free; returns a Ticket or raises AdmissionRejected."""
+        waiter = self._enqueue(user)
+        if waiter is None:
+            return Ticket(self)
+        if waiter._event.wait(self.max_wait) or not self._abandon(waiter):
+            return self._admitted(waiter)
+        raise self._timeout()
+
+    async def aacquire(self, user):
+        """Async acquire: waits without holding a thread."""
+        waiter = self._enqueue(user, asyncio.get_running_loop())
+        if waiter is None:
+            return Ticket(self)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter._future), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                raise self._timeout()
+        except asyncio.CancelledError:
+            # Client went away; hand back a slot granted in the meantime
+            if not self._abandon(waiter, timed_out=False):
+                self._release(None)
+            raise
+        return self._admitted(waiter)
+
+    def _enqueue(self, user, loop=None):
+        """Take a free slot (returns None) or queue a waiter; raise if the queue is full."""
+        with self._lock:
+            if self._in_flight < self.max_in_flight and not self._queued:
+                self._in_flight += 1
+                self._stats["admitted"] += 1
+                self._waits.append(0.0)
+                return None
+            if self._queued >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                logging.warning("Admission queue full (%d waiting), rejecting request", self._queued)
+                raise AdmissionRejected("Server is busy, please retry shortly", 503, self._retry_after_locked())
+            queue = self._queues.get(user)
+            if queue is not None and len(queue) >= self.max_queue_per_user:
+                self._stats["rejected_user_limit"] += 1
+                raise AdmissionRejected("Too many requests in progress for this user", 429,
+                                        self._retry_after_locked())
+            waiter = _Waiter(user, loop)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._queued += 1
+            self._stats["queued"] += 1
+            return waiter
+
+    def _abandon(self, waiter, timed_out=True):
+        """Remove a waiter that gave up; False if it was granted a slot in the meantime."""
+        with self._lock:
+            if waiter.granted:
+                return False
+            queue = self._queues.get(waiter.user)
+            if queue is not None and waiter in queue:
+                queue.remove(waiter)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[waiter.user]
+            if timed_out:
+                self._stats["timed_out"] += 1
+            return True
+
+    def _admitted(self, waiter):
+        with self._lock:
+            self._waits.append(time.monotonic() - waiter.enqueued_at)
+        return Ticket(self)
+
+    def _timeout(self):
+        with self._lock:
+            retry_after = self._retry_after_locked()
+        return AdmissionRejected("Timed out waiting for a free slot, please retry shortly", 503, retry_after)
+
+    def _release(self, held_for):
+        with self._lock:
+            if held_for is not None:
+                self._avg_service = 0.9 * self._avg_service + 0.1 * held_for
+            if not self._queues:
+                self._in_flight -= 1
+                return
+            # Hand the slot straight to the next user in round-robin order
+            user, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            self._queued -= 1
+            del self._queues[user]
+            if queue:
+                self._queues[user] = queue   # back of the line
+            self._stats["admitted"] += 1
+            waiter.grant()
+
+    def _retry_after_locked(self):
+        """Rough seconds until a new request could be served, for the Retry-After header."""
+        return max(1, math.ceil(self._avg_service * (self._queued + 1) / self.max_in_flight))
+
+    # ---------------------------
+    # Metrics
+    # ---------------------------
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self._in_flight,
+                "queue_depth": self._queued,
+                "queued_users": len(self._queues),
+                "avg_service_s": round(self._avg_service, 3),
+            })
+            waits = sorted(self._waits)
+        if waits:
+            data["wait_ms"] = {
+                "avg": sum(waits) / len(waits) * 1000,
+                "p95": waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000,
+                "max": waits[-1] * 1000,
+            }
+        return data
+
+
+admission = AdmissionController()
+
+
+def user_key(session, fallback=None):
+    """Fairness key for a request: the signed-in user, else the chat session, else fallback."""
+    return str(session.get("user_id") or session.get("session_id") or fallback or "anonymous")
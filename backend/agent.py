@@ -1,15 +1,27 @@
+import time
+import asyncio
+import functools
 import logging
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, AIMessageChunk
 from langgraph.graph import StateGraph, START, END, MessagesState
 from langgraph.prebuilt import create_react_agent
+from langchain_openai import ChatOpenAI
 from langchain_core.runnables.config import RunnableConfig
 
 from qna_data import PREDEFINED_QAS
 from tavily_agent import internet_agent_executor
+from catalogue_index import catalogue_search_tool
 from langgraph_swarm import create_handoff_tool
-from chat_history import get_psycopg_connection, SimplePostgresChatMessageHistory
-from psycopg2.extras import RealDictCursor
+from context_builder import build_context
+from session_summary import get_summary, unsummarized_messages, with_summary, schedule_summary_update
+from semantic_cache import answer_cache, is_cacheable
+from router import route_question, predefined_node, refusal_node, record_route_latency
+from deadlines import (
+    CHAT_DEADLINE, LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, DEADLINE_NOTICE, DEADLINE_REPLY, Deadline,
+    DeadlineExceeded, DeadlineGuard, hedged, iterate_with_deadline, aiterate_with_deadline,
+)
+from db import run_db
 # Load env vars
 load_dotenv()
 
@@ -18,48 +30,240 @@ assign_to_internet = create_handoff_tool(agent_name="internet_agent")
 
 # Supervisor agent
 supervisor_agent = create_react_agent(
-    model="openai:gpt-4.1",
-    tools=[assign_to_internet],
+    model=hedged(ChatOpenAI(model="gpt-4.1", timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES)),
+    tools=[t for t in [assign_to_internet, catalogue_search_tool] if t is not None],
     prompt=(
         "You are Malaysia's Supervisor AI Agent. Always begin with a friendly greeting. "
         "Only answer questions strictly related to studying in Malaysia, student life, or Malaysian culture in a study context. "
         "When responding, prefer concise, well-structured formatting: use bold headings, bullet points, and short paragraphs. "
         "If a user asks for CURRENT or REAL-TIME information (e.g., 'today', 'current', 'latest', 'weather', 'deadline', 'intake', 'ranking this year'), you MUST hand off to the Internet Research Agent. "
         "If you hand off to the Internet Research Agent, summarize results clearly and keep the same formatting. "
-        "TOOL: Internet Research Agent: Conducts latest web-based searches to gather responses."
+        "TOOL: Internet Research Agent: Conducts latest web-based searches to gather responses. "
+        "TOOL: catalogue_search: Instant search of our Malaysian university catalogue (universities, locations, programs, "
+        "scholarships, admissions, requirements, visa and insurance). Use it for questions about specific universities, "
+        "programs or scholarships before handing off, and base the answer on its results when they fit."
     ),
     name="supervisor",
 )
 
-# Build LangGraph
-MAX_DEPTH = 10
+# Build LangGraph: a local router sends clear-cut questions past the supervisor
+RECURSION_LIMIT = 10
 supervisor = (
     StateGraph(MessagesState)
+    .add_node("predefined", predefined_node)
+    .add_node("refusal", refusal_node)
     .add_node("supervisor", supervisor_agent)
     .add_node("internet_agent", internet_agent_executor)
-    .add_edge(START, "supervisor")
+    .add_conditional_edges(START, route_question, ["predefined", "refusal", "supervisor", "internet_agent"])
+    .add_edge("predefined", END)
+    .add_edge("refusal", END)
     .add_edge("internet_agent", END)
     .compile()
 )
 
-# Core function (this is what Flask will call)
-def run_supervisor(input_text, history):
-    history.add_user_message(input_text)
-    messages = history.messages[-MAX_DEPTH:]
-    input_state = MessagesState(messages=messages)
-    config = RunnableConfig(recursion_limit=MAX_DEPTH)
+NO_CONTENT_REPLY = "📡 No content returned."
+# Nodes whose last message is the reply, in order of preference
+REPLY_NODES = ["supervisor", "internet_agent", "predefined", "refusal"]
+LLM_NODES = ("supervisor", "internet_agent")
+
+
+def _top_level_node(namespace):
+    # Subgraph namespaces look like ("internet_agent:<task id>", ...)
+    return namespace[0].split(":")[0] if namespace else None
+
+
+class _Run:
+    """State of one supervisor run, shared by the sync and async streamers."""
+
+    def __init__(self, input_text, history):
+        self.input_text = input_text
+        self.history = history
+        self.started = None
+        self.last_output = None
+        self.current_node = None
+        self.first_node = None
+        self.partial = ""
+        self.question_vector = None
+        self.answer_to_cache = None
+
+    def prepare(self):
+        """Save the question and build the graph input (blocking: database only)."""
+        self.history.add_user_message(self.input_text)
+        self.context = build_context(self.history)
+        summary = get_summary(self.history.session_id)
+        unsummarized = unsummarized_messages(self.history, summary, self.context.start_time)
+        self.input_state = MessagesState(messages=with_summary(self.context.messages, summary, unsummarized))
+        # Answer repeated (or paraphrased) standalone questions from the semantic cache
+        self.cacheable = answer_cache is not None and is_cacheable(
+            self.input_text, has_history=len(self.context.messages) > 1
+        )
+        self.started = time.perf_counter()
+
+    def lookup_cached(self):
+        """The semantic cache's answer, or None (blocking: may call the embeddings API)."""
+        if not self.cacheable:
+            return None
+        cached, self.question_vector = answer_cache.lookup_with_vector(self.input_text)
+        return cached
+
+    def events(self, namespace, mode, chunk):
+        """Translate one (namespace, mode, chunk) item of the graph stream into API events."""
+        if mode == "updates":
+            if namespace:
+                return
+            self.last_output = chunk
+            node = next(iter(chunk), None)
+        else:
+            node = _top_level_node(namespace)
+
+        if node and node != self.current_node:
+            if self.current_node is not None:
+                yield {"event": "handoff", "from": self.current_node, "to": node}
+            self.current_node = node
+            self.first_node = self.first_node or node
+            self.partial = ""
+            yield {"event": "node", "node": node}
+        if mode == "updates":
+            return
+
+        message, _metadata = chunk
+        if not isinstance(message, AIMessageChunk):
+            return
+        for tool_chunk in message.tool_call_chunks or []:
+            if tool_chunk.get("name"):
+                yield {"event": "tool_call", "node": node, "name": tool_chunk["name"]}
+        if isinstance(message.content, str) and message.content:
+            self.partial += message.content
+            yield {"event": "token", "node": node, "delta": message.content}
+
+    def _save(self, reply):
+        self.history.add_ai_message(reply)
+        schedule_summary_update(self.history, self.context.start_time)
+
+    def finish_cached(self, reply):
+        self._save(reply)
+        record_route_latency("cache", time.perf_counter() - self.started)
+        return {"event": "final", "node": "cache", "reply": reply}
+
+    def finish(self):
+        """Persist the reply and return the final event (blocking: database only)."""
+        record_route_latency(self.first_node or "none", time.perf_counter() - self.started)
+        for source in REPLY_NODES:
+            if self.last_output and source in self.last_output:
+                for msg in reversed(self.last_output[source].get("messages", [])):
+                    if hasattr(msg, "content") and msg.content:
+                        self._save(msg.content)
+                        if self.cacheable and source in LLM_NODES:
+                            self.answer_to_cache = msg.content
+                        return {"event": "final", "node": source, "reply": msg.content}
+        return {"event": "final", "node": None, "reply": NO_CONTENT_REPLY}
+
+    def cache_answer(self):
+        """Store finish()'s reply in the semantic cache (blocking: may call the embeddings API)."""
+        if self.answer_to_cache is not None:
+            answer_cache.store(self.input_text, self.answer_to_cache, vector=self.question_vector)
 
+    def finish_partial(self, deadline_seconds):
+        """Persist whatever was streamed before the deadline and return the final event (blocking)."""
+        logging.warning("Supervisor hit its %.0fs deadline in node %s", deadline_seconds, self.current_node)
+        record_route_latency(self.first_node or "none", time.perf_counter() - self.started)
+        reply = f"{self.partial}\n\n{DEADLINE_NOTICE}" if self.partial.strip() else DEADLINE_REPLY
+        self._save(reply)
+        return {"event": "final", "node": self.current_node, "reply": reply, "partial": True}
+
+
+# Streaming core (used by /api/chat/stream and run_supervisor)
+def stream_supervisor(input_text, history, deadline_seconds=CHAT_DEADLINE):
+    """
+    Run the supervisor graph and yield events as they happen:
+    start, node, handoff, tool_call, token (text deltas), then final or error.
+    The final reply is persisted to history before the final event is yielded.
+    If the graph runs past deadline_seconds, the text streamed so far (or an
+    apology) is returned as a final event with partial=True.
+    """
+    run = _Run(input_text, history)
+    run.prepare()
+    cached = run.lookup_cached()
+    yield {"event": "start", "context_tokens": run.context.token_count}
+    if cached is not None:
+        yield run.finish_cached(cached)
+        return
+
+    deadline = Deadline(deadline_seconds)
+    # The graph runs on a producer thread; the guard stops its LLM and tool calls once the deadline passes
+    config = RunnableConfig(recursion_limit=RECURSION_LIMIT, callbacks=[DeadlineGuard(deadline)])
+    try:
+        for namespace, mode, chunk in iterate_with_deadline(
+            lambda: supervisor.stream(run.input_state, config=config, stream_mode=["updates", "messages"], subgraphs=True),
+            deadline,
+        ):
+            yield from run.events(namespace, mode, chunk)
+    except DeadlineExceeded:
+        yield run.finish_partial(deadline_seconds)
+        return
+    except Exception as e:
+        logging.exception("Error running supervisor")
+        yield {"event": "error", "reply": f"❌ Unexpected error: {e}"}
+        return
+    final = run.finish()
+    run.cache_answer()
+    yield final
+
+
+async def astream_supervisor(input_text, history, deadline_seconds=CHAT_DEADLINE):
+    """
+    Async version of stream_supervisor (same events) built on supervisor.astream,
+    so a waiting chat holds no thread. Blocking DB work runs via db.run_db; cache
+    lookups (embedding calls) run on the default executor, so slow embeddings
+    never hold the threads sized to the connection pool.
+    """
+    run = _Run(input_text, history)
+    await run_db(run.prepare)
+    cached = await _run_blocking(run.lookup_cached)
+    yield {"event": "start", "context_tokens": run.context.token_count}
+    if cached is not None:
+        yield await run_db(run.finish_cached, cached)
+        return
+
+    config = RunnableConfig(recursion_limit=RECURSION_LIMIT)
+    deadline = Deadline(deadline_seconds)
     try:
-        for output in supervisor.stream(input_state, config=config):
-            last_output = output
+        async for namespace, mode, chunk in aiterate_with_deadline(
+            lambda: supervisor.astream(run.input_state, config=config, stream_mode=["updates", "messages"], subgraphs=True),
+            deadline,
+        ):
+            for event in run.events(namespace, mode, chunk):
+                yield event
+    except DeadlineExceeded:
+        yield await run_db(run.finish_partial, deadline_seconds)
+        return
     except Exception as e:
         logging.exception("Error running supervisor")
-        return f"❌ Unexpected error: {e}"
-
-    for source in ["supervisor", "internet_agent"]:
-        if source in last_output:
-            for msg in reversed(last_output[source].get("messages", [])):
-                if hasattr(msg, "content") and msg.content:
-                    history.add_ai_message(msg.content)
-                    return msg.content
-    return "📡 No content returned."
+        yield {"event": "error", "reply": f"❌ Unexpected error: {e}"}
+        return
+    final = await run_db(run.finish)
+    await _run_blocking(run.cache_answer)
+    yield final
+
+
+async def _run_blocking(fn, *args):
+    """Await a blocking call that is not database work on the event loop's default executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args))
+
+
+# Core function (this is what Flask will call)
+def run_supervisor(input_text, history):
+    reply = NO_CONTENT_REPLY
+    for event in stream_supervisor(input_text, history):
+        if event["event"] in ("final", "error"):
+            reply = event["reply"]
+    return reply
+
+
+async def arun_supervisor(input_text, history):
+    reply = NO_CONTENT_REPLY
+    async for event in astream_supervisor(input_text, history):
+        if event["event"] in ("final", "error"):
+            reply = event["reply"]
+    return reply
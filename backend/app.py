@@ -1,16 +1,26 @@
 # app.py
-from flask import Flask, request, session, jsonify
+from flask import Flask, Response, request, session, jsonify, stream_with_context
 from flask_cors import CORS
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from dotenv import load_dotenv
 import os
 import logging
 
 # Import your agent logic
-from chat_history import get_chat_history, get_user_chat_sessions, get_session_messages_by_id, verify_session_ownership,create_new_chat_session
-from agent import run_supervisor
-from qna_data import PREDEFINED_QAS
-from chat_history import get_user_chat_sessions
+from chat_history import get_chat_history, get_user_chat_sessions_page, get_session_messages_page, verify_session_ownership,create_new_chat_session, bind_chat_session, session_cache_stats
+from agent import NO_CONTENT_REPLY
+from chat_turns import start_turn, rejection, sse
+from db import get_engine, is_configured, pool_stats
+from semantic_cache import answer_cache
+from router import route_stats
+from tavily_agent import cached_search
+from sql_cache import shared_cache_stats
+from catalogue_index import catalogue_index
+from search_compression import compression_stats
+from admission import admission, AdmissionRejected
+from request_dedup import chat_dedup
+from write_behind import writer_stats
+from migrations import migrate_on_startup
 
 # Load env vars
 load_dotenv()
@@ -19,18 +29,19 @@ app = Flask(__name__)
 app.secret_key = os.getenv("FLASK_SECRET_KEY", "super-secret-key")  # required for session
 
 # Enable CORS with credentials so browser cookies (Flask session) work
-CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}})
-
-# Database connection
-DATABASE_URL = (
-    os.getenv("NEON_API_URL")
-    or os.getenv("DATABASE_URL")
-    or os.getenv("POSTGRES_URL")
-)
-if not DATABASE_URL:
+CORS(app, supports_credentials=True, resources={r"/api/*": {"origins": "*"}}, expose_headers=["X-Next-Cursor"])
+
+# Database connection (shared pool, see db.py)
+if not is_configured():
     raise RuntimeError("Database URL not found. Set NEON_API_URL or DATABASE_URL in your environment.")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+engine = get_engine()
+
+# Chat table migrations run once here, before the first request (see migrations.py)
+migrate_on_startup()
+# Builds the catalogue index in the background so the first search finds it ready
+if catalogue_index is not None:
+    catalogue_index.warm_up()
 
 
 # ---------------------------
@@ -39,60 +50,77 @@ engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 @app.route("/api/chat", methods=["POST"])
 def chat():
     user_message = request.json.get("message")
-    token = request.json.get("token")
-    user_id = session.get("user_id")
-
-    # If a token is provided (format username-userId), bind backend session to that user
-    if token and not user_id:
-        try:
-            parts = str(token).split("-")
-            if len(parts) >= 2:
-                session["user_id"] = parts[-1]
-                user_id = session["user_id"]
-        except Exception:
-            pass
-
-    if "session_id" not in session:
-        session["session_id"] = os.urandom(8).hex()
-    session_id = session["session_id"]
+    bind_chat_session(session, request.json.get("token"))
 
     try:
-        # Check if this is a category button click
-        if user_message.startswith("I'm interested in "):
-            category = user_message.replace("I'm interested in ", "").strip()
-            # Map category names to predefined Q&A
-            category_mapping = {
-                "popular-majors": "What are the most popular majors in Malaysia?",
-                "malaysia-visa-requirements": "How do I apply for a student visa in Malaysia?",
-                "scholarship-options": "What are the scholarship opportunities for international students?",
-                "top-malaysian-universities": "What are the top universities in Malaysia?",
-                "international-student-guide": "What is the cost of living for a student in Malaysia?"
-            }
-            
-            if category in category_mapping:
-                question = category_mapping[category]
-                if question in PREDEFINED_QAS:
-                    # Save both user and AI message to DB
-                    history, user_id, session_id = get_chat_history(
-                        session.get("user_id"), session.get("session_id")
-                    )
-                    
-                    history.add_ai_message(PREDEFINED_QAS[question])
-                    return jsonify({"reply": PREDEFINED_QAS[question]})
-
         # Load history from DB
         history, user_id, session_id = get_chat_history(
             session.get("user_id"), session.get("session_id")
         )
-        # Run AI (run_supervisor handles saving both user and AI messages)
-        assistant_reply = run_supervisor(user_message, history)
-        
-        return jsonify({"reply": assistant_reply,"session_id": session_id})
+        events, done = start_turn(session, user_message, history)
+        final = {"reply": NO_CONTENT_REPLY}
+        try:
+            for event in events:
+                if event["event"] in ("final", "error"):
+                    final = event
+        finally:
+            done()
+
+        if final.get("node") == "predefined":
+            return jsonify({"reply": final["reply"]})
+        return jsonify({"reply": final["reply"], "session_id": session_id})
+    except AdmissionRejected as e:
+        return _rejected(e)
     except Exception as e:
         logging.exception("Error in /api/chat")
         return jsonify({"error": str(e)}), 500
 
 
+def _rejected(e):
+    """429/503 response with Retry-After for a request the admission controller turned away."""
+    body, status, headers = rejection(e)
+    response = jsonify(body)
+    response.status_code = status
+    response.headers.update(headers)
+    return response
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """Same as /api/chat, but streams node events and token deltas as server-sent events."""
+    user_message = request.json.get("message")
+    bind_chat_session(session, request.json.get("token"))
+    history, user_id, session_id = get_chat_history(
+        session.get("user_id"), session.get("session_id")
+    )
+
+    # Admit before the response starts, so a rejection can still be a 429/503
+    try:
+        events, done = start_turn(session, user_message, history)
+    except AdmissionRejected as e:
+        return _rejected(e)
+
+    def generate():
+        try:
+            yield sse({"event": "session", "session_id": session_id})
+            for event in events:
+                yield sse(event)
+        except Exception as e:
+            logging.exception("Error in /api/chat/stream")
+            yield sse({"event": "error", "reply": f"❌ Unexpected error: {e}"})
+        finally:
+            done()
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # Also clean up if the client disconnects before the stream starts
+    response.call_on_close(done)
+    return response
+
+
 # ---------------------------
 # Auth Endpoints
 # ---------------------------
@@ -150,6 +178,39 @@ def health():
     return {"status": "ok"}
 
 
+@app.route("/api/metrics/db", methods=["GET"])
+def db_metrics():
+    return jsonify(pool_stats())
+
+
+@app.route("/api/metrics/writes", methods=["GET"])
+def write_metrics():
+    return jsonify(writer_stats())
+
+
+@app.route("/api/metrics/routes", methods=["GET"])
+def route_metrics():
+    return jsonify(route_stats())
+
+
+@app.route("/api/metrics/admission", methods=["GET"])
+def admission_metrics():
+    return jsonify(admission.stats())
+
+
+@app.route("/api/metrics/cache", methods=["GET"])
+def cache_metrics():
+    return jsonify({
+        "answers": answer_cache.stats() if answer_cache else None,
+        "search": cached_search.stats() if cached_search else None,
+        "search_compression": compression_stats(),
+        "chat_dedup": chat_dedup.stats(),
+        "chat_sessions": session_cache_stats(),
+        "sql": shared_cache_stats(),
+        "catalogue_index": catalogue_index.stats() if catalogue_index else None,
+    })
+
+
 # ---------------------------
 # Sessions for sidebar
 # ---------------------------
@@ -164,12 +225,15 @@ def new_chat_session():
     session["session_id"] = session_id
     return jsonify({"session_id": session_id})
 
-#lists all chat sessions for the authenticated user
+#lists the authenticated user's chat sessions, newest first; all of them unless paged
+#with ?limit=&cursor= (the next page's cursor is in the X-Next-Cursor header)
 @app.route("/api/chat/sessions", methods=["GET"])
 def list_sessions():
     try:
         user_id = session.get("user_id")
-        sessions = get_user_chat_sessions(user_id)
+        sessions, next_cursor = get_user_chat_sessions_page(
+            user_id, request.args.get("limit"), request.args.get("cursor")
+        )
         data = [
             {
                 "id": s["session_id"],
@@ -178,12 +242,17 @@ def list_sessions():
             }
             for s in sessions
         ]
-        return jsonify(data)
+        response = jsonify(data)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return response
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.exception("Error in /api/chat/sessions")
         return jsonify({"error": str(e)}), 500
 
-#get all messages for a specific session
+#get the messages of a specific session; with ?limit=&cursor= one page (newest first; next_cursor pages back in time)
 @app.route("/api/chat/session/<session_id>/messages", methods=["GET"])
 def get_session_messages(session_id):
     try:
@@ -193,8 +262,12 @@ def get_session_messages(session_id):
 
 
         # Get messages for the specific session
-        messages = get_session_messages_by_id(user_id, session_id)
-        return jsonify({"messages": messages, "session_id": session_id})
+        messages, next_cursor = get_session_messages_page(
+            user_id, session_id, request.args.get("limit"), request.args.get("cursor")
+        )
+        return jsonify({"messages": messages, "session_id": session_id, "next_cursor": next_cursor})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         logging.exception("Error in /api/chat/session/<session_id>/messages")
         return jsonify({"error": str(e)}), 500
@@ -0,0 +1,315 @@
+# asgi_app.py
+# Async serving mode: the same /api/* routes as app.py on FastAPI, for uvicorn/gunicorn
+# with UvicornWorker. Chats run on supervisor.astream, so a waiting chat costs a
+# coroutine instead of a worker thread; blocking psycopg2 calls go through db.run_db.
+from fastapi import FastAPI, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.middleware.sessions import SessionMiddleware
+from sqlalchemy import text
+from dotenv import load_dotenv
+import os
+import logging
+from typing import Optional
+
+from chat_history import (
+    get_chat_history, get_user_chat_sessions_page, get_session_messages_page, verify_session_ownership,
+    create_new_chat_session, bind_chat_session, session_cache_stats,
+)
+from agent import NO_CONTENT_REPLY
+from chat_turns import astart_turn, rejection, sse
+from db import get_engine, is_configured, pool_stats, run_db
+from semantic_cache import answer_cache
+from router import route_stats
+from tavily_agent import cached_search
+from sql_cache import shared_cache_stats
+from catalogue_index import catalogue_index
+from search_compression import compression_stats
+from admission import admission, AdmissionRejected
+from request_dedup import chat_dedup
+from write_behind import writer_stats
+from migrations import migrate_on_startup
+
+# Load env vars
+load_dotenv()
+
+app = FastAPI()
+
+# Signed-cookie session, like Flask's (same secret, but the cookie formats differ,
+# so a client switching between app.py and asgi_app.py has to sign in again)
+app.add_middleware(SessionMiddleware, secret_key=os.getenv("FLASK_SECRET_KEY", "super-secret-key"))
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=["X-Next-Cursor"])
+
+# Database connection (shared pool, see db.py)
+if not is_configured():
+    raise RuntimeError("Database URL not found. Set NEON_API_URL or DATABASE_URL in your environment.")
+
+engine = get_engine()
+
+# Chat table migrations run once here, before the first request (see migrations.py)
+migrate_on_startup()
+# Builds the catalogue index in the background so the first search finds it ready
+if catalogue_index is not None:
+    catalogue_index.warm_up()
+
+
+def _error(message, status_code):
+    return JSONResponse({"error": message}, status_code=status_code)
+
+
+def _rejected(e):
+    """429/503 response with Retry-After for a request the admission controller turned away."""
+    body, status, headers = rejection(e)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+
+# ---------------------------
+# Chat Endpoint
+# ---------------------------
+@app.post("/api/chat")
+async def chat(request: Request):
+    body = await request.json()
+    user_message = body.get("message")
+    bind_chat_session(request.session, body.get("token"))
+
+    try:
+        history, user_id, session_id = await run_db(
+            get_chat_history, request.session.get("user_id"), request.session.get("session_id")
+        )
+        events, done = await astart_turn(request.session, user_message, history)
+        final = {"reply": NO_CONTENT_REPLY}
+        try:
+            async for event in events:
+                if event["event"] in ("final", "error"):
+                    final = event
+        finally:
+            await done()
+
+        if final.get("node") == "predefined":
+            return {"reply": final["reply"]}
+        return {"reply": final["reply"], "session_id": session_id}
+    except AdmissionRejected as e:
+        return _rejected(e)
+    except Exception as e:
+        logging.exception("Error in /api/chat")
+        return _error(str(e), 500)
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: Request):
+    """Same as /api/chat, but streams node events and token deltas as server-sent events."""
+    body = await request.json()
+    user_message = body.get("message")
+    bind_chat_session(request.session, body.get("token"))
+    history, user_id, session_id = await run_db(
+        get_chat_history, request.session.get("user_id"), request.session.get("session_id")
+    )
+
+    # Admit before the response starts, so a rejection can still be a 429/503
+    try:
+        events, done = await astart_turn(request.session, user_message, history)
+    except AdmissionRejected as e:
+        return _rejected(e)
+
+    async def generate():
+        try:
+            yield sse({"event": "session", "session_id": session_id})
+            async for event in events:
+                yield sse(event)
+        except Exception as e:
+            logging.exception("Error in /api/chat/stream")
+            yield sse({"event": "error", "reply": f"❌ Unexpected error: {e}"})
+        finally:
+            await done()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also clean up if the stream never runs
+        background=BackgroundTask(done),
+    )
+
+
+# ---------------------------
+# Auth Endpoints
+# ---------------------------
+def _signup(data):
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                """
+                INSERT INTO aisupersearch_signup (institute, studying, username, contact_number, email)
+                VALUES (:institute, :studying, :username, :contact_number, :email)
+                ON CONFLICT (email) DO NOTHING
+                RETURNING user_id
+                """
+            ),
+            data,
+        ).fetchone()
+    return row
+
+
+def _signin(email):
+    with engine.begin() as conn:
+        return conn.execute(
+            text("SELECT user_id, username FROM aisupersearch_signup WHERE email = :email"),
+            {"email": email},
+        ).fetchone()
+
+
+@app.post("/api/auth/signup")
+async def signup(request: Request):
+    data = await request.json()
+    try:
+        row = await run_db(_signup, data)
+        if not row:
+            return JSONResponse({"ok": False, "error": "Email already exists"}, status_code=409)
+        return {"ok": True, "user_id": row[0]}
+    except Exception as e:
+        logging.exception("Error in /api/auth/signup")
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+
+@app.post("/api/auth/signin")
+async def signin(request: Request):
+    data = await request.json()
+    try:
+        row = await run_db(_signin, data["email"])
+        if not row:
+            return JSONResponse({"ok": False, "error": "Email not found"}, status_code=404)
+
+        # store in session for chat
+        request.session["user_id"] = row[0]
+
+        return {"ok": True, "user_id": row[0], "username": row[1]}
+    except Exception as e:
+        logging.exception("Error in /api/auth/signin")
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+
+# ---------------------------
+# Healthcheck
+# ---------------------------
+@app.get("/api/health")
+async def health():
+    return {"status": "ok"}
+
+
+@app.get("/api/metrics/db")
+async def db_metrics():
+    return pool_stats()
+
+
+@app.get("/api/metrics/writes")
+async def write_metrics():
+    return writer_stats()
+
+
+@app.get("/api/metrics/routes")
+async def route_metrics():
+    return route_stats()
+
+
+@app.get("/api/metrics/admission")
+async def admission_metrics():
+    return admission.stats()
+
+
+@app.get("/api/metrics/cache")
+async def cache_metrics():
+    return {
+        "answers": answer_cache.stats() if answer_cache else None,
+        "search": cached_search.stats() if cached_search else None,
+        "search_compression": compression_stats(),
+        "chat_dedup": chat_dedup.stats(),
+        "chat_sessions": session_cache_stats(),
+        "sql": shared_cache_stats(),
+        "catalogue_index": catalogue_index.stats() if catalogue_index else None,
+    }
+
+
+# ---------------------------
+# Sessions for sidebar
+# ---------------------------
+#creates a new chat session and returns the session_id
+@app.post("/api/chat/new_session")
+async def new_chat_session(request: Request):
+    user_id = request.session.get("user_id")
+    if not user_id:
+        return _error("User not authenticated", 401)
+
+    session_id = await run_db(create_new_chat_session, user_id)
+    request.session["session_id"] = session_id
+    return {"session_id": session_id}
+
+
+#lists the authenticated user's chat sessions, newest first; all of them unless paged
+#with ?limit=&cursor= (the next page's cursor is in the X-Next-Cursor header)
+@app.get("/api/chat/sessions")
+async def list_sessions(request: Request, limit: Optional[int] = None, cursor: Optional[str] = None):
+    try:
+        user_id = request.session.get("user_id")
+        sessions, next_cursor = await run_db(get_user_chat_sessions_page, user_id, limit, cursor)
+        data = [
+            {
+                "id": s["session_id"],
+                "title": s["title"] or "(No title)",
+                "first_time": s["first_time"].isoformat() if s["first_time"] else None,
+            }
+            for s in sessions
+        ]
+        return JSONResponse(data, headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+    except ValueError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        logging.exception("Error in /api/chat/sessions")
+        return _error(str(e), 500)
+
+
+#get the messages of a specific session; with ?limit=&cursor= one page (newest first; next_cursor pages back in time)
+@app.get("/api/chat/session/{session_id}/messages")
+async def get_session_messages(session_id: str, request: Request, limit: Optional[int] = None,
+                               cursor: Optional[str] = None):
+    try:
+        user_id = request.session.get("user_id")
+        if not user_id:
+            return _error("User not authenticated", 401)
+
+        messages, next_cursor = await run_db(get_session_messages_page, user_id, session_id, limit, cursor)
+        return {"messages": messages, "session_id": session_id, "next_cursor": next_cursor}
+    except ValueError as e:
+        return _error(str(e), 400)
+    except Exception as e:
+        logging.exception("Error in /api/chat/session/<session_id>/messages")
+        return _error(str(e), 500)
+
+
+#switch to a specific session
+@app.post("/api/chat/session/{session_id}/switch")
+async def switch_session(session_id: str, request: Request):
+    try:
+        user_id = request.session.get("user_id")
+        if not user_id:
+            return _error("User not authenticated", 401)
+
+        # Verify the session belongs to the user
+        if not await run_db(verify_session_ownership, user_id, session_id):
+            return _error("Session not found or access denied", 404)
+
+        # Switch to the session
+        request.session["session_id"] = session_id
+        return {"session_id": session_id, "message": "Session switched successfully"}
+    except Exception as e:
+        logging.exception("Error in /api/chat/session/<session_id>/switch")
+        return _error(str(e), 500)
+
+
+# ---------------------------
+# Run
+# ---------------------------
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("asgi_app:app", host="0.0.0.0", port=5001)
@@ -0,0 +1,271 @@
+# catalogue_index.py
+# In-process BM25 index over the Malaysian university catalogue (the SQL agent's
+# tables): one document per university with its programs, scholarships,
+# admissions, requirements and ranking, plus the country-level visa and
+# insurance rows. Searches need no database round trip. The index is built on
+# first use (or by warm_up() at server startup), not at import; afterwards only
+# the tables that changed are reloaded and only the documents that changed are
+# re-indexed.
+import os
+import re
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from sqlalchemy import text
+from langchain_core.tools import StructuredTool
+
+from db import get_engine
+from text_index import BM25Index, tokenize
+from sql_schema import SQL_INCLUDE_TABLES, load_or_build_snapshot, primary_key, reference_column, table_columns
+from sql_cache import table_versions
+
+# Load environment variables
+load_dotenv()
+
+CATALOGUE_INDEX_ENABLED = os.getenv("CATALOGUE_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+CATALOGUE_INDEX_REFRESH = float(os.getenv("CATALOGUE_INDEX_REFRESH", "300"))  # seconds between table-change checks
+CATALOGUE_MAX_MATCHES = 5        # related rows shown per table in a search result
+CATALOGUE_MAX_VALUE_CHARS = 300
+CATALOGUE_INDEX_RETRY = 30       # seconds between build attempts while the first build keeps failing
+
+MALAYSIA_COUNTRY_ID = 14
+_NOT_TEXT = re.compile(r"^(https?://|www\.)|@", re.IGNORECASE)   # URLs and emails only add noise to the index
+
+
+def _is_key(column):
+    return re.search(r"(^id|_id|Id|ID)$", column) is not None
+
+
+def _text_values(row):
+    return [v for k, v in row.items() if isinstance(v, str) and not _is_key(k) and not _NOT_TEXT.search(v)]
+
+
+def _display(row):
+    """A row as shown to the agent: non-empty values, keys dropped, long text cut."""
+    shown = {}
+    for column, value in row.items():
+        if value is None or value == "" or _is_key(column):
+            continue
+        if isinstance(value, str) and len(value) > CATALOGUE_MAX_VALUE_CHARS:
+            value = value[:CATALOGUE_MAX_VALUE_CHARS] + "…"
+        shown[column] = value if isinstance(value, (str, int, float, bool)) else str(value)
+    return shown
+
+
+class CatalogueIndex:
+    """
+    BM25 index (text_index.BM25Index) over the catalogue tables. refresh()
+    reloads the tables whose versions (see sql_cache.table_versions) changed
+    and re-indexes only documents whose text changed. The first search builds
+    the index if warm_up() hasn't; later searches start a refresh in the
+    background at most every refresh_interval seconds. snapshot defaults to
+    sql_schema's, loaded on the first build.
+    """
+
+    def __init__(self, engine, snapshot=None, tables=SQL_INCLUDE_TABLES, refresh_interval=CATALOGUE_INDEX_REFRESH):
+        self.engine = engine
+        self.snapshot = snapshot
+        self.tables = list(tables)
+        self.refresh_interval = refresh_interval
+        self._index = BM25Index()
+        self._docs = {}                     # doc_id -> {"kind", "title", "row", "related", "related_terms", "text"}
+        self._lock = threading.Lock()       # guards _index and _docs
+        self._refreshing = threading.Lock() # guards everything below
+        self._rows = {}                     # table -> its rows as of _versions[table]
+        self._versions = {}
+        self._built = False
+        self._checked_at = None
+        self._stats = {"searches": 0, "search_ms": 0.0, "refreshes": 0, "tables_loaded": 0, "updated_docs": 0,
+                       "refresh_errors": 0}
+
+    # ---------------------------
+    # Building
+    # ---------------------------
+    def refresh(self, force=False):
+        """Re-index what changed since the last refresh; returns how many documents were updated."""
+        with self._refreshing:
+            return self._refresh(force)
+
+    def _refresh(self, force=False):
+        self._checked_at = time.monotonic()
+        if self.snapshot is None:
+            self.snapshot = load_or_build_snapshot(self.engine)
+            self.tables = [t for t in self.tables if t in self.snapshot["tables"]]
+        # Versions read before loading: a write during the load is picked up next time
+        versions = table_versions(self.engine, self.tables)
+        changed = [
+            t for t in self.tables
+            if force or t not in self._rows or versions.get(t) != self._versions.get(t)
+        ]
+        if not changed:
+            return 0
+        with self.engine.connect() as conn:
+            for table in changed:
+                self._rows[table] = [dict(r._mapping) for r in conn.execute(text(f'SELECT * FROM "{table}"'))]
+        docs = self._build_documents(self._rows)
+        updated = 0
+        with self._lock:
+            for doc_id in set(self._docs) - set(docs):
+                self._index.remove(doc_id)
+                updated += 1
+            for doc_id, doc in docs.items():
+                old = self._docs.get(doc_id)
+                if old is None or old["text"] != doc["text"]:
+                    self._index.add(doc_id, doc["text"])
+                    updated += 1
+            self._docs = docs
+            self._stats["refreshes"] += 1
+            self._stats["tables_loaded"] += len(changed)
+            self._stats["updated_docs"] += updated
+        self._versions = versions
+        self._built = True
+        logging.info("Catalogue index refreshed: %d tables reloaded, %d documents, %d updated",
+                     len(changed), len(docs), updated)
+        return updated
+
+    def _build_documents(self, rows):
+        """Documents from the loaded rows (in memory, no queries)."""
+        docs = {}
+        university_pk = primary_key(self.snapshot, "Universities")
+        universities = {}
+        for row in rows.get("Universities", []):
+            if row.get("countryID", MALAYSIA_COUNTRY_ID) != MALAYSIA_COUNTRY_ID or university_pk is None:
+                continue
+            universities[row[university_pk]] = {
+                "kind": "university", "title": row.get("name") or "", "row": row, "related": {},
+            }
+
+        for table in self.tables:
+            if table == "Universities":
+                continue
+            fk = reference_column(self.snapshot, table, "Universities")
+            if fk is not None:
+                for row in rows[table]:
+                    university = universities.get(row.get(fk))
+                    if university is not None:
+                        university["related"].setdefault(table, []).append(row)
+                continue
+            # Country-level tables (visa, insurance): one document per Malaysian row
+            pk = primary_key(self.snapshot, table)
+            has_country = "countryID" in table_columns(self.snapshot, table)
+            for i, row in enumerate(rows[table]):
+                if has_country and row.get("countryID") != MALAYSIA_COUNTRY_ID:
+                    continue
+                doc_id = f"{table}:{row[pk] if pk else i}"
+                docs[doc_id] = {"kind": table, "title": table, "row": row, "related": {}}
+
+        for university_id, doc in universities.items():
+            docs[f"Universities:{university_id}"] = doc
+        for doc in docs.values():
+            # The title repeats the name so it outweighs passing mentions in long descriptions
+            parts = [doc["title"]] + _text_values(doc["row"])
+            doc["related_terms"] = {}
+            for table, related in doc["related"].items():
+                values = [_text_values(row) for row in related]
+                doc["related_terms"][table] = [set(tokenize(" ".join(v))) for v in values]
+                for v in values:
+                    parts.extend(v)
+            doc["text"] = "\n".join(parts)
+        return docs
+
+    def warm_up(self):
+        """Start building the index in the background (e.g. at server startup)."""
+        self._maybe_refresh()
+
+    def _build_now(self):
+        """First search before any build finished: build (or wait for warm_up's build) now."""
+        with self._refreshing:
+            if self._built:
+                return
+            if self._checked_at is not None and time.monotonic() - self._checked_at < CATALOGUE_INDEX_RETRY:
+                return
+            try:
+                self._refresh()
+            except Exception as e:
+                logging.warning("Catalogue index build failed: %s", e)
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+
+    def _maybe_refresh(self):
+        interval = self.refresh_interval if self._built else CATALOGUE_INDEX_RETRY
+        if self._checked_at is not None and time.monotonic() - self._checked_at < interval:
+            return
+        if not self._refreshing.acquire(blocking=False):
+            return
+        self._checked_at = time.monotonic()
+
+        def run():
+            try:
+                self._refresh()
+            except Exception as e:
+                logging.warning("Catalogue index refresh failed: %s", e)
+                with self._lock:
+                    self._stats["refresh_errors"] += 1
+            finally:
+                self._refreshing.release()
+
+        threading.Thread(target=run, name="catalogue-index-refresh", daemon=True).start()
+
+    # ---------------------------
+    # Searching
+    # ---------------------------
+    def search(self, query, top_k=5):
+        """
+        Best matching catalogue entries for query, as dicts: the entry's own
+        fields plus, per related table, the rows that mention the query's words.
+        """
+        if self._built:
+            self._maybe_refresh()
+        else:
+            self._build_now()
+        started = time.perf_counter()
+        terms = set(tokenize(query))
+        with self._lock:
+            hits = self._index.search(query, top_k=top_k)
+            docs = [(self._docs[doc_id], score) for doc_id, score in hits]
+        results = []
+        for doc, score in docs:
+            result = {"type": doc["kind"], "score": round(score, 2), "details": _display(doc["row"])}
+            matches = {}
+            for table, related in doc["related"].items():
+                rows = [r for r, row_terms in zip(related, doc["related_terms"][table]) if terms & row_terms]
+                if rows:
+                    matches[table] = [_display(r) for r in rows[:CATALOGUE_MAX_MATCHES]]
+            if matches:
+                result["matches"] = matches
+            results.append(result)
+        with self._lock:
+            self._stats["searches"] += 1
+            self._stats["search_ms"] += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["documents"] = len(self._docs)
+        data["built"] = self._built
+        data["avg_search_ms"] = data.pop("search_ms") / data["searches"] if data["searches"] else 0.0
+        return data
+
+
+def make_catalogue_tool(index):
+    def catalogue_search(query: str, top_k: int = 5):
+        return index.search(query, top_k=top_k)
+
+    return StructuredTool.from_function(
+        func=catalogue_search,
+        name="catalogue_search",
+        description=(
+            "Full-text search over the local catalogue of Malaysian universities: names, descriptions, locations, "
+            "programs, scholarships, admissions, requirements and rankings, plus student visa and health insurance "
+            "information. Fast and needs no database query. Input is a keyword query such as "
+            "'Penang data science scholarship'; results list the matching universities with the programs, "
+            "scholarships, etc. that mention those words."
+        ),
+    )
+
+
+# No database work at import: the index is built by warm_up() or the first search
+catalogue_index = CatalogueIndex(get_engine()) if CATALOGUE_INDEX_ENABLED else None
+catalogue_search_tool = make_catalogue_tool(catalogue_index) if catalogue_index is not None else None
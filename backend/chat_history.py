@@ -1,55 +1,283 @@
 # chat_history.py
 import uuid
 import os
+import json
+import base64
+import threading
+from datetime import datetime
+from contextlib import contextmanager
 from dotenv import load_dotenv
-import psycopg2
-from psycopg2.extras import RealDictCursor
-from langchain_postgres import PostgresChatMessageHistory
+from psycopg2.extras import RealDictCursor, execute_values
 from langchain_core.messages import HumanMessage, AIMessage
 
+from db import get_pool
+from write_behind import get_writer
+from caching import TTLCache
+from migrations import SESSIONS_TABLE_NAME, ensure_tables
+
 # Load environment variables
 load_dotenv()
 
-POSTGRES_HOST = os.getenv("POSTGRES_HOST")
-POSTGRES_DB = os.getenv("POSTGRES_DB")
-POSTGRES_USER = os.getenv("POSTGRES_USER")
-POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
-POSTGRES_SSLMODE = os.getenv("POSTGRES_SSLMODE", "require")
 TABLE_NAME = os.getenv("TABLE_NAME", "chat_history")
+CHARS_PER_TOKEN = 4  # rough estimate used for token-bounded history windows
+SESSIONS_PAGE_SIZE = int(os.getenv("SESSIONS_PAGE_SIZE", "50"))
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 200
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))  # seconds; other workers' new sessions show up within this
+SESSION_CACHE_MAX_ENTRIES = int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000"))
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+_message_ids = None  # whether chat_history has the id column migrations.py adds; checked once per process
+
+
+def _ensure_schema():
+    """Make sure the chat tables exist, once per process; migrations run at startup (see migrations.py)."""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if not _schema_ready:
+            ensure_tables()
+            _schema_ready = True
+
 
+# Keeps chat_sessions in step with chat_history; {source} yields
+# (user_id, session_id, title, first_time, last_time, message_count) rows
+_SESSION_UPSERT = f"""
+    INSERT INTO {SESSIONS_TABLE_NAME} AS s (user_id, session_id, title, first_time, last_time, message_count)
+    {{source}}
+    ON CONFLICT (user_id, session_id) DO UPDATE SET
+        title = COALESCE(s.title, EXCLUDED.title),
+        first_time = LEAST(s.first_time, EXCLUDED.first_time),
+        last_time = GREATEST(s.last_time, EXCLUDED.last_time),
+        message_count = s.message_count + EXCLUDED.message_count
+"""
 
-def get_psycopg_connection():
-    return psycopg2.connect(
-        host=POSTGRES_HOST,
-        dbname=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PASSWORD,
-        sslmode=POSTGRES_SSLMODE
+
+def _update_sessions(cur, rows):
+    """Fold a batch of new chat_history rows into chat_sessions (write-behind path)."""
+    sessions = {}
+    for row in rows:
+        key = (row["user_id"], row["session_id"])
+        title = row["content"] if row["role"] == "user" else None
+        entry = sessions.get(key)
+        if entry is None:
+            sessions[key] = [title, row["created_at"], row["created_at"], 1]
+        else:
+            entry[0] = entry[0] or title
+            entry[1] = min(entry[1], row["created_at"])
+            entry[2] = max(entry[2], row["created_at"])
+            entry[3] += 1
+    execute_values(
+        cur,
+        _SESSION_UPSERT.format(source="VALUES %s"),
+        [(user_id, session_id, *entry) for (user_id, session_id), entry in sessions.items()],
+        page_size=len(sessions),
     )
 
 
+def _writer():
+    return get_writer(TABLE_NAME, on_batch=_update_sessions, on_commit=_note_written)
+
+
+def _has_message_ids(cur):
+    """
+    True if chat_history has its id column. Tables created before it existed get
+    it from `python migrations.py`; until then pages are keyed on created_at alone.
+    """
+    global _message_ids
+    if _message_ids is None:
+        cur.execute(
+            "SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) AND attname = 'id' AND NOT attisdropped",
+            (TABLE_NAME,),
+        )
+        _message_ids = cur.fetchone() is not None
+    return _message_ids
+
+
+# ---------------------------
+# Session caches
+# ---------------------------
+# (user_id, limit, cursor) -> session list page
+_session_lists = TTLCache(max_entries=SESSION_CACHE_MAX_ENTRIES, ttl=SESSION_CACHE_TTL)
+# (user_id, session_id) -> whether the session has a title yet; only owned sessions are cached
+_session_owners = TTLCache(max_entries=SESSION_CACHE_MAX_ENTRIES, ttl=SESSION_CACHE_TTL)
+# Bumped on every list invalidation, so a read that raced a write doesn't cache what it saw
+_lists_generation = 0
+
+
+def _note_written(rows):
+    """
+    Call once rows are committed. A user's cached session lists are dropped when
+    a row starts a session or gives it its title (what the sidebar shows);
+    later messages leave them alone.
+    """
+    stale_users = set()
+    for row in rows:
+        key = (row["user_id"], row["session_id"])
+        titled = _session_owners.get(key)
+        if titled is None or (row["role"] == "user" and not titled):
+            stale_users.add(row["user_id"])
+        _session_owners.set(key, bool(titled) or row["role"] == "user")
+    if stale_users:
+        global _lists_generation
+        _lists_generation += 1
+        _session_lists.delete_where(lambda k: k[0] in stale_users)
+
+
+def session_cache_stats():
+    return {"lists": _session_lists.stats(), "owners": _session_owners.stats()}
+
+
+def _merge_pending(rows, pending):
+    """Add buffered (not yet committed) rows to rows read from the table, ordered by created_at."""
+    if not pending:
+        return rows
+    # A batch committed between the two reads shows up in both
+    seen = {(r["created_at"], r["role"], r["content"]) for r in rows}
+    extra = [p for p in pending if (p["created_at"], p["role"], p["content"]) not in seen]
+    return sorted(list(rows) + extra, key=lambda r: r["created_at"])
+
+
+def _trim_window(rows, limit=None, max_tokens=None, max_message_tokens=None):
+    """Apply recent_rows' limit / token cap to rows (oldest first) in Python."""
+    kept = []
+    chars = 0
+    for row in reversed(rows):
+        length = len(row["content"])
+        chars += min(length, max_message_tokens * CHARS_PER_TOKEN) if max_message_tokens is not None else length
+        if kept and ((limit is not None and len(kept) >= limit)
+                     or (max_tokens is not None and chars > max_tokens * CHARS_PER_TOKEN)):
+            break
+        kept.append(row)
+    kept.reverse()
+    return kept
+
+
+def rows_to_messages(rows):
+    """LangChain messages for rows with role and content."""
+    msgs = []
+    for row in rows:
+        if row['role'] == 'user':
+            msgs.append(HumanMessage(content=row['content']))
+        else:
+            msgs.append(AIMessage(content=row['content']))
+    return msgs
+
+
 class SimplePostgresChatMessageHistory:
     """
-    Minimal replacement for PostgresChatMessageHistory that avoids psycopg2.sql.Composed
+    Minimal replacement for PostgresChatMessageHistory that avoids psycopg2.sql.Composed.
+    Borrows a pooled connection per operation unless an explicit connection is given.
     """
-    def __init__(self, user_id, session_id, connection):
+    def __init__(self, user_id, session_id, connection=None):
         self._user_id = str(user_id)
         self._session_id = str(session_id)
         self._connection = connection
+        self._writer = _writer()
+        _ensure_schema()
+
+    def _pending_rows(self):
+        # Read before querying the table, so a concurrent flush can't hide a row
+        return self._writer.pending_rows(self._session_id) if self._writer else []
+
+    @contextmanager
+    def _conn(self):
+        if self._connection is not None:
+            yield self._connection
+            self._connection.commit()
+        else:
+            with get_pool().connection() as conn:
+                yield conn
 
     @property
     def messages(self):
-        msgs = []
-        query = f"SELECT role, content FROM {TABLE_NAME} WHERE session_id = %s ORDER BY created_at ASC"
-        with self._connection.cursor(cursor_factory=RealDictCursor) as cur:
+        pending = self._pending_rows()
+        query = f"SELECT role, content, created_at FROM {TABLE_NAME} WHERE session_id = %s ORDER BY created_at ASC"
+        with self._conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
             cur.execute(query, (self._session_id,))
             rows = cur.fetchall()
-            for row in rows:
-                if row['role'] == 'user':
-                    msgs.append(HumanMessage(content=row['content']))
-                else:
-                    msgs.append(AIMessage(content=row['content']))
-        return msgs
+        return rows_to_messages(_merge_pending(rows, pending))
+
+    @property
+    def session_id(self):
+        return self._session_id
+
+    def recent_messages(self, limit=None, max_tokens=None):
+        """
+        Return only the newest messages of the session, oldest first.
+        limit caps the number of messages; max_tokens caps their estimated size
+        (the newest message is always included). Both are applied in SQL so
+        older rows are never fetched.
+        """
+        return rows_to_messages(self.recent_rows(limit, max_tokens))
+
+    def recent_rows(self, limit=None, max_tokens=None, max_message_tokens=None):
+        """
+        Same window as recent_messages, as dict rows with role, content and
+        created_at. With max_message_tokens, a row counts at most that much
+        toward max_tokens (for callers that truncate long messages).
+        """
+        pending = self._pending_rows()
+        if max_tokens is None:
+            query = f"""
+                SELECT role, content, created_at FROM {TABLE_NAME}
+                WHERE session_id = %s
+                ORDER BY created_at DESC
+                LIMIT %s
+            """
+            params = (self._session_id, limit)
+        else:
+            query = f"""
+                SELECT role, content, created_at FROM (
+                    SELECT role, content, created_at,
+                           ROW_NUMBER() OVER w AS rn,
+                           SUM(LEAST(LENGTH(content), %s)) OVER w AS running_chars
+                    FROM {TABLE_NAME}
+                    WHERE session_id = %s
+                    WINDOW w AS (ORDER BY created_at DESC ROWS UNBOUNDED PRECEDING)
+                ) recent
+                WHERE rn = 1 OR running_chars <= %s
+                ORDER BY created_at DESC
+                LIMIT %s
+            """
+            message_chars = max_message_tokens * CHARS_PER_TOKEN if max_message_tokens is not None else None
+            params = (message_chars, self._session_id, max_tokens * CHARS_PER_TOKEN, limit)
+        with self._conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            rows = cur.fetchall()
+        rows.reverse()
+        if pending:
+            rows = _trim_window(_merge_pending(rows, pending), limit, max_tokens, max_message_tokens)
+        return rows
+
+    def rows_between(self, after=None, before=None, limit=None, newest=False):
+        """
+        Rows with after < created_at < before (either bound optional), oldest
+        first: the oldest `limit` of them, or with newest=True the newest.
+        """
+        query = f"""
+            SELECT role, content, created_at FROM {TABLE_NAME}
+            WHERE session_id = %s
+              AND (%s::timestamptz IS NULL OR created_at > %s)
+              AND (%s::timestamptz IS NULL OR created_at < %s)
+            ORDER BY created_at {"DESC" if newest else "ASC"}
+            LIMIT %s
+        """
+        pending = [
+            r for r in self._pending_rows()
+            if (after is None or r["created_at"] > after) and (before is None or r["created_at"] < before)
+        ]
+        with self._conn() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, (self._session_id, after, after, before, before, limit))
+            rows = cur.fetchall()
+        if newest:
+            rows.reverse()
+        rows = _merge_pending(rows, pending)
+        if limit is None:
+            return rows
+        return rows[-limit:] if newest else rows[:limit]
 
     def add_user_message(self, message):
         self.add_message(HumanMessage(content=message))
@@ -58,15 +286,73 @@ class SimplePostgresChatMessageHistory:
         self.add_message(AIMessage(content=message))
 
     def add_message(self, message):
-        query = f"""
-            INSERT INTO {TABLE_NAME} (user_id, session_id, role, content, created_at)
-            VALUES (%s, %s, %s, %s, NOW())
-        """
         role = 'user' if isinstance(message, HumanMessage) else 'assistant'
-        with self._connection.cursor() as cur:
+        if self._writer is not None and self._connection is None:
+            # Write-behind: buffered and inserted in batches by a background thread
+            self._writer.append(self._user_id, self._session_id, role, message.content)
+            return
+        # One round trip: insert the message and fold it into chat_sessions
+        query = f"""
+            WITH inserted AS (
+                INSERT INTO {TABLE_NAME} (user_id, session_id, role, content, created_at)
+                VALUES (%s, %s, %s, %s, NOW())
+                RETURNING user_id, session_id, role, content, created_at
+            )
+        """ + _SESSION_UPSERT.format(source="""
+            SELECT user_id, session_id, CASE WHEN role = 'user' THEN content END, created_at, created_at, 1
+            FROM inserted
+        """)
+        with self._conn() as conn, conn.cursor() as cur:
             cur.execute(query, (self._user_id, self._session_id, role, message.content))
-        self._connection.commit()
+        _note_written([{"user_id": self._user_id, "session_id": self._session_id, "role": role}])
+
+
+
+# ---------------------------
+# Keyset pagination
+# ---------------------------
+def page_size(limit, default):
+    """Clamp a requested page size (None/invalid -> default) to 1..MAX_PAGE_SIZE."""
+    try:
+        limit = int(limit) if limit is not None else default
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def encode_cursor(created_at, key):
+    raw = json.dumps([created_at.isoformat(), key]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return (created_at, key) from encode_cursor's output; ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, key = json.loads(raw)
+        return datetime.fromisoformat(created_at), key
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def bind_chat_session(session, token):
+    """
+    Bind a web session (any dict-like session store) to the user from the token
+    and make sure it has a session_id.
+    """
+    user_id = session.get("user_id")
+
+    # If a token is provided (format username-userId), bind backend session to that user
+    if token and not user_id:
+        try:
+            parts = str(token).split("-")
+            if len(parts) >= 2:
+                session["user_id"] = parts[-1]
+        except Exception:
+            pass
 
+    if "session_id" not in session:
+        session["session_id"] = os.urandom(8).hex()
 
 
 def get_chat_history(user_id=None, session_id=None):
@@ -77,43 +363,63 @@ def get_chat_history(user_id=None, session_id=None):
     if not session_id:
         session_id = str(uuid.uuid4())
 
-    conn = get_psycopg_connection()
-    history = SimplePostgresChatMessageHistory(user_id, session_id, conn)
+    history = SimplePostgresChatMessageHistory(user_id, session_id)
     return history, user_id, session_id
 
 
-def get_user_chat_sessions(user_id):
+def get_user_chat_sessions(user_id, limit=None, cursor=None):
     """
-    Returns a list of chat sessions for a given user.
-    Each session contains session_id, first_time, and title (first message content).
+    Returns a list of chat sessions for a given user, newest first.
+    Each session contains session_id, first_time, title (first user message),
+    last_time and message_count; read from the chat_sessions summary table.
+    limit/cursor select one page (see get_user_chat_sessions_page).
+    Cached per process: new sessions and titles show up at once, while
+    last_time/message_count may lag by up to SESSION_CACHE_TTL.
     """
     user_id = str(user_id)
+    after_time, after_id = decode_cursor(cursor) if cursor else (None, None)
+    cache_key = (user_id, limit, cursor)
+    cached = _session_lists.get(cache_key)
+    if cached is not None:
+        return list(cached)
+    generation = _lists_generation
     sessions = []
     try:
-        with get_psycopg_connection() as conn:
+        _ensure_schema()
+        with get_pool().connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
                 query = f"""
-                    SELECT session_id,
-                           MIN(created_at) AS first_time,
-                           (
-                               SELECT content
-                               FROM {TABLE_NAME} ch2
-                               WHERE ch2.session_id = ch1.session_id
-                                 AND ch2.role = 'user'
-                               ORDER BY created_at ASC
-                               LIMIT 1
-                           ) AS title
-                    FROM {TABLE_NAME} ch1
+                    SELECT session_id, first_time, title, last_time, message_count
+                    FROM {SESSIONS_TABLE_NAME}
                     WHERE user_id = %s
-                    GROUP BY session_id
-                    ORDER BY first_time DESC;
+                      AND (%s::timestamptz IS NULL OR (first_time, session_id) < (%s, %s))
+                    ORDER BY first_time DESC, session_id DESC
+                    LIMIT %s;
                 """
-                cur.execute(query, (user_id,))
+                cur.execute(query, (user_id, after_time, after_time, after_id, limit))
                 sessions = cur.fetchall()
+        if generation == _lists_generation:
+            _session_lists.set(cache_key, list(sessions))
     except Exception as e:
         print(f"Error fetching chat sessions: {e}")
     return sessions
 
+
+def get_user_chat_sessions_page(user_id, limit=None, cursor=None):
+    """
+    One page of get_user_chat_sessions: (sessions, next_cursor), next_cursor None
+    on the last page. Without limit and cursor, every session in one go.
+    """
+    if limit is None and cursor is None:
+        return get_user_chat_sessions(user_id), None
+    limit = page_size(limit, SESSIONS_PAGE_SIZE)
+    sessions = get_user_chat_sessions(user_id, limit + 1, cursor)
+    if len(sessions) <= limit:
+        return sessions, None
+    sessions = sessions[:limit]
+    last = sessions[-1]
+    return sessions, encode_cursor(last["first_time"], last["session_id"])
+
 def create_new_chat_session(user_id):
     """
     Creates a new chat session for a given user and returns the session_id.
@@ -123,26 +429,67 @@ def create_new_chat_session(user_id):
 
     return session_id
 
-def get_session_messages_by_id(user_id, session_id):
+def get_session_messages_by_id(user_id, session_id, limit=None, cursor=None):
     """
-    Get all messages for a specific session ID.
+    Get the messages of a specific session ID, oldest first.
     Returns a list of message objects with role, content, and timestamp.
+    limit/cursor select one page (see get_session_messages_page).
+    """
+    return get_session_messages_page(user_id, session_id, limit, cursor)[0]
+
+
+def get_session_messages_page(user_id, session_id, limit=None, cursor=None):
+    """
+    One page of a session's messages: (messages, next_cursor). Pages run from
+    the newest messages backwards (messages within a page are oldest first);
+    next_cursor fetches the page of older messages, None when there are none.
+    Without limit and cursor, the whole session in one go.
     """
     user_id = str(user_id)
     session_id = str(session_id)
+    paginate = limit is not None or cursor is not None
+    limit = page_size(limit, MESSAGES_PAGE_SIZE) if paginate else None
+    before_time, before_id = decode_cursor(cursor) if cursor else (None, None)
     messages = []
+    next_cursor = None
+    writer = _writer()
+    # Unflushed messages are the newest ones; keep those that fall on this page
+    pending = [
+        r for r in (writer.pending_rows(session_id) if writer else ())
+        if r["user_id"] == user_id and (not cursor or r["created_at"] < before_time)
+    ]
    
     try:
-        with get_psycopg_connection() as conn:
+        with get_pool().connection() as conn:
             with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                query = f"""
-                    SELECT role, content, created_at
-                    FROM {TABLE_NAME}
-                    WHERE user_id = %s AND session_id = %s AND role != 'system'
-                    ORDER BY created_at ASC
-                """
-                cur.execute(query, (user_id, session_id))
+                if _has_message_ids(cur):
+                    query = f"""
+                        SELECT id, role, content, created_at
+                        FROM {TABLE_NAME}
+                        WHERE user_id = %s AND session_id = %s AND role != 'system'
+                          AND (%s::timestamptz IS NULL OR (created_at, id) < (%s, %s))
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s
+                    """
+                    params = (user_id, session_id, before_time, before_time, before_id)
+                else:
+                    query = f"""
+                        SELECT role, content, created_at
+                        FROM {TABLE_NAME}
+                        WHERE user_id = %s AND session_id = %s AND role != 'system'
+                          AND (%s::timestamptz IS NULL OR created_at < %s)
+                        ORDER BY created_at DESC
+                        LIMIT %s
+                    """
+                    params = (user_id, session_id, before_time, before_time)
+                cur.execute(query, params + (limit + 1 if limit else None,))
                 rows = cur.fetchall()
+                rows.reverse()
+                rows = _merge_pending(rows, pending)
+                if limit and len(rows) > limit:
+                    rows = rows[-limit:]
+                    oldest = rows[0]
+                    next_cursor = encode_cursor(oldest["created_at"], oldest.get("id") or 0)
                
                 for row in rows:
                     messages.append({
@@ -153,9 +500,7 @@ def get_session_messages_by_id(user_id, session_id):
     except Exception as e:
         print(f"Error fetching session messages: {e}")
    
-    return messages
-
-
+    return messages, next_cursor
 
 
 def verify_session_ownership(user_id, session_id):
@@ -165,19 +510,29 @@ def verify_session_ownership(user_id, session_id):
     """
     user_id = str(user_id)
     session_id = str(session_id)
+    if _session_owners.get((user_id, session_id)) is not None:
+        return True
+    writer = _writer()
+    if writer and any(r["user_id"] == user_id for r in writer.pending_rows(session_id)):
+        return True
    
     try:
-        with get_psycopg_connection() as conn:
+        _ensure_schema()
+        with get_pool().connection() as conn:
             with conn.cursor() as cur:
+                # Primary-key probe on the summary table instead of counting the session's messages
                 query = f"""
-                    SELECT COUNT(*)
-                    FROM {TABLE_NAME}
+                    SELECT title IS NOT NULL
+                    FROM {SESSIONS_TABLE_NAME}
                     WHERE user_id = %s AND session_id = %s
+                    LIMIT 1
                 """
                 cur.execute(query, (user_id, session_id))
-                count = cur.fetchone()[0]
-                return count > 0
+                row = cur.fetchone()
+        if row is None:
+            return False
+        _session_owners.set((user_id, session_id), row[0])
+        return True
     except Exception as e:
         print(f"Error verifying session ownership: {e}")
         return False
-
@@ -0,0 +1,102 @@
+# chat_turns.py
+# One chat turn as a stream of events, shared by app.py (Flask) and asgi_app.py
+# (FastAPI): predefined answers, request dedup and admission, plus the SSE and
+# rejection formats both servers send.
+import json
+
+from agent import stream_supervisor, astream_supervisor
+from db import run_db
+from router import predefined_reply
+from admission import admission, AdmissionRejected, user_key
+from request_dedup import chat_dedup
+
+
+def answer_events(user_message, history, reply, is_category_click):
+    """Events for one chat turn: a predefined answer, or a supervisor run."""
+    if reply is not None:
+        # Save the AI message (and a typed question) to DB
+        if not is_category_click:
+            history.add_user_message(user_message)
+        history.add_ai_message(reply)
+        yield {"event": "final", "node": "predefined", "reply": reply}
+        return
+    # stream_supervisor handles saving both user and AI messages
+    yield from stream_supervisor(user_message, history)
+
+
+async def aanswer_events(user_message, history, reply, is_category_click):
+    """Async answer_events, on astream_supervisor."""
+    if reply is not None:
+        def save():
+            if not is_category_click:
+                history.add_user_message(user_message)
+            history.add_ai_message(reply)
+        await run_db(save)
+        yield {"event": "final", "node": "predefined", "reply": reply}
+        return
+    async for event in astream_supervisor(user_message, history):
+        yield event
+
+
+def start_turn(session, user_message, history):
+    """
+    Return (events, done) for this message. A duplicate of a turn that is
+    running (or just finished) in the same session follows that turn instead
+    of running again; otherwise LLM turns are admitted first (may raise
+    AdmissionRejected). done() must be called once the response is over.
+    """
+    run, leader = chat_dedup.claim(history.session_id, user_message)
+    if not leader:
+        events = run.follow(timeout=chat_dedup.follow_timeout)
+        return events, events.close
+
+    reply, is_category_click = predefined_reply(user_message)
+    ticket = None
+    if reply is None:
+        try:
+            ticket = admission.acquire(user_key(session))
+        except AdmissionRejected:
+            run.abandon()
+            raise
+    events = run.relay(answer_events(user_message, history, reply, is_category_click))
+
+    def done():
+        events.close()
+        run.abandon()   # no-op unless the stream never ran to the end
+        if ticket:
+            ticket.release()
+    return events, done
+
+
+async def astart_turn(session, user_message, history):
+    """Async start_turn: events is an async iterator and done() a coroutine."""
+    run, leader = chat_dedup.claim(history.session_id, user_message)
+    if not leader:
+        events = run.afollow(timeout=chat_dedup.follow_timeout)
+        return events, events.aclose
+
+    reply, is_category_click = predefined_reply(user_message)
+    ticket = None
+    if reply is None:
+        try:
+            ticket = await admission.aacquire(user_key(session))
+        except AdmissionRejected:
+            run.abandon()
+            raise
+    events = run.arelay(aanswer_events(user_message, history, reply, is_category_click))
+
+    async def done():
+        await events.aclose()
+        run.abandon()
+        if ticket:
+            ticket.release()
+    return events, done
+
+
+def rejection(e):
+    """(body, status, headers) of the 429/503 response for a request the admission controller turned away."""
+    return {"error": str(e), "retry_after": e.retry_after}, e.status, {"Retry-After": str(e.retry_after)}
+
+
+def sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
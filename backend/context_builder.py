@@ -0,0 +1,111 @@
+# context_builder.py
+import os
+import logging
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage
+
+from chat_history import CHARS_PER_TOKEN, rows_to_messages
+
+# Load environment variables
+load_dotenv()
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_MAX_MESSAGE_TOKENS = int(os.getenv("HISTORY_MAX_MESSAGE_TOKENS", "800"))
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "20"))
+TRUNCATION_MARKER = "\n\n[...earlier answer truncated...]"
+# recent_rows caps the fetch with a chars/4 estimate, which overcounts tokens for
+# most text; fetch this much past the budget so the real count decides what fits
+FETCH_BUDGET_SLACK = 1.5
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """tiktoken is optional (and may need to download its BPE file); fall back to a char estimate."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logging.info("tiktoken unavailable, estimating tokens from length: %s", e)
+            _encoding = None
+    return _encoding
+
+
+def count_tokens(text):
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text, max_tokens):
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return encoding.decode(tokens[:max_tokens]) + TRUNCATION_MARKER
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + TRUNCATION_MARKER
+
+
+@dataclass
+class ContextWindow:
+    messages: list = field(default_factory=list)
+    token_count: int = 0
+    truncated: int = 0      # assistant messages shortened to fit
+    dropped: int = 0        # candidate messages left out because of the budget
+    start_time: object = None  # created_at of the oldest message kept, when known
+
+
+def select_messages(candidates, token_budget=HISTORY_TOKEN_BUDGET, max_message_tokens=HISTORY_MAX_MESSAGE_TOKENS):
+    """
+    Pick messages newest-first until token_budget is reached. Assistant messages
+    longer than max_message_tokens are truncated; the newest message (the
+    current user turn) is always kept whole.
+    """
+    window = ContextWindow()
+    picked = []
+    for i, msg in enumerate(reversed(candidates)):
+        content = msg.content if isinstance(msg.content, str) else str(msg.content)
+        tokens = count_tokens(content)
+        truncated = False
+        if i > 0 and isinstance(msg, AIMessage) and tokens > max_message_tokens:
+            content = truncate_to_tokens(content, max_message_tokens)
+            tokens = count_tokens(content)
+            msg = AIMessage(content=content)
+            truncated = True
+        if i > 0 and window.token_count + tokens > token_budget:
+            window.dropped = len(candidates) - i
+            break
+        window.truncated += truncated
+        picked.append(msg)
+        window.token_count += tokens
+    picked.reverse()
+    window.messages = picked
+    return window
+
+
+def build_context(history, token_budget=HISTORY_TOKEN_BUDGET, max_message_tokens=HISTORY_MAX_MESSAGE_TOKENS,
+                  max_messages=HISTORY_MAX_MESSAGES):
+    """Load the recent history window and fit it into token_budget."""
+    rows = history.recent_rows(
+        limit=max_messages,
+        max_tokens=int(token_budget * FETCH_BUDGET_SLACK),
+        max_message_tokens=max_message_tokens,
+    )
+    window = select_messages(rows_to_messages(rows), token_budget, max_message_tokens)
+    if window.messages:
+        window.start_time = rows[len(rows) - len(window.messages)]["created_at"]
+    logging.info(
+        "Context window: %d messages, %d tokens (budget %d, truncated %d, dropped %d)",
+        len(window.messages), window.token_count, token_budget, window.truncated, window.dropped,
+    )
+    return window
@@ -0,0 +1,378 @@
+# db.py
+import os
+import re
+import asyncio
+import functools
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import psycopg2
+import psycopg2.extensions
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+# Load environment variables
+load_dotenv()
+
+# A full connection URL wins; otherwise fall back to the individual POSTGRES_* settings
+DATABASE_URL = (
+    os.getenv("NEON_API_URL")
+    or os.getenv("DATABASE_URL")
+    or os.getenv("POSTGRES_URL")
+)
+POSTGRES_HOST = os.getenv("POSTGRES_HOST")
+POSTGRES_DB = os.getenv("POSTGRES_DB")
+POSTGRES_USER = os.getenv("POSTGRES_USER")
+POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD")
+POSTGRES_SSLMODE = os.getenv("POSTGRES_SSLMODE", "require")
+
+# Pool configuration
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))          # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))       # idle connections older than this are closed
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))  # ping connections idle longer than this
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """
+    psycopg2 connection whose close() hands it back to its pool instead of
+    closing the socket, so code written for plain connections stays correct.
+    """
+    _pool = None
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool.putconn(self)
+
+    def really_close(self):
+        self._pool = None
+        if not self.closed:
+            super().close()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of psycopg2 connections.
+
+    Connections are checked out with getconn() (or the connection() context
+    manager) and returned with putconn(). Connections idle for longer than
+    check_after are pinged before being handed out, and connections idle for
+    longer than max_idle are closed, down to min_size.
+    """
+
+    def __init__(self, connect, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_idle=DB_POOL_MAX_IDLE, check_after=DB_POOL_CHECK_AFTER):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size: min_size=%s max_size=%s" % (min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._idle = []          # list of (connection, returned_at), most recently returned last
+        self._in_use = set()
+        self._opening = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._stats = {
+            "connections_opened": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_timeouts": 0,
+            "failed_health_checks": 0,
+            "wait_time_total": 0.0,
+        }
+
+    # ---------------------------
+    # Checkout / return
+    # ---------------------------
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        waited = False
+        start = time.monotonic()
+
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._reap_locked()
+
+                conn = None
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    self._in_use.add(conn)
+                elif self._size_locked() < self.max_size:
+                    self._opening += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["checkout_timeouts"] += 1
+                        raise PoolTimeout(
+                            "No database connection available after %.1fs (max_size=%d)" % (timeout, self.max_size)
+                        )
+                    waited = True
+                    self._cond.wait(remaining)
+                    continue
+
+            if conn is not None:
+                # Health-check connections that have been sitting idle for a while
+                if time.monotonic() - returned_at > self.check_after and not self._is_healthy(conn):
+                    with self._cond:
+                        self._in_use.discard(conn)
+                        self._stats["failed_health_checks"] += 1
+                    self._close(conn)
+                    continue
+            else:
+                try:
+                    conn = self._open()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is not None:
+                            self._in_use.add(conn)
+                        else:
+                            self._cond.notify()
+
+            with self._cond:
+                self._stats["checkouts"] += 1
+                if waited:
+                    self._stats["checkout_waits"] += 1
+                self._stats["wait_time_total"] += time.monotonic() - start
+            return conn
+
+    def putconn(self, conn):
+        with self._cond:
+            if conn not in self._in_use:
+                return
+            self._in_use.discard(conn)
+
+        discard = self._closed or conn.closed
+        if not discard:
+            try:
+                # Never hand out a connection with a transaction left open
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                discard = True
+
+        if discard:
+            self._close(conn)
+            with self._cond:
+                self._cond.notify()
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Check out a connection; commit on success, roll back on error, always return it."""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            raise
+        finally:
+            self.putconn(conn)
+
+    # ---------------------------
+    # Maintenance
+    # ---------------------------
+    def reap(self):
+        """Close connections that have been idle longer than max_idle."""
+        with self._cond:
+            self._reap_locked()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle = [c for c, _ in self._idle]
+            self._idle = []
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                "size": self._size_locked(),
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            })
+        return data
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+    def _size_locked(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _reap_locked(self):
+        now = time.monotonic()
+        size = self._size_locked()
+        keep = []
+        expired = []
+        # Oldest returns are at the front of the list
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.max_idle and size > self.min_size:
+                expired.append(conn)
+                size -= 1
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+        for conn in expired:
+            self._close(conn)
+
+    def _open(self):
+        conn = self._connect()
+        conn._pool = self
+        with self._cond:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _close(self, conn):
+        try:
+            conn.really_close()
+        except Exception:
+            logging.warning("Error closing pooled connection", exc_info=True)
+        with self._cond:
+            self._stats["connections_closed"] += 1
+
+    @staticmethod
+    def _is_healthy(conn):
+        if conn.closed:
+            return False
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+
+def is_configured():
+    return bool(DATABASE_URL or POSTGRES_HOST)
+
+
+def get_psycopg_connection():
+    """Open a new (unpooled) connection. Prefer get_pool().connection()."""
+    if DATABASE_URL:
+        # libpq does not understand SQLAlchemy-style "postgresql+psycopg2://" URLs
+        dsn = re.sub(r"^postgres(?:ql)?\+\w+://", "postgresql://", DATABASE_URL)
+        return psycopg2.connect(dsn, connection_factory=PooledConnection)
+    return psycopg2.connect(
+        host=POSTGRES_HOST,
+        dbname=POSTGRES_DB,
+        user=POSTGRES_USER,
+        password=POSTGRES_PASSWORD,
+        sslmode=POSTGRES_SSLMODE,
+        connection_factory=PooledConnection,
+    )
+
+
+# ---------------------------
+# Process-wide pool
+# ---------------------------
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_engine = None
+_executor = None
+_executor_pid = None
+
+
+def get_pool():
+    """
+    Return the process-wide pool, creating it on first use. A new pool is created
+    after a fork (e.g. gunicorn workers) so sockets are never shared across processes.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ConnectionPool(get_psycopg_connection)
+                _pool_pid = pid
+    return _pool
+
+
+def connection(timeout=None):
+    """Shortcut for get_pool().connection()."""
+    return get_pool().connection(timeout)
+
+
+def get_engine():
+    """
+    Return the process-wide SQLAlchemy engine. It keeps no connections of its own:
+    every checkout borrows from get_pool(), and SQLAlchemy's close() returns the
+    connection there, so raw-cursor and SQLAlchemy users share a single pool.
+    SQLAlchemy sees each checkout as a new connection and reruns the dialect's
+    on-connect hook (client-side type registration, no round trip); the
+    server-version queries run once per engine.
+    """
+    global _engine
+    if _engine is None:
+        with _pool_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    "postgresql+psycopg2://",
+                    creator=lambda: get_pool().getconn(),
+                    poolclass=NullPool,
+                )
+    return _engine
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+# ---------------------------
+# Async callers
+# ---------------------------
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _pool_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(max_workers=DB_POOL_MAX_SIZE, thread_name_prefix="db")
+                _executor_pid = pid
+    return _executor
+
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Await a blocking database call (psycopg2 has no async API) from async code.
+    Calls run on a thread pool no larger than the connection pool, so waiting
+    requests queue here instead of holding threads blocked on getconn().
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
@@ -0,0 +1,315 @@
+# deadlines.py
+import os
+import time
+import asyncio
+import queue
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any
+from dotenv import load_dotenv
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Load environment variables
+load_dotenv()
+
+CHAT_DEADLINE = float(os.getenv("CHAT_DEADLINE", "60"))                # wall-clock budget per chat request
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "30"))    # per OpenAI HTTP request
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))             # 0 disables hedged LLM calls
+TAVILY_TIMEOUT = float(os.getenv("TAVILY_TIMEOUT", "10"))
+SQL_STATEMENT_TIMEOUT = float(os.getenv("SQL_STATEMENT_TIMEOUT", "5"))  # sql_agent's queries only
+
+# Shown when a run hits CHAT_DEADLINE (agent.py and the Streamlit app)
+DEADLINE_NOTICE = "⏱️ This answer was cut short because it took too long. Please ask again for the full details."
+DEADLINE_REPLY = (
+    "⏱️ Sorry, this is taking longer than expected and I couldn't finish in time. "
+    "Please try again in a moment, or ask a more specific question."
+)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request runs out of its wall-clock budget."""
+
+
+class ToolTimeout(TimeoutError):
+    """Raised when a single tool call exceeds its timeout."""
+
+
+class Deadline:
+    def __init__(self, seconds, clock=time.monotonic):
+        self._clock = clock
+        self.seconds = seconds
+        self.expires_at = clock() + seconds
+        self.cancelled = False
+
+    def cancel(self):
+        """End the budget now, e.g. because nobody is waiting for the result any more."""
+        self.cancelled = True
+
+    def remaining(self):
+        if self.cancelled:
+            return 0.0
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cap(self, timeout):
+        """The smaller of timeout and the time left."""
+        return min(timeout, self.remaining())
+
+
+_current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+def current_deadline():
+    return _current_deadline.get()
+
+
+def time_left(default):
+    """Seconds left on the current request's deadline, capped at default."""
+    deadline = current_deadline()
+    return deadline.cap(default) if deadline else default
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current request's deadline has passed (or was cancelled)."""
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"Request exceeded its {deadline.seconds:.0f}s deadline")
+
+
+class DeadlineGuard(BaseCallbackHandler):
+    """
+    Callback handler (pass it in the run's config) that fails every LLM call,
+    streamed token and tool call once deadline has expired or been cancelled,
+    so a run nobody waits for stops at its next step instead of running on.
+    """
+    raise_error = True
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def _check(self):
+        if self.deadline.expired():
+            raise DeadlineExceeded(f"Run stopped after its {self.deadline.seconds:.0f}s deadline")
+
+    def on_llm_start(self, *args, **kwargs):
+        self._check()
+
+    def on_chat_model_start(self, *args, **kwargs):
+        self._check()
+
+    def on_llm_new_token(self, *args, **kwargs):
+        self._check()
+
+    def on_tool_start(self, *args, **kwargs):
+        self._check()
+
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TIMEOUT_WORKERS", "16")), thread_name_prefix="timeout")
+
+
+def call_with_timeout(fn, timeout):
+    """Run fn() and give up after timeout seconds (the call itself is left to finish in the background)."""
+    check_deadline()
+    future = _executor.submit(contextvars.copy_context().run, fn)
+    done, _ = wait([future], timeout=timeout)
+    if not done:
+        raise ToolTimeout(f"Call timed out after {timeout:.1f}s")
+    return future.result()
+
+
+def iterate_with_deadline(make_iterator, deadline):
+    """
+    Consume make_iterator() on a background thread and yield its items, raising
+    DeadlineExceeded if the deadline passes first. The producer runs with deadline
+    as the current deadline (so tools and SQL can cap their own timeouts). Once
+    the deadline expires or the consumer stops (e.g. the client disconnected and
+    the response was closed), the deadline is cancelled and the producer stops
+    pulling from the iterator and closes it. Work inside a single step only
+    stops early if it checks the deadline: pass DeadlineGuard(deadline) in the
+    run's config to stop LLM and tool calls.
+    """
+    items = queue.Queue()
+    done = object()
+    context = contextvars.copy_context()
+    context.run(_current_deadline.set, deadline)
+
+    def produce():
+        iterator = None
+        try:
+            iterator = make_iterator()
+            for item in iterator:
+                if deadline.expired():
+                    break
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((None, e))
+        finally:
+            # Stops a LangGraph run between steps instead of letting it run on unread
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    logging.warning("Error closing abandoned stream", exc_info=True)
+
+    threading.Thread(target=context.run, args=(produce,), daemon=True).start()
+    try:
+        while True:
+            try:
+                item, error = items.get(timeout=deadline.remaining())
+            except queue.Empty:
+                raise DeadlineExceeded(f"Request exceeded its {deadline.seconds:.0f}s deadline")
+            if error is not None:
+                raise error
+            if item is done:
+                if deadline.expired():
+                    raise DeadlineExceeded(f"Request exceeded its {deadline.seconds:.0f}s deadline")
+                return
+            yield item
+    finally:
+        deadline.cancel()
+
+
+async def aiterate_with_deadline(make_aiterator, deadline):
+    """
+    Async counterpart of iterate_with_deadline for astream(). Here the producer
+    is a task, so it is cancelled outright (including an in-flight LLM request)
+    when the deadline passes or the consumer goes away.
+    """
+    items = asyncio.Queue()
+    done = object()
+    context = contextvars.copy_context()
+    context.run(_current_deadline.set, deadline)
+
+    async def produce():
+        try:
+            async for item in make_aiterator():
+                await items.put((item, None))
+            await items.put((done, None))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await items.put((None, e))
+
+    task = asyncio.get_running_loop().create_task(produce(), context=context)
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(items.get(), timeout=deadline.remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"Request exceeded its {deadline.seconds:.0f}s deadline")
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        task.cancel()
+
+
+class HedgedChatModel(BaseChatModel):
+    """
+    Wraps a chat model and, when a call has produced nothing after hedge_after
+    seconds, starts an identical backup call; whichever answers (or, when
+    streaming, yields its first chunk) first wins and the other is ignored.
+    """
+    model: Any
+    hedge_after: float
+    max_hedges: int = 1
+
+    @property
+    def _llm_type(self):
+        return "hedged"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.__class__(model=self.model.bind_tools(tools, **kwargs),
+                              hedge_after=self.hedge_after, max_hedges=self.max_hedges)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        def attempt():
+            return self.model.invoke(messages, stop=stop, **kwargs)
+
+        check_deadline()
+        futures = [_executor.submit(attempt)]
+        pending = set(futures)
+        while True:
+            can_hedge = len(futures) <= self.max_hedges
+            done, pending = wait(pending, timeout=self.hedge_after if can_hedge else None,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return ChatResult(generations=[ChatGeneration(message=future.result())])
+            if not pending and not can_hedge:
+                raise futures[-1].exception()
+            # Hedge when the current attempts are slow, or have all failed
+            if can_hedge and (not done or not pending):
+                check_deadline()
+                logging.info("LLM call slow after %.1fs, starting hedged request", self.hedge_after)
+                future = _executor.submit(attempt)
+                futures.append(future)
+                pending.add(future)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = queue.Queue()
+        finished = object()
+        attempts = []
+
+        def pump(attempt_id):
+            try:
+                for chunk in self.model.stream(messages, stop=stop, **kwargs):
+                    chunks.put((attempt_id, chunk, None))
+                chunks.put((attempt_id, finished, None))
+            except Exception as e:
+                chunks.put((attempt_id, None, e))
+
+        def start():
+            check_deadline()
+            attempts.append(len(attempts))
+            threading.Thread(target=pump, args=(attempts[-1],), daemon=True).start()
+
+        start()
+        winner = None
+        failed = set()
+        while True:
+            can_hedge = winner is None and len(attempts) <= self.max_hedges
+            try:
+                attempt_id, chunk, error = chunks.get(timeout=self.hedge_after if can_hedge else None)
+            except queue.Empty:
+                logging.info("LLM stream slow after %.1fs, starting hedged request", self.hedge_after)
+                start()
+                continue
+            if winner is None:
+                if error is not None:
+                    failed.add(attempt_id)
+                    if len(failed) == len(attempts):
+                        if len(attempts) <= self.max_hedges:
+                            start()
+                            continue
+                        raise error
+                    continue
+                winner = attempt_id
+            if attempt_id != winner:
+                continue
+            if error is not None:
+                raise error
+            if chunk is finished:
+                return
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager and isinstance(chunk.content, str):
+                run_manager.on_llm_new_token(chunk.content, chunk=generation)
+            yield generation
+
+
+def hedged(model, hedge_after=LLM_HEDGE_AFTER):
+    """Wrap model in HedgedChatModel when hedging is enabled (hedge_after > 0)."""
+    if hedge_after and hedge_after > 0:
+        return HedgedChatModel(model=model, hedge_after=hedge_after)
+    return model
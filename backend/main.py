@@ -1,80 +1,24 @@
 # main.py
 
+import time
 import random
 import uuid
-import logging
 import streamlit as st
 from dotenv import load_dotenv
 
 from langchain_core.messages import HumanMessage
-from langgraph.graph import StateGraph, START, END, MessagesState
-from langgraph.prebuilt import create_react_agent
-from langchain_core.runnables.config import RunnableConfig
 
 # --- Configuration & Imports ---
 from qna_data import PREDEFINED_QAS
+from qna_index import match_predefined
 
 # Load environment variables
 load_dotenv()
 
-# Import agents and chat history
-from tavily_agent import internet_agent_executor
-from langgraph_swarm import create_handoff_tool
+# The same supervisor graph, streaming loop, deadline and semantic cache as the API (agent.py)
+from agent import stream_supervisor
 from chat_history import get_chat_history, get_user_chat_sessions
-
-# --- Agent and Graph Definitions ---
-
-# Define the handoff tool
-assign_to_internet = create_handoff_tool(agent_name="internet_agent")
-
-# Define the supervisor agent
-supervisor_agent = create_react_agent(
-    model="openai:gpt-4.1",
-    tools=[assign_to_internet],
-    prompt=(
-        "You are Malaysia's Supervisor AI Agent. Always begin with a friendly greeting."
-        "Only answer questions strictly related to studying in Malaysia, student life, or Malaysian culture in a study context."
-        "TOOL: Internet Research Agent: Conducts latest web-based searches to gather responses."
-    ),
-    name="supervisor",
-)
-
-# Define the LangGraph graph
-MAX_DEPTH = 10
-
-supervisor = (
-    StateGraph(MessagesState)
-    .add_node("supervisor", supervisor_agent)
-    .add_node("internet_agent", internet_agent_executor)
-    .add_edge(START, "supervisor")
-    .add_edge("internet_agent", END)
-    .compile()
-)
-
-
-# --- Core Functions ---
-
-# Function to run the supervisor agent and stream output
-def run_supervisor(input_text, history):
-    history.add_user_message(input_text)
-    messages = history.messages[-MAX_DEPTH:]
-    input_state = MessagesState(messages=messages)
-    config = RunnableConfig(recursion_limit=MAX_DEPTH)
-
-    try:
-        for output in supervisor.stream(input_state, config=config):
-            last_output = output
-    except Exception as e:
-        logging.exception("Error running supervisor")
-        return f"❌ Unexpected error: {e}"
-
-    for source in ["supervisor", "internet_agent"]:
-        if source in last_output:
-            for msg in reversed(last_output[source].get("messages", [])):
-                if hasattr(msg, "content") and msg.content:
-                    history.add_ai_message(msg.content)
-                    return msg.content
-    return "📡 No content returned."
+from router import record_route_latency
 
 
 # --- Streamlit UI and Session Management ---
@@ -159,37 +103,30 @@ if st.sidebar.button("➕ New Chat", key="new_chat_button"):
     st.session_state["active_session"] = str(uuid.uuid4())
     st.rerun()
 
-# Fetch and display chat sessions from DB for this user
-chat_sessions = get_user_chat_sessions(USER_ID)
-for chat in chat_sessions:
-    chat_title = chat["title"] or "(No title)"
-    # Use the unique session_id to create a unique key for each button
-    if st.sidebar.button(chat_title, key=f"chat_button_{chat['session_id']}"):
-        st.session_state["active_session"] = chat["session_id"]
-        st.rerun()
-
-
 # --- Main Chat UI and Logic ---
 
 # Use a session state variable to handle button clicks
 if "prompt_from_button" not in st.session_state:
     st.session_state.prompt_from_button = None
 
-# Initialize st.session_state.messages to prevent AttributeError
+# st.session_state.messages caches the active session's messages as (role, content)
+# so reruns do not re-query the whole history
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
 # Get history for the current session
 history, user_id, session_id = get_chat_history(USER_ID, st.session_state["active_session"])
+if st.session_state.get("messages_session") != session_id:
+    st.session_state.messages = [
+        ("user" if isinstance(msg, HumanMessage) else "assistant", msg.content)
+        for msg in history.messages
+    ]
+    st.session_state["messages_session"] = session_id
 
 # Display chat history from the active session
-for msg in history.messages:
-    if isinstance(msg, HumanMessage):
-        with st.chat_message("user"):
-            st.markdown(msg.content)
-    else:
-        with st.chat_message("assistant"):
-            st.markdown(msg.content)
+for role, content in st.session_state.messages:
+    with st.chat_message(role):
+        st.markdown(content)
 
 # Display predefined question buttons
 st.markdown("Feel free to ask one of these questions to get started:")
@@ -201,7 +138,6 @@ for i, col in enumerate(cols):
         # Use a unique key for each button by combining its index and the question text
         if st.button(questions[i], use_container_width=True, key=f"predefined_q_{i}"):
             st.session_state.prompt_from_button = questions[i]
-            st.rerun()
 
 # Get input from the chat box
 prompt = st.chat_input("Ask about scholarships, universities, or anything on the web...")
@@ -219,19 +155,53 @@ if prompt or st.session_state.prompt_from_button:
     with st.chat_message("user"):
         st.markdown(final_prompt)
     
-    # Check if the prompt is one of the predefined questions
-    if final_prompt in PREDEFINED_QAS:
-        response = PREDEFINED_QAS[final_prompt]
+    # Check if the prompt is (a near-duplicate of) one of the predefined questions
+    started = time.perf_counter()
+    predefined = match_predefined(final_prompt)
+    if predefined:
+        record_route_latency("predefined", time.perf_counter() - started)
+        response = predefined[1]
         # Add both messages to the history
         history.add_user_message(final_prompt)
         history.add_ai_message(response)
+        with st.chat_message("assistant"):
+            st.markdown(response)
     else:
-        # If not, use the supervisor agent for a new search
-        with st.spinner("Processing..."):
-            response = run_supervisor(final_prompt, history)
-    
-    # Display the response
-    with st.chat_message("assistant"):
-        st.markdown(response)
-        
-    st.rerun()
\ No newline at end of file
+        # If not, use the supervisor agent and stream tokens as they arrive
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            placeholder.markdown("Processing...")
+            shown = ""
+            response = ""
+            for event in stream_supervisor(final_prompt, history):
+                if event["event"] == "node":
+                    # A handoff starts a new answer; drop the previous agent's partial text
+                    shown = ""
+                elif event["event"] == "token":
+                    shown += event["delta"]
+                    placeholder.markdown(shown + "▌")
+                elif event["event"] in ("final", "error"):
+                    response = event["reply"]
+            placeholder.markdown(response)
+
+    # Update the cached transcript and session list instead of rerunning the script
+    st.session_state.messages.append(("user", final_prompt))
+    st.session_state.messages.append(("assistant", response))
+    chat_sessions = st.session_state.get("chat_sessions")
+    if chat_sessions is not None and not any(c["session_id"] == session_id for c in chat_sessions):
+        chat_sessions.insert(0, {"session_id": session_id, "title": final_prompt, "first_time": None})
+
+
+# --- Sidebar Session List ---
+
+# Fetch chat sessions from DB once per browser session, then keep the cached list up to date
+if st.session_state.get("chat_sessions_user") != USER_ID:
+    st.session_state["chat_sessions"] = get_user_chat_sessions(USER_ID)
+    st.session_state["chat_sessions_user"] = USER_ID
+
+for chat in st.session_state["chat_sessions"]:
+    chat_title = chat["title"] or "(No title)"
+    # Use the unique session_id to create a unique key for each button
+    if st.sidebar.button(chat_title, key=f"chat_button_{chat['session_id']}"):
+        st.session_state["active_session"] = chat["session_id"]
+        st.rerun()
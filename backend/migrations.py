@@ -0,0 +1,307 @@
+# migrations.py
+# Idempotent schema setup for the chat tables. Runs at web server startup
+# (CHAT_SCHEMA_ON_STARTUP) or by hand:  python migrations.py [--backfill] [--check]
+# The request path only makes sure the tables exist (ensure_tables).
+import os
+import sys
+import json
+import logging
+from dotenv import load_dotenv
+
+from db import get_pool
+
+# Load environment variables
+load_dotenv()
+
+TABLE_NAME = os.getenv("TABLE_NAME", "chat_history")
+SESSIONS_TABLE_NAME = os.getenv("SESSIONS_TABLE_NAME", "chat_sessions")
+SUMMARY_TABLE_NAME = os.getenv("SUMMARY_TABLE_NAME", "chat_summaries")
+CHAT_SCHEMA_ON_STARTUP = os.getenv("CHAT_SCHEMA_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+
+def _table_exists(cur, name):
+    cur.execute("SELECT to_regclass(%s)", (name,))
+    return cur.fetchone()[0] is not None
+
+
+def _has_primary_key(cur, name):
+    cur.execute("SELECT 1 FROM pg_index WHERE indrelid = to_regclass(%s) AND indisprimary", (name,))
+    return cur.fetchone() is not None
+
+
+# ---------------------------
+# chat_history
+# ---------------------------
+# (index name, columns) for the access paths in chat_history.py. Every message
+# read filters on session_id (plus user_id for the sidebar's message pages) and orders
+# by created_at, with id as the keyset tie-breaker. Per-user listings read
+# chat_sessions instead, so chat_history needs no user_id-leading index.
+CHAT_HISTORY_INDEXES = [
+    (f"{TABLE_NAME}_session_created_idx", "(session_id, created_at, id)"),
+]
+
+
+def create_chat_history(cur):
+    """One row per chat message. Adds the id primary key to tables created before it existed."""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+            id BIGSERIAL PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+    if not _has_primary_key(cur, TABLE_NAME):
+        cur.execute("SAVEPOINT chat_history_pk")
+        try:
+            cur.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS id BIGSERIAL")
+            cur.execute(f"ALTER TABLE {TABLE_NAME} ADD PRIMARY KEY (id)")
+            cur.execute("RELEASE SAVEPOINT chat_history_pk")
+            logging.info("Added primary key (id) to %s", TABLE_NAME)
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT chat_history_pk")
+            logging.warning("Could not add a primary key to %s: %s", TABLE_NAME, e)
+    for name, columns in CHAT_HISTORY_INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {TABLE_NAME} {columns}")
+
+
+def ensure_chat_history():
+    """Create chat_history and its indexes if needed."""
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (TABLE_NAME,))
+        create_chat_history(cur)
+
+
+# ---------------------------
+# chat_sessions
+# ---------------------------
+def create_chat_sessions(cur):
+    """One row per (user, chat session): what the sidebar lists, kept up to date on every message write."""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SESSIONS_TABLE_NAME} (
+            user_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            title TEXT,
+            first_time TIMESTAMPTZ NOT NULL,
+            last_time TIMESTAMPTZ NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, session_id)
+        )
+    """)
+    # Matches the sidebar's keyset pagination: WHERE user_id ORDER BY first_time DESC, session_id DESC
+    cur.execute(f"""
+        CREATE INDEX IF NOT EXISTS {SESSIONS_TABLE_NAME}_user_first_time_session_idx
+        ON {SESSIONS_TABLE_NAME} (user_id, first_time DESC, session_id DESC)
+    """)
+    cur.execute(f"DROP INDEX IF EXISTS {SESSIONS_TABLE_NAME}_user_first_time_idx")
+
+
+def backfill_chat_sessions(cur):
+    """
+    Rebuild chat_sessions from chat_history. Writers are blocked for the
+    duration (SHARE lock) so no increment is lost; returns the rows written.
+    """
+    cur.execute(f"LOCK TABLE {TABLE_NAME} IN SHARE MODE")
+    cur.execute(f"""
+        INSERT INTO {SESSIONS_TABLE_NAME} (user_id, session_id, title, first_time, last_time, message_count)
+        SELECT user_id,
+               session_id,
+               (ARRAY_AGG(content ORDER BY created_at) FILTER (WHERE role = 'user'))[1],
+               MIN(created_at),
+               MAX(created_at),
+               COUNT(*)
+        FROM {TABLE_NAME}
+        GROUP BY user_id, session_id
+        ON CONFLICT (user_id, session_id) DO UPDATE SET
+            title = EXCLUDED.title,
+            first_time = EXCLUDED.first_time,
+            last_time = EXCLUDED.last_time,
+            message_count = EXCLUDED.message_count
+    """)
+    return cur.rowcount
+
+
+def ensure_chat_sessions(backfill=False):
+    """Create chat_sessions if needed; backfill when it is new (or when asked to)."""
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        # Serialize with other processes running the same migration
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (SESSIONS_TABLE_NAME,))
+        existed = _table_exists(cur, SESSIONS_TABLE_NAME)
+        create_chat_sessions(cur)
+        if (backfill or not existed) and _table_exists(cur, TABLE_NAME):
+            rows = backfill_chat_sessions(cur)
+            logging.info("Backfilled %d rows into %s", rows, SESSIONS_TABLE_NAME)
+
+
+# ---------------------------
+# chat_summaries
+# ---------------------------
+def create_chat_summaries(cur):
+    """One row per chat session with the rolling summary of the messages older than its context window."""
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE_NAME} (
+            session_id TEXT PRIMARY KEY,
+            summary TEXT NOT NULL,
+            summarized_until TIMESTAMPTZ NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def ensure_chat_summaries():
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (SUMMARY_TABLE_NAME,))
+        create_chat_summaries(cur)
+
+
+# ---------------------------
+# Index check
+# ---------------------------
+# The hot queries from chat_history.py, with placeholder parameters
+HOT_QUERIES = {
+    "session messages": (
+        f"SELECT role, content, created_at FROM {TABLE_NAME} WHERE session_id = %s ORDER BY created_at ASC",
+        ("x",),
+    ),
+    "recent window": (
+        f"SELECT role, content, created_at FROM {TABLE_NAME} WHERE session_id = %s ORDER BY created_at DESC LIMIT %s",
+        ("x", 20),
+    ),
+    "messages page": (
+        f"""SELECT id, role, content, created_at FROM {TABLE_NAME}
+            WHERE user_id = %s AND session_id = %s AND role != 'system'
+              AND (created_at, id) < (NOW(), 0)
+            ORDER BY created_at DESC, id DESC LIMIT %s""",
+        ("x", "x", 51),
+    ),
+    "session owner": (
+        f"SELECT title IS NOT NULL FROM {SESSIONS_TABLE_NAME} WHERE user_id = %s AND session_id = %s LIMIT 1",
+        ("x", "x"),
+    ),
+    "sessions page": (
+        f"""SELECT session_id, first_time, title FROM {SESSIONS_TABLE_NAME}
+            WHERE user_id = %s AND (first_time, session_id) < (NOW(), '')
+            ORDER BY first_time DESC, session_id DESC LIMIT %s""",
+        ("x", 51),
+    ),
+}
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", ()):
+        yield from _plan_nodes(child)
+
+
+def check_indexes():
+    """
+    EXPLAIN each hot query and return {name: (index_backed, detail)}. Sequential
+    and bitmap scans are disabled for the check, so small tables (where the
+    planner would rightly scan anyway) still show whether an index exists that
+    serves both the filter and the ORDER BY; "+ sort" means it only serves the filter.
+    """
+    report = {}
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute("SET LOCAL enable_seqscan = off")
+        cur.execute("SET LOCAL enable_bitmapscan = off")
+        for name, (query, params) in HOT_QUERIES.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+            plan = cur.fetchone()[0]
+            plan = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            nodes = list(_plan_nodes(plan))
+            seq = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+            indexes = [n["Index Name"] for n in nodes if "Index Name" in n]
+            sort = any(n["Node Type"] in ("Sort", "Incremental Sort") for n in nodes)
+            if seq:
+                report[name] = (False, "seq scan on " + ", ".join(seq))
+            else:
+                report[name] = (True, ", ".join(indexes) + (" + sort" if sort else ""))
+        conn.rollback()
+    return report
+
+
+def log_index_report():
+    """Log a warning for every hot query that is not index-backed; returns True if all are."""
+    ok = True
+    for name, (backed, detail) in check_indexes().items():
+        if not backed:
+            ok = False
+            logging.warning("Query '%s' is not index-backed (%s)", name, detail)
+    return ok
+
+
+def ensure_schema(backfill=False, check=True):
+    """
+    Create/verify the chat tables. Adding the id key to an old chat_history and
+    backfilling chat_sessions lock the tables, so this never runs on a request.
+    """
+    ensure_chat_history()
+    ensure_chat_sessions(backfill=backfill)
+    ensure_chat_summaries()
+    if check:
+        try:
+            log_index_report()
+        except Exception as e:
+            logging.warning("Index check failed: %s", e)
+
+
+def migrate_on_startup():
+    """ensure_schema() for the web servers, before they take requests; failures are logged, not raised."""
+    if not CHAT_SCHEMA_ON_STARTUP:
+        return
+    try:
+        ensure_schema()
+    except Exception as e:
+        logging.warning("Chat schema migration failed at startup: %s", e)
+
+
+def ensure_tables():
+    """
+    The request path's check: one catalogue lookup. Creates the chat tables if
+    they don't exist (a new database), but leaves the slow parts of
+    ensure_schema to startup or the CLI.
+    """
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL, to_regclass(%s) IS NOT NULL",
+            (TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME),
+        )
+        has_history, has_sessions, has_summaries = cur.fetchone()
+        if has_history and has_sessions and has_summaries:
+            return
+        # The same locks as ensure_schema takes, in the same order
+        for name in (TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME):
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (name,))
+        if not _table_exists(cur, TABLE_NAME):
+            create_chat_history(cur)
+        if not _table_exists(cur, SESSIONS_TABLE_NAME):
+            create_chat_sessions(cur)
+            if has_history:
+                logging.warning("Created an empty %s; run `python migrations.py --backfill` to list existing chats",
+                                SESSIONS_TABLE_NAME)
+        if not _table_exists(cur, SUMMARY_TABLE_NAME):
+            create_chat_summaries(cur)
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    ensure_schema(backfill="--backfill" in argv, check=False)
+    print(f"{TABLE_NAME}: ok")
+    print(f"{SESSIONS_TABLE_NAME}: ok")
+    print(f"{SUMMARY_TABLE_NAME}: ok")
+    if "--check" in argv:
+        report = check_indexes()
+        for name, (backed, detail) in report.items():
+            print(f"  {'ok  ' if backed else 'SLOW'} {name}: {detail}")
+        if not all(backed for backed, _ in report.values()):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
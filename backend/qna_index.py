@@ -0,0 +1,54 @@
+# qna_index.py
+import os
+from dotenv import load_dotenv
+
+from qna_data import PREDEFINED_QAS
+from text_index import BM25Index, tokenize
+
+# Load environment variables
+load_dotenv()
+
+PREDEFINED_MATCH_THRESHOLD = float(os.getenv("PREDEFINED_MATCH_THRESHOLD", "0.8"))
+
+# Built once at import: the index only covers the predefined question keys
+_index = BM25Index()
+for _question in PREDEFINED_QAS:
+    _index.add(_question, _question)
+_self_scores = {q: _index.score(q, q) for q in PREDEFINED_QAS}
+
+
+def _headings(answer):
+    return " ".join(line for line in answer.splitlines() if line.startswith("#"))
+
+
+# Words a canned answer explains: its question's, its section headings
+# ("Engineering", "Top Private Universities"), so "is engineering a popular
+# major?" still counts as the popular-majors question, and Malaysia, which
+# every answer is about
+_covered_terms = {
+    q: set(tokenize(q)) | set(tokenize(_headings(a))) | {"malaysia", "malaysian"}
+    for q, a in PREDEFINED_QAS.items()
+}
+
+
+def match_predefined(text, threshold=PREDEFINED_MATCH_THRESHOLD):
+    """
+    Return (question, answer, confidence) when text is a near-duplicate of a
+    predefined question, else None. Confidence is the smaller of how much of
+    the question's BM25 weight the text covers and how much of the text the
+    question (or its answer's headings) explains, so extra or missing key
+    words both lower it.
+    """
+    terms = set(tokenize(text))
+    if not terms:
+        return None
+    results = _index.search(text, top_k=1)
+    if not results:
+        return None
+    question, score = results[0]
+    question_coverage = min(1.0, score / _self_scores[question]) if _self_scores[question] else 0.0
+    text_coverage = len(terms & _covered_terms[question]) / len(terms)
+    confidence = min(question_coverage, text_coverage)
+    if confidence < threshold:
+        return None
+    return question, PREDEFINED_QAS[question], confidence
@@ -0,0 +1,184 @@
+# request_dedup.py
+import os
+import re
+import queue
+import asyncio
+import hashlib
+import threading
+from dotenv import load_dotenv
+
+from caching import TTLCache
+from deadlines import CHAT_DEADLINE
+from admission import ADMISSION_MAX_WAIT
+
+# Load environment variables
+load_dotenv()
+
+CHAT_DEDUP_WINDOW = float(os.getenv("CHAT_DEDUP_WINDOW", "10"))   # seconds a finished turn absorbs duplicates; 0 disables
+INTERRUPTED_REPLY = "⚠️ The original request for this message was interrupted. Please try again."
+
+_END = object()
+
+
+def request_key(session_id, message):
+    """Duplicate submissions share a key: same chat session, same (whitespace/case-normalized) message."""
+    normalized = re.sub(r"\s+", " ", (message or "").strip().lower())
+    return f"{session_id}:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+class SharedRun:
+    """
+    One chat turn's event stream, shared between the request that runs it
+    (relay/arelay) and duplicate requests that attach to it (follow/afollow).
+    Followers first get the events published so far, then the rest live.
+    """
+
+    def __init__(self, on_close=None):
+        self._lock = threading.Lock()
+        self._events = []
+        self._subscribers = []
+        self._on_close = on_close
+        self.done = False
+        self.failed = False
+
+    def _subscribe(self, put):
+        with self._lock:
+            for event in self._events:
+                put(event)
+            if self.done:
+                put(_END)
+            else:
+                self._subscribers.append(put)
+
+    def _publish(self, event):
+        with self._lock:
+            self._events.append(event)
+            for put in self._subscribers:
+                put(event)
+
+    def _finish(self, failed):
+        with self._lock:
+            if self.done:
+                return
+            self.done = True
+            self.failed = failed
+            if failed and not any(e["event"] in ("final", "error") for e in self._events):
+                self._events.append({"event": "error", "reply": INTERRUPTED_REPLY})
+            # Late duplicates only need the outcome, not every token
+            self._events = [e for e in self._events if e["event"] != "token"]
+            for put in self._subscribers:
+                if failed:
+                    put(self._events[-1])
+                put(_END)
+            self._subscribers.clear()
+        if self._on_close:
+            self._on_close(self)
+
+    def _ended_in_error(self):
+        return bool(self._events) and self._events[-1]["event"] == "error"
+
+    def abandon(self):
+        """The leader gave up before running (e.g. it was not admitted)."""
+        self._finish(failed=True)
+
+    def relay(self, events):
+        """Yield events (the leader's own stream) while publishing them to followers."""
+        finished = False
+        try:
+            for event in events:
+                self._publish(event)
+                yield event
+            finished = True
+        finally:
+            self._finish(failed=not finished or self._ended_in_error())
+
+    async def arelay(self, events):
+        finished = False
+        try:
+            async for event in events:
+                self._publish(event)
+                yield event
+            finished = True
+        finally:
+            self._finish(failed=not finished or self._ended_in_error())
+
+    def follow(self, timeout=None):
+        events = queue.Queue()
+        self._subscribe(events.put)
+        while True:
+            try:
+                event = events.get(timeout=timeout)
+            except queue.Empty:
+                yield {"event": "error", "reply": INTERRUPTED_REPLY}
+                return
+            if event is _END:
+                return
+            yield event
+
+    async def afollow(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self._subscribe(lambda event: loop.call_soon_threadsafe(events.put_nowait, event))
+        while True:
+            try:
+                event = await asyncio.wait_for(events.get(), timeout)
+            except asyncio.TimeoutError:
+                yield {"event": "error", "reply": INTERRUPTED_REPLY}
+                return
+            if event is _END:
+                return
+            yield event
+
+
+class RequestDeduplicator:
+    """
+    Keyed on (session_id, message): while a turn is running, and for window
+    seconds after it finished, the same message in the same session attaches
+    to that turn instead of starting (and persisting) a new one. Running
+    turns are tracked until they end, however long admission and the run
+    take; turns that fail or are interrupted are forgotten at once so a retry
+    runs again.
+    """
+
+    def __init__(self, window=CHAT_DEDUP_WINDOW, max_entries=10000):
+        self.window = window
+        # A leader may queue for admission before its deadline starts
+        self.follow_timeout = ADMISSION_MAX_WAIT + CHAT_DEADLINE + 30
+        self._running = {}      # key -> SharedRun still in flight
+        self._runs = TTLCache(max_entries=max_entries, ttl=window)   # finished turns
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "duplicates": 0}
+
+    def claim(self, session_id, message):
+        """Return (run, is_leader). The leader must relay its events through run (or abandon it)."""
+        if self.window <= 0:
+            return SharedRun(), True
+        key = request_key(session_id, message)
+        with self._lock:
+            run = self._running.get(key) or self._runs.get(key)
+            if run is not None:
+                self._stats["duplicates"] += 1
+                return run, False
+            run = SharedRun(on_close=lambda finished: self._closed(key, finished))
+            self._running[key] = run
+            self._stats["runs"] += 1
+            return run, True
+
+    def _closed(self, key, run):
+        with self._lock:
+            if self._running.get(key) is not run:
+                return
+            del self._running[key]
+            # The window starts when the turn ends
+            if not run.failed:
+                self._runs.set(key, run)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["running"] = len(self._running)
+        data["tracked"] = len(self._runs)
+        return data
+
+
+chat_dedup = RequestDeduplicator()
@@ -0,0 +1,126 @@
+# router.py
+import re
+import time
+import logging
+import threading
+from langchain_core.messages import AIMessage, HumanMessage
+
+from qna_data import PREDEFINED_QAS
+from qna_index import match_predefined
+
+# The supervisor prompt's own "must hand off" triggers
+REALTIME_PATTERN = re.compile(
+    r"\b(today|current(ly)?|latest|weather|deadlines?|intakes?|ranking this year|rankings? (for |in )?this year|"
+    r"this (week|month|semester))\b",
+    re.IGNORECASE,
+)
+ON_TOPIC_PATTERN = re.compile(
+    r"\b(malaysian?|kuala lumpur|kl|penang|johor|selangor|sabah|sarawak|putrajaya|cyberjaya|melaka|malacca|ipoh|"
+    r"universit(y|ies)|college|campus|stud(y|ying|ies|ent|ents)|course|programm?e?s?|degree|diploma|foundation|"
+    r"bachelor|master'?s?|phd|postgrad\w*|undergrad\w*|major|scholarships?|tuition|fees?|visa|emgs|admissions?|"
+    r"apply|application|enrol\w*|intake|semester|accommodation|hostel|dorm|cost of living|living cost|"
+    r"health insurance|part[- ]time|internship|culture|halal|ringgit|rm\s?\d)\b",
+    re.IGNORECASE,
+)
+OFF_TOPIC_PATTERN = re.compile(
+    r"\b(write (me )?(a |an )?(poem|song|story|essay|code|script|program)|python|javascript|recipe|cook|"
+    r"bitcoin|crypto|stocks?|forex|lottery|football|soccer|nba|movie|netflix|celebrity|horoscope|"
+    r"joke|girlfriend|boyfriend|dating|video game|gaming)\b",
+    re.IGNORECASE,
+)
+
+REFUSAL_REPLY = (
+    "Hello! I'm Malaysia's study assistant, so I can only help with questions about **studying in Malaysia**, "
+    "student life, or Malaysian culture in a study context.\n\n"
+    "- Universities and programmes\n"
+    "- Scholarships, fees and cost of living\n"
+    "- Student visas and admissions\n\n"
+    "What would you like to know about studying in Malaysia?"
+)
+
+# Map category names (sent by the frontend's category buttons) to predefined Q&A
+CATEGORY_MAPPING = {
+    "popular-majors": "What are the most popular majors in Malaysia?",
+    "malaysia-visa-requirements": "How do I apply for a student visa in Malaysia?",
+    "scholarship-options": "What are the scholarship opportunities for international students?",
+    "top-malaysian-universities": "What are the top universities in Malaysia?",
+    "international-student-guide": "What is the cost of living for a student in Malaysia?"
+}
+
+
+def classify(text):
+    """Return (route, reason). Only clear-cut questions skip the supervisor."""
+    if match_predefined(text):
+        return "predefined", "near-duplicate of a predefined question"
+    on_topic = bool(ON_TOPIC_PATTERN.search(text))
+    if OFF_TOPIC_PATTERN.search(text) and not on_topic:
+        return "refusal", "off-topic"
+    if REALTIME_PATTERN.search(text) and on_topic:
+        return "internet_agent", "real-time question"
+    return "supervisor", "ambiguous"
+
+
+def predefined_reply(user_message):
+    """
+    Return (answer, is_category_click) for a category button click or a typed
+    near-duplicate of a predefined question, else (None, False).
+    """
+    # Check if this is a category button click
+    if user_message.startswith("I'm interested in "):
+        category = user_message.replace("I'm interested in ", "").strip()
+        question = CATEGORY_MAPPING.get(category)
+        if question in PREDEFINED_QAS:
+            return PREDEFINED_QAS[question], True
+
+    match = match_predefined(user_message)
+    if match:
+        return match[1], False
+    return None, False
+
+
+def _last_user_text(state):
+    for msg in reversed(state["messages"]):
+        if isinstance(msg, HumanMessage):
+            return msg.content if isinstance(msg.content, str) else str(msg.content)
+    return ""
+
+
+def route_question(state):
+    """Conditional edge from START: pick the first node for this question."""
+    start = time.perf_counter()
+    route, reason = classify(_last_user_text(state))
+    logging.info("Router chose %s (%s) in %.2f ms", route, reason, (time.perf_counter() - start) * 1000)
+    return route
+
+
+def predefined_node(state):
+    match = match_predefined(_last_user_text(state))
+    return {"messages": [AIMessage(content=match[1] if match else REFUSAL_REPLY, name="predefined")]}
+
+
+def refusal_node(state):
+    return {"messages": [AIMessage(content=REFUSAL_REPLY, name="refusal")]}
+
+
+# ---------------------------
+# Per-route latency
+# ---------------------------
+_route_stats = {}
+_route_stats_lock = threading.Lock()
+
+
+def record_route_latency(route, seconds):
+    with _route_stats_lock:
+        stats = _route_stats.setdefault(route, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += seconds * 1000
+        stats["max_ms"] = max(stats["max_ms"], seconds * 1000)
+    logging.info("Route %s answered in %.0f ms", route, seconds * 1000)
+
+
+def route_stats():
+    with _route_stats_lock:
+        return {
+            route: dict(stats, avg_ms=stats["total_ms"] / stats["count"])
+            for route, stats in _route_stats.items()
+        }
@@ -0,0 +1,120 @@
+# search_cache.py
+import os
+import re
+import json
+import threading
+from dotenv import load_dotenv
+from langchain_core.tools import StructuredTool
+
+from caching import TTLCache, SingleFlight
+from deadlines import ToolTimeout, call_with_timeout, time_left
+
+# Load environment variables
+load_dotenv()
+
+TAVILY_CACHE_TTL = float(os.getenv("TAVILY_CACHE_TTL", "3600"))
+TAVILY_CACHE_MAX_ENTRIES = int(os.getenv("TAVILY_CACHE_MAX_ENTRIES", "500"))
+
+_MISSING = object()
+
+
+def normalize_query(query):
+    query = re.sub(r"\s+", " ", (query or "").lower()).strip()
+    return query.strip(" ?!.,;:")
+
+
+def cache_key(args):
+    """Key on the normalized query plus any other search options that were set."""
+    key = {k: v for k, v in args.items() if v is not None}
+    key["query"] = normalize_query(key.get("query"))
+    return json.dumps(key, sort_keys=True, default=str)
+
+
+class CachedSearch:
+    """
+    TTL/LRU cache with single-flight coalescing in front of a search backend
+    (anything with invoke(dict), e.g. TavilySearch or a local fake). When timeout
+    is set, a search gives up with ToolTimeout after timeout seconds or when the
+    request's deadline runs out, whichever is sooner.
+    """
+
+    def __init__(self, backend, ttl=TAVILY_CACHE_TTL, max_entries=TAVILY_CACHE_MAX_ENTRIES, timeout=None):
+        self.backend = backend
+        self.timeout = timeout
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._stats = {"backend_calls": 0, "backend_errors": 0, "timeouts": 0}
+
+    def search(self, **args):
+        key = cache_key(args)
+        cached = self.cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+        timeout = time_left(self.timeout) if self.timeout else None
+        try:
+            result, _shared = self.flight.do(key, lambda: self._call_backend(key, args, timeout), timeout=timeout)
+        except TimeoutError as e:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise ToolTimeout(f"Search timed out: {e}") from e
+        return result
+
+    def _call_backend(self, key, args, timeout=None):
+        with self._lock:
+            self._stats["backend_calls"] += 1
+        try:
+            if timeout is None:
+                result = self.backend.invoke(args)
+            else:
+                result = call_with_timeout(lambda: self.backend.invoke(args), timeout)
+        except TimeoutError:
+            raise
+        except Exception:
+            with self._lock:
+                self._stats["backend_errors"] += 1
+            raise
+        # Never cache failures
+        if not (isinstance(result, dict) and result.get("error")):
+            self.cache.set(key, result)
+        return result
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        flight_stats = self.flight.stats()
+        with self._lock:
+            data = dict(self._stats)
+        data.update({
+            "hits": cache_stats["hits"],
+            "misses": cache_stats["misses"],
+            "hit_ratio": cache_stats["hit_ratio"],
+            "entries": cache_stats["entries"],
+            "evictions": cache_stats["evictions"],
+            "coalesced": flight_stats["coalesced"],
+            "saved_calls": cache_stats["hits"] + flight_stats["coalesced"],
+        })
+        return data
+
+
+def make_cached_search_tool(search_tool, cached_search, postprocess=None):
+    """
+    Wrap search_tool so the agent sees the same name, description and arguments.
+    postprocess(query, result), if given, runs on every result (cached or not).
+    A timed-out search is reported to the agent as an error result instead of
+    failing the whole run.
+    """
+    def _search(**kwargs):
+        try:
+            result = cached_search.search(**kwargs)
+        except ToolTimeout as e:
+            return {"error": str(e)}
+        if postprocess is not None:
+            result = postprocess(kwargs.get("query", ""), result)
+        return result
+
+    return StructuredTool.from_function(
+        func=_search,
+        name=search_tool.name,
+        description=search_tool.description,
+        args_schema=search_tool.args_schema,
+    )
@@ -0,0 +1,106 @@
+# search_compression.py
+import os
+import re
+import json
+import logging
+import threading
+from dotenv import load_dotenv
+
+from context_builder import count_tokens
+from text_index import BM25Index, tokenize
+
+# Load environment variables
+load_dotenv()
+
+SEARCH_RESULT_TOKEN_BUDGET = int(os.getenv("SEARCH_RESULT_TOKEN_BUDGET", "700"))
+DUPLICATE_OVERLAP = 0.8   # sentences sharing this much vocabulary with a kept one are dropped
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\n+")
+_stats = {"calls": 0, "tokens_in": 0, "tokens_out": 0}
+_stats_lock = threading.Lock()
+
+
+def split_sentences(text):
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text or "") if len(s.strip()) > 20]
+
+
+def _is_duplicate(terms, kept_terms):
+    if not terms:
+        return True
+    for other in kept_terms:
+        overlap = len(terms & other) / min(len(terms), len(other))
+        if overlap >= DUPLICATE_OVERLAP:
+            return True
+    return False
+
+
+def compress_results(query, payload, token_budget=SEARCH_RESULT_TOKEN_BUDGET):
+    """
+    Reduce a Tavily response to the sentences most relevant to query: split
+    every result into sentences, drop near-duplicates and sentences unrelated
+    to the query, rank by BM25 (ties favour higher-ranked sources) and keep
+    sentences until token_budget is reached. Every source keeps its title and
+    URL for citation, with a content field only if some of its sentences survived.
+    """
+    if not isinstance(payload, dict) or not payload.get("results"):
+        return payload
+
+    tokens_in = count_tokens(json.dumps(payload, default=str))
+    sources = payload["results"]
+
+    index = BM25Index()
+    sentences = {}
+    for source_rank, result in enumerate(sources):
+        for position, sentence in enumerate(split_sentences(result.get("content"))):
+            sentence_id = (source_rank, position)
+            sentences[sentence_id] = sentence
+            index.add(sentence_id, sentence)
+
+    relevance = dict(index.search(query, top_k=len(sentences)))
+    ranked = sorted(sentences, key=lambda sid: (-relevance.get(sid, 0.0), sid))
+
+    # Sentences sharing no terms with the query only pad the prompt, unless nothing matches
+    if relevance:
+        ranked = [sid for sid in ranked if relevance.get(sid, 0.0) > 0]
+
+    kept = set()
+    kept_terms = []
+    used = 0
+    for sentence_id in ranked:
+        sentence = sentences[sentence_id]
+        terms = set(tokenize(sentence))
+        if _is_duplicate(terms, kept_terms):
+            continue
+        cost = count_tokens(sentence)
+        if used + cost > token_budget:
+            continue
+        kept.add(sentence_id)
+        kept_terms.append(terms)
+        used += cost
+
+    compressed = []
+    for source_rank, result in enumerate(sources):
+        content = " ".join(sentences[sid] for sid in sorted(kept) if sid[0] == source_rank)
+        entry = {"title": result.get("title"), "url": result.get("url")}
+        if content:
+            entry["content"] = content
+        compressed.append(entry)
+
+    output = {"query": payload.get("query", query), "results": compressed}
+    if payload.get("answer"):
+        output["answer"] = payload["answer"]
+    tokens_out = count_tokens(json.dumps(output, default=str))
+
+    with _stats_lock:
+        _stats["calls"] += 1
+        _stats["tokens_in"] += tokens_in
+        _stats["tokens_out"] += tokens_out
+    logging.info("Search results compressed from %d to %d tokens", tokens_in, tokens_out)
+    return output
+
+
+def compression_stats():
+    with _stats_lock:
+        data = dict(_stats)
+    data["tokens_saved"] = data["tokens_in"] - data["tokens_out"]
+    return data
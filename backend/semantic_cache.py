@@ -0,0 +1,213 @@
+# semantic_cache.py
+import os
+import re
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+from db import get_engine
+from sql_templates import UniversityNames
+
+# Load environment variables
+load_dotenv()
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_EMBEDDING_MODEL = os.getenv("SEMANTIC_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")  # or "local"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600)))
+SEMANTIC_CACHE_TIME_SENSITIVE_TTL = float(os.getenv("SEMANTIC_CACHE_TIME_SENSITIVE_TTL", "900"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+
+# Same triggers the supervisor prompt treats as needing real-time information
+TIME_SENSITIVE_PATTERN = re.compile(
+    r"\b(today|tonight|tomorrow|now|current(ly)?|latest|recent|news|weather|deadlines?|intakes?|"
+    r"this (week|month|year|semester)|upcoming|ranking this year|20\d\d)\b",
+    re.IGNORECASE,
+)
+# Follow-ups that only make sense with the earlier conversation
+CONTEXT_DEPENDENT_PATTERN = re.compile(
+    r"\b(it|its|they|them|their|those|these|this one|the same|above|previous|tell me more|what else)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_question(text):
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def is_time_sensitive(text):
+    return bool(TIME_SENSITIVE_PATTERN.search(text))
+
+
+def is_cacheable(text, has_history=False):
+    """Short or context-dependent follow-up questions are never answered from the cache."""
+    words = normalize_question(text).split()
+    if len(words) < 3:
+        return False
+    return not (has_history and CONTEXT_DEPENDENT_PATTERN.search(text))
+
+
+class HashingEmbeddings:
+    """
+    Local stand-in for an embeddings model: hashes words and
+    word bigrams into a fixed-size vector. Good enough to match rephrasings that
+    share vocabulary, and useful for tests and offline runs.
+    """
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dimensions)
+        words = normalize_question(text).split()
+        features = words + [a + " " + b for a, b in zip(words, words[1:])]
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign
+        return vector.tolist()
+
+
+class SemanticCache:
+    """
+    LRU cache of answers keyed on question embeddings. A lookup hits when an
+    unexpired entry's cosine similarity with the question is at least
+    threshold and both name the same entities (entities(question), e.g. the
+    universities it names; paraphrases about different universities embed
+    alike). Time-sensitive questions are stored for time_sensitive_ttl, and a
+    time-sensitive lookup only accepts entries stored within that long.
+    """
+
+    def __init__(self, embeddings, threshold=SEMANTIC_CACHE_THRESHOLD, ttl=SEMANTIC_CACHE_TTL,
+                 time_sensitive_ttl=SEMANTIC_CACHE_TIME_SENSITIVE_TTL, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 clock=time.monotonic, entities=None):
+        self.embeddings = embeddings
+        self.entities = entities
+        self.threshold = threshold
+        self.ttl = ttl
+        self.time_sensitive_ttl = time_sensitive_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()   # normalized question -> (unit vector, answer, expires_at, stored_at, entities)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "exact_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    def _embed(self, question):
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=float)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, question):
+        """Return the cached answer for question (or a close paraphrase), else None."""
+        return self.lookup_with_vector(question)[0]
+
+    def lookup_with_vector(self, question):
+        """
+        (answer or None, question's embedding or None). Pass the embedding on to
+        store() after a miss so the question isn't embedded twice.
+        """
+        key = normalize_question(question)
+        max_age = self.time_sensitive_ttl if is_time_sensitive(question) else None
+        with self._lock:
+            self._expire_locked()
+            entry = self._entries.get(key)
+            if entry is not None and self._fresh(entry, max_age):
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["exact_hits"] += 1
+                return entry[1], entry[0]
+            if not self._entries:
+                self._stats["misses"] += 1
+                return None, None
+
+        try:
+            vector = self._embed(question)
+        except Exception as e:
+            logging.warning("Answer cache lookup skipped, embedding failed: %s", e)
+            with self._lock:
+                self._stats["misses"] += 1
+            return None, None
+        entities = self._entities(question)
+        with self._lock:
+            keys = [k for k, entry in self._entries.items() if entry[4] == entities and self._fresh(entry, max_age)]
+            if not keys:
+                self._stats["misses"] += 1
+                return None, vector
+            matrix = np.stack([self._entries[k][0] for k in keys])
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self._entries.move_to_end(keys[best])
+                self._stats["hits"] += 1
+                return self._entries[keys[best]][1], vector
+            self._stats["misses"] += 1
+            return None, vector
+
+    def store(self, question, answer, vector=None):
+        """Cache answer for question; vector is the question's embedding from lookup_with_vector, if any."""
+        key = normalize_question(question)
+        ttl = self.time_sensitive_ttl if is_time_sensitive(question) else self.ttl
+        if ttl <= 0:
+            return
+        if vector is None:
+            try:
+                vector = self._embed(question)
+            except Exception as e:
+                logging.warning("Answer not cached, embedding failed: %s", e)
+                return
+        entities = self._entities(question)
+        with self._lock:
+            now = self._clock()
+            self._entries[key] = (vector, answer, now + ttl, now, entities)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._entries)
+        lookups = data["hits"] + data["misses"]
+        data["hit_ratio"] = data["hits"] / lookups if lookups else 0.0
+        return data
+
+    def _entities(self, question):
+        return self.entities(question) if self.entities is not None else None
+
+    def _fresh(self, entry, max_age):
+        return max_age is None or self._clock() - entry[3] <= max_age
+
+    def _expire_locked(self):
+        now = self._clock()
+        expired = [k for k, entry in self._entries.items() if entry[2] <= now]
+        for key in expired:
+            del self._entries[key]
+        self._stats["expirations"] += len(expired)
+
+
+def _default_embeddings():
+    if SEMANTIC_CACHE_EMBEDDING_MODEL == "local":
+        return HashingEmbeddings()
+    try:
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings(model=SEMANTIC_CACHE_EMBEDDING_MODEL)
+    except Exception as e:
+        logging.warning("OpenAI embeddings unavailable for the answer cache, using local hashing: %s", e)
+        return HashingEmbeddings()
+
+
+# Names are loaded from the catalogue on the first lookup, not at import
+answer_cache = SemanticCache(_default_embeddings(), entities=UniversityNames(get_engine()).ids_in) \
+    if SEMANTIC_CACHE_ENABLED else None
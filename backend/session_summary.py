@@ -0,0 +1,133 @@
+# session_summary.py
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+from psycopg2.extras import RealDictCursor
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage, HumanMessage
+
+from db import get_pool
+from chat_history import rows_to_messages
+from context_builder import HISTORY_MAX_MESSAGE_TOKENS, truncate_to_tokens
+from migrations import SUMMARY_TABLE_NAME
+
+# Load environment variables
+load_dotenv()
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("SUMMARY_MIN_NEW_MESSAGES", "4"))   # batch LLM calls
+SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", "40"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "250"))
+
+llm = ChatOpenAI(model=SUMMARY_MODEL, temperature=0)
+
+summary_system_prompt = f"""
+You maintain a running summary of a conversation between an international student and an AI assistant about studying in Malaysia.
+Update the existing summary with the new messages. Keep facts about the student (nationality, budget, level of study, field, preferred universities or cities, deadlines mentioned) and the key answers already given.
+Drop greetings and repeated formatting. Write at most {SUMMARY_MAX_WORDS} words of plain text.
+"""
+
+_updating = set()
+_updating_lock = threading.Lock()
+
+
+def get_summary(session_id):
+    """Return the stored summary row (summary, summarized_until, message_count) or None."""
+    try:
+        with get_pool().connection() as conn, conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                f"SELECT summary, summarized_until, message_count FROM {SUMMARY_TABLE_NAME} WHERE session_id = %s",
+                (str(session_id),),
+            )
+            return cur.fetchone()
+    except Exception as e:
+        logging.warning("Error fetching session summary: %s", e)
+        return None
+
+
+def unsummarized_messages(history, summary, window_start):
+    """
+    Messages that have left the context window (older than window_start) but
+    are not in the summary yet: update_summary waits for SUMMARY_MIN_NEW_MESSAGES
+    of them, so without these the model would lose up to that many messages.
+    The newest SUMMARY_MIN_NEW_MESSAGES at most; more are only pending while an
+    update runs. Long answers are truncated like the window's.
+    """
+    if window_start is None:
+        return []
+    summarized_until = summary["summarized_until"] if summary else None
+    rows = history.rows_between(after=summarized_until, before=window_start, limit=SUMMARY_MIN_NEW_MESSAGES,
+                                newest=True)
+    return rows_to_messages([
+        row if row["role"] == "user" else dict(row, content=truncate_to_tokens(row["content"], HISTORY_MAX_MESSAGE_TOKENS))
+        for row in rows
+    ])
+
+
+def with_summary(messages, summary, unsummarized=()):
+    """
+    Prepend the rolling summary (if any) and the messages between it and the
+    recent window (see unsummarized_messages) to the recent message window.
+    """
+    messages = list(unsummarized) + list(messages)
+    if not summary or not summary.get("summary"):
+        return messages
+    note = SystemMessage(content="Summary of the earlier part of this conversation:\n" + summary["summary"])
+    return [note] + messages
+
+
+def update_summary(history, window_start, summary=None):
+    """
+    Fold messages that have fallen out of the context window (older than
+    window_start and newer than what is already summarized) into the summary.
+    Returns True if the summary was updated.
+    """
+    if window_start is None:
+        return False
+    summarized_until = summary["summarized_until"] if summary else None
+    rows = history.rows_between(after=summarized_until, before=window_start, limit=SUMMARY_MAX_BATCH)
+    if len(rows) < SUMMARY_MIN_NEW_MESSAGES:
+        return False
+
+    transcript = "\n".join(
+        f"{'Student' if row['role'] == 'user' else 'Assistant'}: {row['content']}" for row in rows
+    )
+    previous = summary["summary"] if summary else "(none yet)"
+    result = llm.invoke([
+        SystemMessage(content=summary_system_prompt),
+        HumanMessage(content=f"Existing summary:\n{previous}\n\nNew messages:\n{transcript}"),
+    ])
+
+    with get_pool().connection() as conn, conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {SUMMARY_TABLE_NAME} (session_id, summary, summarized_until, message_count, updated_at)
+            VALUES (%s, %s, %s, %s, NOW())
+            ON CONFLICT (session_id) DO UPDATE
+               SET summary = EXCLUDED.summary,
+                   summarized_until = EXCLUDED.summarized_until,
+                   message_count = {SUMMARY_TABLE_NAME}.message_count + EXCLUDED.message_count,
+                   updated_at = NOW()
+        """, (history.session_id, result.content, rows[-1]["created_at"], len(rows)))
+    return True
+
+
+def schedule_summary_update(history, window_start):
+    """Run update_summary in the background so it never delays a reply."""
+    session_id = history.session_id
+    with _updating_lock:
+        if session_id in _updating:
+            return
+        _updating.add(session_id)
+
+    def _run():
+        try:
+            # Re-read the summary so concurrent turns never fold the same rows twice
+            update_summary(history, window_start, get_summary(session_id))
+        except Exception:
+            logging.exception("Error updating session summary")
+        finally:
+            with _updating_lock:
+                _updating.discard(session_id)
+
+    threading.Thread(target=_run, daemon=True).start()
@@ -2,35 +2,65 @@ from langchain_openai import ChatOpenAI
 from langchain_community.utilities import SQLDatabase
 from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
 from langgraph.prebuilt import create_react_agent
-from sqlalchemy import create_engine
 import os
 from dotenv import load_dotenv
-from langchain_core.messages import ToolMessage
+from langchain_core.messages import ToolMessage, SystemMessage, HumanMessage
 from langgraph.graph import MessagesState
 from typing import Optional
 from langchain_core.runnables import RunnableConfig
 
+from sqlalchemy import event
+
+from db import get_engine
+from sql_schema import SQL_INCLUDE_TABLES, load_or_build_snapshot, render_schema, make_schema_tool
+from sql_cache import SQLQueryCache, make_cached_query_tool, register_shared_cache
+from sql_templates import SQL_TEMPLATES_ENABLED, TemplateMatcher
+from catalogue_index import catalogue_search_tool
+from deadlines import LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, SQL_STATEMENT_TIMEOUT, time_left
+
 # Load environment variables
 load_dotenv()
 os.environ["LANGCHAIN_TRACING_V2"] = "true"
 
 # Setup API keys
 openai_key = os.getenv("OPENAI_API_KEY")
-db_url = os.getenv("NEON_API_URL")
 
 # Setup LLM
-llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES)
 
-# SQL Connection
-engine = create_engine(db_url)
-db = SQLDatabase.from_uri(
-    db_url,
-    include_tables=["Scholarships", "Universities", "VisaInfo", "Ranking", "Programs", "HealthInsurance","Eligibility","DocumentsRequired","Admissions"]
-)
+# SQL Connection (shared pool, see db.py)
+engine = get_engine()
+# Same pool, but every agent transaction gets a statement timeout capped by the request deadline
+sql_engine = engine.execution_options()
+
+
+@event.listens_for(sql_engine, "begin")
+def _set_statement_timeout(conn):
+    timeout_ms = max(1, int(time_left(SQL_STATEMENT_TIMEOUT) * 1000))
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {timeout_ms}")
+
+
+# Schema snapshot from disk (built on first run; refresh with `python sql_schema.py --refresh`)
+schema_snapshot = load_or_build_snapshot(engine)
+
+# No reflection at startup: the agent reads the schema from the snapshot
+db = SQLDatabase(sql_engine, include_tables=SQL_INCLUDE_TABLES, lazy_table_reflection=True)
+
+# Results of read-only catalogue queries, shared across requests until the tables change
+sql_query_cache = SQLQueryCache(db, sql_engine, SQL_INCLUDE_TABLES)
+register_shared_cache(sql_query_cache)
 
 # SQL Tool Setup
 toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-tools = toolkit.get_tools()
+# The table list is in the prompt and sql_db_schema answers from the snapshot
+tools = [
+    make_cached_query_tool(t, sql_query_cache) if t.name == "sql_db_query" else t
+    for t in toolkit.get_tools()
+    if t.name not in ("sql_db_list_tables", "sql_db_schema")
+]
+tools.append(make_schema_tool(schema_snapshot))
+if catalogue_search_tool is not None:
+    tools.append(catalogue_search_tool)
 
 
 # Agent system prompt
@@ -39,12 +69,11 @@ You are Malaysia's SQL AI assistant. Your job is to answer user questions using
 
 GENERAL QUERY FLOW
 
-1. **Always** call `sql_table_list` first to get the list of tables. **Never skip this step.**
-2. **Then** call `info-sql` to get the schema for the relevant tables. **Never assume column names.**
-3. **Next**, generate a syntactically correct {dialect} SQL query based on the user's request, using the 'sql_db_query' tool.
-4. **Validate** your query using the `sql_db_query_checker` before execution.
-5. **Execute** the query and return accurate, detailed results in plain language. Include related columns for more comprehensive information.
-6. **If you cannot find enough data, signal the supervisor to use the Internet agent for additional information.**
+1. The tables you can query, with their columns and sample rows, are under DATABASE SCHEMA below. Use only those tables and columns. **Never assume column names.** There is no need to list tables or fetch the schema first.
+2. **Generate** a syntactically correct {dialect} SQL query based on the user's request, using the 'sql_db_query' tool.
+3. **Validate** your query using the `sql_db_query_checker` before execution.
+4. **Execute** the query and return accurate, detailed results in plain language. Include related columns for more comprehensive information.
+5. **If you cannot find enough data, signal the supervisor to use the Internet agent for additional information.**
 
 ============================
 UNIVERSITY and IT's PROGRAMS & SCHOLARSHIP DETAILS
@@ -64,8 +93,14 @@ SMART QUERYING TIPS
 - **Limit** to `{top_k}` results unless the user asks for more.
 - **Never assume column names.** For example, if the user asks about accommodation cost, you can't use avgFee as accommodation cost. If not found, say you couldn't find it and the supervisor can use the internet agent.
 - **Always** use descending order by the most relevant column to surface the most useful rows.
+- For fuzzy lookups (universities by location, program, description or scholarship), call `catalogue_search` first: it is instant and shows which universities and rows match, so you can query them exactly instead of guessing `ILIKE` patterns.
 
-""".format(dialect="postgresql", top_k=5)
+""".format(dialect="postgresql", top_k=5) + f"""
+============================
+DATABASE SCHEMA (snapshot {schema_snapshot["version"]})
+============================
+{render_schema(schema_snapshot)}
+"""
 
 sql_agent = create_react_agent(
     llm,
@@ -75,6 +110,43 @@ sql_agent = create_react_agent(
 )
 
 
+# ---------------------------
+# Template fast path
+# ---------------------------
+template_matcher = TemplateMatcher(schema_snapshot, sql_engine) if SQL_TEMPLATES_ENABLED else None
+
+TEMPLATE_ANSWER_PROMPT = """
+You are Malaysia's SQL AI assistant. Answer the user's question using only the database rows below, in plain language.
+Include the related columns for a comprehensive answer (names, amounts, fees, deadlines, websites, contacts, ...).
+If the rows don't fully answer the question, say what they do cover and that the supervisor can use the Internet agent for the rest.
+"""
+
+
+def answer_from_template(question):
+    """Answer from a matching SQL template (one query, one LLM call), or None to use the full agent."""
+    if template_matcher is None or not question:
+        return None
+    match = template_matcher.match(question)
+    if match is None:
+        return None
+    rows = sql_query_cache.query(match.sql, match.parameters, include_columns=True)
+    if not rows or (isinstance(rows, str) and rows.startswith("Error:")):
+        template_matcher.record_empty(match)
+        return None
+    reply = llm.invoke([
+        SystemMessage(content=TEMPLATE_ANSWER_PROMPT),
+        HumanMessage(content=f"Question: {question}\n\nRows from \"{match.template.table}\":\n{rows}"),
+    ])
+    return reply.content
+
+
+def _last_question(messages):
+    for msg in reversed(messages):
+        if isinstance(msg, HumanMessage):
+            return msg.content
+    return None
+
+
 def sql_agent_node(state: MessagesState, config: Optional[RunnableConfig] = None) -> ToolMessage:
     # Find tool_call_id from incoming messages
     tool_call_id = None
@@ -87,6 +159,11 @@ def sql_agent_node(state: MessagesState, config: Optional[RunnableConfig] = None
     if not tool_call_id:
         tool_call_id = "unknown"
 
+    # Common lookups skip the ReAct loop
+    answer = answer_from_template(_last_question(state["messages"]))
+    if answer is not None:
+        return ToolMessage(tool_call_id=tool_call_id, content=answer)
+
     # Pass both state and config to invoke
     result_message = sql_agent.invoke(state, config=config) if config else sql_agent.invoke(state)
 
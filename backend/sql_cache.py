@@ -0,0 +1,233 @@
+# sql_cache.py
+import os
+import re
+import json
+import time
+import logging
+import threading
+from dotenv import load_dotenv
+from sqlalchemy import text
+from langchain_core.tools import StructuredTool
+
+from caching import TTLCache, SingleFlight
+
+# Load environment variables
+load_dotenv()
+
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "3600"))                    # seconds; 0 disables the cache
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1000"))
+SQL_CACHE_MAX_RESULT_CHARS = int(os.getenv("SQL_CACHE_MAX_RESULT_CHARS", "20000"))  # larger results aren't kept
+SQL_CACHE_VERSION_INTERVAL = float(os.getenv("SQL_CACHE_VERSION_INTERVAL", "30"))   # seconds between table-change checks
+
+_MISSING = object()
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+_READ_ONLY = re.compile(r"^(select|with)\b")
+_WRITES = re.compile(r"\b(insert|update|delete|merge|create|alter|drop|truncate|grant|revoke|copy|call|do)\b")
+# Results that depend on when (or how often) the query runs
+_VOLATILE = re.compile(r"\b(now|random|clock_timestamp|statement_timestamp|timeofday|current_date|current_time"
+                       r"|current_timestamp|localtime|localtimestamp|nextval|setval)\b")
+
+
+def normalize_sql(sql):
+    """
+    Collapse whitespace, lowercase and drop a trailing semicolon outside string
+    literals and quoted identifiers, which are kept exactly as written.
+    """
+    parts = []
+    last = 0
+    for match in _LITERAL.finditer(sql or ""):
+        parts.append(re.sub(r"\s+", " ", sql[last:match.start()].lower()))
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(re.sub(r"\s+", " ", (sql or "")[last:].lower()))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _unquoted(normalized):
+    return _LITERAL.sub(" ", normalized)
+
+
+def table_versions(engine, tables):
+    """
+    {table: version} for tables, changing whenever rows are written (pg_stat_user_tables
+    change counters) or the table is rewritten or truncated (file node).
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text("""
+                SELECT relname, pg_relation_filenode(relid), n_tup_ins + n_tup_upd + n_tup_del
+                FROM pg_stat_user_tables
+                WHERE relname = ANY(:tables)
+            """),
+            {"tables": list(tables)},
+        ).fetchall()
+    return {name: f"{filenode}:{changes}" for name, filenode, changes in rows}
+
+
+class SQLQueryCache:
+    """
+    TTL/LRU cache with single-flight coalescing in front of read-only queries on
+    a SQLDatabase. Entries remember the version of every table they read; a
+    table's version comes from pg_stat_user_tables (change counters plus file
+    node, so TRUNCATE and rewrites count too) and is re-read at most every
+    version_interval seconds, so a hit costs no database round trip and a
+    change to a table drops its entries within that interval (plus the
+    server's statistics delay, about a second).
+    Only single SELECT/WITH statements on the given tables without volatile
+    functions are cached; errors and results over max_result_chars never are.
+    """
+
+    def __init__(self, db, engine, tables, ttl=SQL_CACHE_TTL, max_entries=SQL_CACHE_MAX_ENTRIES,
+                 max_result_chars=SQL_CACHE_MAX_RESULT_CHARS, version_interval=SQL_CACHE_VERSION_INTERVAL):
+        self.db = db
+        self.engine = engine
+        self.tables = list(tables)
+        self.enabled = ttl > 0
+        self.max_result_chars = max_result_chars
+        self.version_interval = version_interval
+        self.cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._versions_at = None
+        self._refreshing = threading.Lock()
+        self._table_patterns = {
+            t: re.compile(r'"%s"|\b%s\b' % (re.escape(t), re.escape(t.lower()))) for t in self.tables
+        }
+        self._stats = {"db_queries": 0, "uncacheable": 0, "stale": 0, "too_large": 0, "version_checks": 0}
+
+    # ---------------------------
+    # Lookup
+    # ---------------------------
+    def query(self, sql, parameters=None, include_columns=False):
+        """Result of db.run_no_throw(sql, ...), from the cache when it is still valid."""
+        normalized = normalize_sql(sql)
+        tables = self.tables_read(normalized) if self.enabled else None
+        if not tables:
+            with self._lock:
+                self._stats["uncacheable"] += 1
+            return self._run(sql, parameters, include_columns)
+
+        key = json.dumps([normalized, parameters, include_columns], sort_keys=True, default=str)
+        versions = self._current_versions(tables)
+        cached = self.cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            result, cached_versions = cached
+            if cached_versions == versions:
+                return result
+            self.cache.delete(key)
+            with self._lock:
+                self._stats["stale"] += 1
+        result, _shared = self.flight.do(
+            key, lambda: self._run_and_store(key, sql, parameters, include_columns, versions)
+        )
+        return result
+
+    def tables_read(self, normalized):
+        """The cached tables a read-only statement uses, or None if it must not be cached."""
+        unquoted = _unquoted(normalized)
+        if ";" in unquoted or not _READ_ONLY.match(unquoted) or _WRITES.search(unquoted) or _VOLATILE.search(unquoted):
+            return None
+        # Identifiers keep their quotes in normalized text, so match them there
+        without_strings = re.sub(r"'(?:[^']|'')*'", " ", normalized)
+        tables = tuple(t for t, pattern in self._table_patterns.items() if pattern.search(without_strings))
+        return tables or None
+
+    def _run(self, sql, parameters, include_columns=False):
+        with self._lock:
+            self._stats["db_queries"] += 1
+        return self.db.run_no_throw(sql, include_columns=include_columns, parameters=parameters)
+
+    def _run_and_store(self, key, sql, parameters, include_columns, versions):
+        result = self._run(sql, parameters, include_columns)
+        # run_no_throw reports failures as "Error: ..." strings; never cache those
+        if isinstance(result, str) and result.startswith("Error:"):
+            return result
+        if len(str(result)) > self.max_result_chars:
+            with self._lock:
+                self._stats["too_large"] += 1
+            return result
+        self.cache.set(key, (result, versions))
+        return result
+
+    # ---------------------------
+    # Table versions
+    # ---------------------------
+    def _current_versions(self, tables):
+        now = time.monotonic()
+        if self._versions_at is None or now - self._versions_at >= self.version_interval:
+            # One caller refreshes; the others keep using the versions they have
+            if self._refreshing.acquire(blocking=self._versions_at is None):
+                try:
+                    self._refresh_versions()
+                finally:
+                    self._refreshing.release()
+        versions = self._versions
+        return tuple(versions.get(t) for t in tables)
+
+    def _refresh_versions(self):
+        try:
+            versions = table_versions(self.engine, self.tables)
+        except Exception as e:
+            # Keep the old versions; TTL still bounds how stale an entry can get
+            logging.warning("SQL cache version check failed: %s", e)
+            self._versions_at = time.monotonic()
+            return
+        self._versions = versions
+        self._versions_at = time.monotonic()
+        with self._lock:
+            self._stats["version_checks"] += 1
+
+    def invalidate(self):
+        """Drop everything, e.g. after loading new catalogue data from this process."""
+        self.cache.clear()
+        self._versions_at = None
+
+    def stats(self):
+        cache_stats = self.cache.stats()
+        flight_stats = self.flight.stats()
+        with self._lock:
+            data = dict(self._stats)
+        # A stale entry is a cache hit but still costs a query
+        hits = cache_stats["hits"] - data["stale"]
+        lookups = cache_stats["hits"] + cache_stats["misses"]
+        data.update({
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "entries": cache_stats["entries"],
+            "evictions": cache_stats["evictions"],
+            "coalesced": flight_stats["coalesced"],
+        })
+        return data
+
+
+# ---------------------------
+# Process-wide stats
+# ---------------------------
+_shared_cache = None
+
+
+def register_shared_cache(query_cache):
+    """Called by sql_agent for the cache its tools use; shared_cache_stats() reports it."""
+    global _shared_cache
+    _shared_cache = query_cache
+
+
+def shared_cache_stats():
+    """Stats of sql_agent's cache, or None when sql_agent isn't loaded in this process (never imports it)."""
+    return _shared_cache.stats() if _shared_cache is not None else None
+
+
+def make_cached_query_tool(query_tool, query_cache):
+    """Wrap the toolkit's sql_db_query tool so the agent sees the same name, description and arguments."""
+
+    def _query(query):
+        return query_cache.query(query)
+
+    return StructuredTool.from_function(
+        func=_query,
+        name=query_tool.name,
+        description=query_tool.description,
+        args_schema=query_tool.args_schema,
+    )
@@ -0,0 +1,201 @@
+# sql_schema.py
+# Versioned snapshot of the catalogue tables the SQL agent may query. It is kept
+# on disk and put into the agent's prompt, so the agent does not have to list
+# tables and fetch their schema with tool calls on every question.
+#   python sql_schema.py             show the snapshot in use
+#   python sql_schema.py --refresh   rebuild it from the database (after a schema change)
+#   python sql_schema.py --check     exit 1 if the database no longer matches it
+import os
+import re
+import sys
+import json
+import hashlib
+import logging
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sqlalchemy import inspect
+from langchain_core.tools import StructuredTool
+
+from db import get_engine
+
+# Load environment variables
+load_dotenv()
+
+SQL_INCLUDE_TABLES = ["Scholarships", "Universities", "VisaInfo", "Ranking", "Programs", "HealthInsurance","Eligibility","DocumentsRequired","Admissions"]
+SQL_SCHEMA_SNAPSHOT = os.getenv(
+    "SQL_SCHEMA_SNAPSHOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sql_schema_snapshot.json")
+)
+SQL_SCHEMA_SAMPLE_ROWS = int(os.getenv("SQL_SCHEMA_SAMPLE_ROWS", "3"))  # sample rows per table in the prompt
+SNAPSHOT_FORMAT = 1
+
+# Facts about the data that the columns alone don't tell
+CONVENTIONS = [
+    'Table and column names are case-sensitive: always double-quote them, e.g. "Universities"."aboutUs", "Avg fees".',
+    'Malaysian universities are the "Universities" rows with "countryID" = 14; always filter on it.',
+]
+
+
+# ---------------------------
+# Build / load
+# ---------------------------
+def _structure(engine, tables):
+    """Columns and keys of each table, straight from the database catalogue."""
+    inspector = inspect(engine)
+    structure = {}
+    for name in tables:
+        foreign_keys = inspector.get_foreign_keys(name)
+        structure[name] = {
+            "columns": [
+                {"name": c["name"], "type": str(c["type"]), "nullable": c["nullable"]}
+                for c in inspector.get_columns(name)
+            ],
+            "primary_key": inspector.get_pk_constraint(name).get("constrained_columns") or [],
+            "foreign_keys": [
+                {"columns": fk["constrained_columns"], "table": fk["referred_table"], "references": fk["referred_columns"]}
+                for fk in foreign_keys
+            ],
+        }
+    return structure
+
+
+def schema_version(structure):
+    """Short hash of the tables' structure; sample rows don't change it."""
+    return hashlib.sha256(json.dumps(structure, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def build_snapshot(engine, tables=SQL_INCLUDE_TABLES, sample_rows=SQL_SCHEMA_SAMPLE_ROWS):
+    """Reflect tables (the expensive part, done only here) into a snapshot dict."""
+    from langchain_community.utilities import SQLDatabase
+
+    db = SQLDatabase(engine, include_tables=tables, sample_rows_in_table_info=sample_rows)
+    structure = _structure(engine, tables)
+    version = schema_version(structure)
+    for name in tables:
+        # Same text the toolkit's sql_db_schema tool would return: CREATE TABLE plus sample rows
+        structure[name]["info"] = db.get_table_info([name])
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "version": version,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "conventions": CONVENTIONS,
+        "tables": structure,
+    }
+
+
+def save_snapshot(snapshot, path=SQL_SCHEMA_SNAPSHOT):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(snapshot, f, indent=2, default=str)
+    os.replace(tmp, path)
+
+
+def load_snapshot(path=SQL_SCHEMA_SNAPSHOT):
+    """The snapshot on disk, or None if it is missing, unreadable or in an older format."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning("Ignoring unreadable schema snapshot %s: %s", path, e)
+        return None
+    if snapshot.get("format") != SNAPSHOT_FORMAT:
+        return None
+    return snapshot
+
+
+def load_or_build_snapshot(engine, tables=SQL_INCLUDE_TABLES, path=SQL_SCHEMA_SNAPSHOT):
+    """Snapshot from disk if it covers tables; otherwise build it once and save it."""
+    snapshot = load_snapshot(path)
+    if snapshot is not None and set(tables) <= set(snapshot["tables"]):
+        return snapshot
+    logging.info("Building SQL schema snapshot for %d tables", len(tables))
+    snapshot = build_snapshot(engine, tables)
+    try:
+        save_snapshot(snapshot, path)
+    except OSError as e:
+        logging.warning("Could not save schema snapshot to %s: %s", path, e)
+    return snapshot
+
+
+def is_current(snapshot, engine):
+    """True if the database's tables still have the structure the snapshot was built from."""
+    return schema_version(_structure(engine, list(snapshot["tables"]))) == snapshot["version"]
+
+
+def table_columns(snapshot, table):
+    return [c["name"] for c in snapshot["tables"].get(table, {}).get("columns", [])]
+
+
+def primary_key(snapshot, table):
+    """The table's single-column primary key, or None."""
+    keys = snapshot["tables"].get(table, {}).get("primary_key") or []
+    return keys[0] if len(keys) == 1 else None
+
+
+def reference_column(snapshot, table, referred):
+    """Column of table that points at referred: a declared foreign key, else a "<referred>ID"-style name."""
+    for fk in snapshot["tables"].get(table, {}).get("foreign_keys", []):
+        if fk["table"] == referred and len(fk["columns"]) == 1:
+            return fk["columns"][0]
+    singular = re.sub(r"ies$", "y", referred.lower())
+    candidates = [c for c in table_columns(snapshot, table) if re.sub(r"[^a-z]", "", c.lower()) == singular + "id"]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+# ---------------------------
+# For the agent
+# ---------------------------
+def render_schema(snapshot, tables=None):
+    """Prompt text: the conventions, then each table's CREATE TABLE and sample rows."""
+    names = tables or list(snapshot["tables"])
+    conventions = "\n".join(f"- {c}" for c in snapshot["conventions"])
+    return conventions + "\n\n" + "\n\n".join(snapshot["tables"][name]["info"].strip() for name in names)
+
+
+def make_schema_tool(snapshot):
+    """Drop-in for the toolkit's sql_db_schema tool that answers from the snapshot."""
+
+    def sql_db_schema(table_names: str) -> str:
+        names = [name.strip().strip('"') for name in table_names.split(",") if name.strip()]
+        missing = [name for name in names if name not in snapshot["tables"]]
+        if missing:
+            return f"Error: table_names {set(missing)} not found in database"
+        return "\n\n".join(snapshot["tables"][name]["info"].strip() for name in names)
+
+    return StructuredTool.from_function(
+        sql_db_schema,
+        name="sql_db_schema",
+        description=(
+            "Input to this tool is a comma-separated list of tables, output is the schema and sample rows "
+            "for those tables. Example Input: table1, table2, table3"
+        ),
+    )
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+def main(argv):
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    engine = get_engine()
+    if "--refresh" in argv:
+        snapshot = build_snapshot(engine)
+        save_snapshot(snapshot, SQL_SCHEMA_SNAPSHOT)
+        print(f"Wrote {SQL_SCHEMA_SNAPSHOT} (version {snapshot['version']})")
+        return
+    snapshot = load_snapshot(SQL_SCHEMA_SNAPSHOT)
+    if snapshot is None:
+        print(f"No snapshot at {SQL_SCHEMA_SNAPSHOT}; run with --refresh")
+        sys.exit(1)
+    print(f"{SQL_SCHEMA_SNAPSHOT}: version {snapshot['version']}, generated {snapshot['generated_at']}, "
+          f"{len(snapshot['tables'])} tables")
+    if "--check" in argv:
+        if not is_current(snapshot, engine):
+            print("Database schema has changed since the snapshot; run with --refresh")
+            sys.exit(1)
+        print("Snapshot matches the database")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
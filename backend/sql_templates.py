@@ -0,0 +1,319 @@
+# sql_templates.py
+# Fast path for the most common catalogue questions (scholarships, fees, documents,
+# visas...). A keyword intent matcher plus a university-name slot filler picks a
+# parameterized query that runs directly; only its rows go to the LLM. Questions
+# it can't match confidently go to the full SQL agent.
+import os
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from sqlalchemy import text
+
+from text_index import tokenize
+from sql_schema import table_columns, primary_key, reference_column, load_or_build_snapshot
+
+# Load environment variables
+load_dotenv()
+
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+SQL_TEMPLATE_ROW_LIMIT = int(os.getenv("SQL_TEMPLATE_ROW_LIMIT", "10"))
+SQL_TEMPLATE_MAX_EXTRA_TERMS = int(os.getenv("SQL_TEMPLATE_MAX_EXTRA_TERMS", "2"))  # unexplained words before falling back
+UNIVERSITY_NAMES_TTL = float(os.getenv("UNIVERSITY_NAMES_TTL", "3600"))            # seconds between reloads of the name list
+UNIVERSITY_NAMES_RETRY = 30   # seconds before retrying a failed load
+
+MALAYSIA_COUNTRY_ID = 14
+
+
+def _terms(words):
+    return set(tokenize(words))
+
+
+# Words that don't distinguish one university from another
+_GENERIC_NAME_TERMS = _terms("university universiti college kolej institute malaysia")
+# Words a templated question may contain without changing what it asks
+_FILLER_TERMS = _terms(
+    "available offer offered provide need needed required require requirement apply applying application "
+    "study studying student international malaysia malaysian university universiti course program programme "
+    "find information info all"
+)
+# Questions that compare, rank or aggregate need a real query
+_ANALYTIC_TERMS = _terms(
+    "compare comparison versus vs cheapest cheaper cheap expensive lowest highest best top rank ranking ranked "
+    "average total count number between under below above over less than"
+)
+
+
+@dataclass
+class SQLTemplate:
+    name: str
+    intent_terms: set              # any of these (stemmed) words selects the intent
+    table: str                     # catalogue table the rows come from
+    sql: str                       # {u_pk}/{fk} key columns are resolved from the schema snapshot
+    university: str = "none"       # "required", "optional" or "none"
+    sql_any: str = None            # variant used when an optional university is not named
+    requires: dict = field(default_factory=dict)   # table -> columns that must exist
+    program_filter: bool = False   # leftover words filter "Programs"."name"
+
+
+TEMPLATES = [
+    SQLTemplate(
+        name="university_details",
+        intent_terms=_terms("detail details overview contact website email location address"),
+        table="Universities",
+        university="required",
+        sql='SELECT u.* FROM "Universities" u WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id',
+        requires={"Universities": ["countryID"]},
+    ),
+    SQLTemplate(
+        name="scholarships",
+        intent_terms=_terms("scholarship scholarships bursary bursaries funding grant grants sponsorship"),
+        table="Scholarships",
+        university="optional",
+        sql='SELECT u.name AS university, s.* FROM "Scholarships" s JOIN "Universities" u ON u."{u_pk}" = s."{fk}" '
+            'WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id LIMIT :limit',
+        sql_any='SELECT u.name AS university, s.* FROM "Scholarships" s JOIN "Universities" u ON u."{u_pk}" = s."{fk}" '
+                'WHERE u."countryID" = 14 LIMIT :limit',
+        requires={"Universities": ["name", "countryID"]},
+    ),
+    SQLTemplate(
+        name="program_fees",
+        intent_terms=_terms("fee fees tuition tution cost costs price"),
+        table="Programs",
+        university="required",
+        sql='SELECT u.name AS university, p.* FROM "Programs" p JOIN "Universities" u ON u."{u_pk}" = p."{fk}" '
+            'WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id AND p.name ILIKE ALL(:program) LIMIT :limit',
+        requires={"Universities": ["name", "countryID"], "Programs": ["name"]},
+        program_filter=True,
+    ),
+    SQLTemplate(
+        name="documents_required",
+        intent_terms=_terms("document documents documentation paperwork docs"),
+        table="DocumentsRequired",
+        university="required",
+        sql='SELECT u.name AS university, d.* FROM "DocumentsRequired" d JOIN "Universities" u ON u."{u_pk}" = d."{fk}" '
+            'WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id LIMIT :limit',
+        requires={"Universities": ["name", "countryID"]},
+    ),
+    SQLTemplate(
+        name="admissions",
+        intent_terms=_terms("intake intakes admission admissions enrol enroll enrollment"),
+        table="Admissions",
+        university="required",
+        sql='SELECT u.name AS university, a.* FROM "Admissions" a JOIN "Universities" u ON u."{u_pk}" = a."{fk}" '
+            'WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id LIMIT :limit',
+        requires={"Universities": ["name", "countryID"]},
+    ),
+    SQLTemplate(
+        name="eligibility",
+        intent_terms=_terms("eligibility eligible qualify qualification qualifications entry"),
+        table="Eligibility",
+        university="required",
+        sql='SELECT u.name AS university, e.* FROM "Eligibility" e JOIN "Universities" u ON u."{u_pk}" = e."{fk}" '
+            'WHERE u."countryID" = 14 AND u."{u_pk}" = :university_id LIMIT :limit',
+        requires={"Universities": ["name", "countryID"]},
+    ),
+    SQLTemplate(
+        name="visa_info",
+        intent_terms=_terms("visa visas immigration"),
+        table="VisaInfo",
+        sql='SELECT v.* FROM "VisaInfo" v WHERE v."countryID" = 14 LIMIT :limit',
+        requires={"VisaInfo": ["countryID"]},
+    ),
+    SQLTemplate(
+        name="health_insurance",
+        intent_terms=_terms("insurance insurer medical health"),
+        table="HealthInsurance",
+        sql='SELECT h.* FROM "HealthInsurance" h WHERE h."countryID" = 14 LIMIT :limit',
+        requires={"HealthInsurance": ["countryID"]},
+    ),
+]
+
+
+@dataclass
+class TemplateMatch:
+    template: SQLTemplate
+    sql: str
+    parameters: dict
+    university: str = None
+
+
+# ---------------------------
+# Schema checks
+# ---------------------------
+def _resolve(template, snapshot):
+    """The template's SQL with its key columns filled in, or None if the schema doesn't support it."""
+    if template.table not in snapshot["tables"]:
+        return None
+    for table, columns in template.requires.items():
+        if not set(columns) <= set(table_columns(snapshot, table)):
+            return None
+    names = {"u_pk": primary_key(snapshot, "Universities")}
+    if template.table != "Universities":
+        names["fk"] = reference_column(snapshot, template.table, "Universities")
+    needed = set(re.findall(r"\{(\w+)\}", template.sql + (template.sql_any or "")))
+    if any(names.get(name) is None for name in needed):
+        return None
+    return template.sql.format(**names), template.sql_any.format(**names) if template.sql_any else None
+
+
+# ---------------------------
+# University names
+# ---------------------------
+class UniversityNames:
+    """
+    The Malaysian universities' names, reloaded every ttl seconds (a failed
+    load is retried after UNIVERSITY_NAMES_RETRY), and which of them a question
+    names. snapshot defaults to sql_schema's, loaded on the first lookup.
+    """
+
+    def __init__(self, engine, snapshot=None, ttl=UNIVERSITY_NAMES_TTL):
+        self.engine = engine
+        self.snapshot = snapshot
+        self.ttl = ttl
+        self._universities = []      # (id, name, name terms, acronym)
+        self._reload_at = None       # monotonic time of the next load; None before the first
+        self._load_lock = threading.Lock()
+
+    def find(self, terms):
+        """Universities (id, name, name terms, acronym) whose distinctive name words or acronym all appear in terms."""
+        found = []
+        for entry in self._load():
+            _id, _name, name_terms, acronym = entry
+            distinctive = name_terms - _GENERIC_NAME_TERMS
+            if (distinctive and distinctive <= terms) or (acronym and acronym in terms):
+                found.append(entry)
+        return found
+
+    def ids_in(self, question):
+        """Ids of the universities question names."""
+        return frozenset(entry[0] for entry in self.find(set(tokenize(question))))
+
+    def _load(self):
+        if self._reload_at is not None and time.monotonic() < self._reload_at:
+            return self._universities
+        with self._load_lock:
+            if self._reload_at is None or time.monotonic() >= self._reload_at:
+                try:
+                    if self.snapshot is None:
+                        self.snapshot = load_or_build_snapshot(self.engine)
+                    pk = primary_key(self.snapshot, "Universities")
+                    with self.engine.connect() as conn:
+                        rows = conn.execute(text(
+                            f'SELECT "{pk}", name FROM "Universities" WHERE "countryID" = :country'
+                        ), {"country": MALAYSIA_COUNTRY_ID}).fetchall()
+                    self._universities = _university_entries(rows)
+                    self._reload_at = time.monotonic() + self.ttl
+                except Exception as e:
+                    # Keep the last good list, but try again soon rather than in ttl
+                    logging.warning("Could not load university names: %s", e)
+                    self._reload_at = time.monotonic() + UNIVERSITY_NAMES_RETRY
+        return self._universities
+
+
+# ---------------------------
+# Matcher
+# ---------------------------
+class TemplateMatcher:
+    """
+    Maps a question to one template and its parameters, or None. A question
+    matches when exactly one intent's words appear, the university it needs is
+    named unambiguously, it doesn't compare or rank, and at most
+    max_extra_terms words are left unexplained.
+    """
+
+    def __init__(self, snapshot, engine, templates=TEMPLATES, row_limit=SQL_TEMPLATE_ROW_LIMIT,
+                 max_extra_terms=SQL_TEMPLATE_MAX_EXTRA_TERMS, names_ttl=UNIVERSITY_NAMES_TTL):
+        self.engine = engine
+        self.row_limit = row_limit
+        self.max_extra_terms = max_extra_terms
+        self.names_ttl = names_ttl
+        self.templates = []
+        for template in templates:
+            resolved = _resolve(template, snapshot)
+            if resolved is None:
+                logging.info("SQL template %s disabled: the schema snapshot doesn't have its columns", template.name)
+                continue
+            self.templates.append((template, *resolved))
+        self.names = UniversityNames(engine, snapshot, ttl=names_ttl)
+        self._lock = threading.Lock()
+        self._stats = {"matched": {}, "no_intent": 0, "ambiguous": 0, "no_university": 0, "too_specific": 0,
+                       "empty_result": 0}
+
+    def match(self, question):
+        if not self.templates:
+            return None
+        terms = set(tokenize(question))
+        if not terms or terms & _ANALYTIC_TERMS:
+            return self._miss("too_specific")
+        universities = self.names.find(terms)
+        if len(universities) > 1:
+            return self._miss("ambiguous")
+        university = universities[0] if universities else None
+
+        candidates = [entry for entry in self.templates if terms & entry[0].intent_terms]
+        if len(candidates) > 1:
+            # Fees words also turn up in visa / insurance questions; the specific topic wins
+            candidates = [entry for entry in candidates if entry[0].name != "program_fees"] or candidates
+        if not candidates and university is not None:
+            # A bare university name ("tell me about USM") asks for its details
+            candidates = [entry for entry in self.templates if entry[0].name == "university_details"]
+        if not candidates:
+            return self._miss("no_intent")
+        if len(candidates) > 1:
+            return self._miss("ambiguous")
+        template, sql, sql_any = candidates[0]
+        if template.university == "required" and university is None:
+            return self._miss("no_university")
+
+        extra = terms - template.intent_terms - _FILLER_TERMS
+        if university is not None:
+            extra -= university[2] | {university[3]}
+        parameters = {"limit": self.row_limit}
+        if template.program_filter:
+            # The remaining words name the program ("data science"); all must appear in its name
+            # (stems lose plurals; "stud" matches both "Study" and "Studies")
+            parameters["program"] = [f"%{re.sub(r'y$', '', term)}%" for term in sorted(extra)] or ["%"]
+        elif len(extra) > self.max_extra_terms:
+            return self._miss("too_specific")
+        elif template.university == "optional" and university is None and extra:
+            # Probably names a university we don't know ("scholarships at Monash"); let the agent look
+            return self._miss("no_university")
+        if university is not None and template.university != "none":
+            parameters["university_id"] = university[0]
+        elif template.university == "optional":
+            sql = sql_any
+
+        with self._lock:
+            self._stats["matched"][template.name] = self._stats["matched"].get(template.name, 0) + 1
+        return TemplateMatch(template, sql, parameters, university[1] if university else None)
+
+    def record_empty(self, match):
+        """The matched query found nothing; the caller falls back to the agent."""
+        self._miss("empty_result")
+
+    def _miss(self, reason):
+        with self._lock:
+            self._stats[reason] += 1
+        return None
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data["matched"] = dict(self._stats["matched"])
+        data["templates"] = [template.name for template, _sql, _any in self.templates]
+        return data
+
+
+def _university_entries(rows):
+    entries = []
+    acronyms = {}
+    for university_id, name in rows:
+        words = [w for w in re.findall(r"[A-Za-z]+", name or "") if w.lower() not in ("of", "and", "the", "s")]
+        acronym = "".join(w[0] for w in words).lower() if len(words) >= 2 else None
+        acronyms[acronym] = acronyms.get(acronym, 0) + 1
+        entries.append((university_id, name, set(tokenize(name)), acronym))
+    # An acronym shared by two universities identifies neither
+    return [(i, n, t, a if a and acronyms[a] == 1 else None) for i, n, t, a in entries]
@@ -9,6 +9,10 @@ from typing import Optional
 from langchain_core.runnables import RunnableConfig
 from datetime import date
 import logging
+
+from search_cache import CachedSearch, make_cached_search_tool
+from search_compression import compress_results
+from deadlines import LLM_REQUEST_TIMEOUT, LLM_MAX_RETRIES, TAVILY_TIMEOUT, hedged
 today = date.today().strftime("%B %d, %Y")
 # Load environment variables
 load_dotenv()
@@ -26,9 +30,17 @@ except Exception as e:
     logging.warning("Tavily tool not available: %s", e)
     search_tool = None
 
+# Share results of identical searches across requests (TTL cache + single-flight),
+# then compress them to the most relevant sentences before they reach the LLM
+cached_search = CachedSearch(search_tool, timeout=TAVILY_TIMEOUT) if search_tool is not None else None
+agent_search_tool = (
+    make_cached_search_tool(search_tool, cached_search, postprocess=compress_results)
+    if search_tool is not None else None
+)
+
 # Define LLM
 
-llm = ChatOpenAI(model="gpt-4.1", temperature=0.7)
+llm = hedged(ChatOpenAI(model="gpt-4.1", temperature=0.7, timeout=LLM_REQUEST_TIMEOUT, max_retries=LLM_MAX_RETRIES))
 
 if search_tool is not None:
     internet_agent_system_prompt = f"""
@@ -59,7 +71,7 @@ Date context: {today}.
 """
 
 # Wrap with LangGraph ReAct agent
-tools_list = [t for t in [search_tool] if t is not None]
+tools_list = [t for t in [agent_search_tool] if t is not None]
 
 internet_agent_executor = create_react_agent(
     model=llm,
@@ -0,0 +1,13 @@
+# conftest.py
+# Tests import the backend's flat modules (db, caching, ...) directly; none of
+# them needs a database or API key: they use local fakes.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Never trace test runs to LangSmith, whatever .env says (load_dotenv keeps these)
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+os.environ["LANGSMITH_TRACING"] = "false"
+# Modules build their OpenAI clients at import; tests replace every call with a fake
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
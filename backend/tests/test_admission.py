@@ -0,0 +1,245 @@
+# test_admission.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, user_key
+
+
+def wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def queue_in_thread(controller, user, order):
+    """Start a thread that waits for a slot, records its user once admitted and releases straight away."""
+    depth = controller.stats()["queue_depth"]
+
+    def run():
+        with controller.acquire(user):
+            order.append(user)
+    thread = threading.Thread(target=run)
+    thread.start()
+    wait_until(lambda: controller.stats()["queue_depth"] == depth + 1)
+    return thread
+
+
+# ---------------------------
+# Threads
+# ---------------------------
+def test_free_slot_is_taken_without_queueing():
+    controller = AdmissionController(max_in_flight=2)
+    with controller.acquire("a"), controller.acquire("b"):
+        assert controller.stats()["in_flight"] == 2
+    assert controller.stats()["in_flight"] == 0
+    assert controller.stats()["queued"] == 0
+
+
+def test_slots_go_round_robin_across_users():
+    controller = AdmissionController(max_in_flight=1, max_queue_per_user=2)
+    holder = controller.acquire("holder")
+    order = []
+    threads = [queue_in_thread(controller, user, order) for user in ("heavy", "heavy", "light")]
+    holder.release()
+    for t in threads:
+        t.join(2)
+    assert order == ["heavy", "light", "heavy"]
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_timeout_is_a_503_with_retry_after():
+    controller = AdmissionController(max_in_flight=1, max_wait=0.05)
+    with controller.acquire("a"):
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.acquire("b")
+    assert rejected.value.status == 503
+    assert rejected.value.retry_after >= 1
+    stats = controller.stats()
+    assert stats["timed_out"] == 1
+    assert stats["queue_depth"] == 0 and stats["in_flight"] == 0
+
+
+def test_per_user_limit_is_a_429():
+    controller = AdmissionController(max_in_flight=1, max_queue_per_user=1)
+    holder = controller.acquire("holder")
+    order = []
+    thread = queue_in_thread(controller, "a", order)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("a")
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after >= 1
+    holder.release()
+    thread.join(2)
+    assert order == ["a"]
+    assert controller.stats()["rejected_user_limit"] == 1
+
+
+def test_full_queue_is_a_503():
+    controller = AdmissionController(max_in_flight=1, max_queue=1)
+    holder = controller.acquire("holder")
+    thread = queue_in_thread(controller, "a", [])
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("b")
+    assert rejected.value.status == 503
+    holder.release()
+    thread.join(2)
+    assert controller.stats()["rejected_queue_full"] == 1
+
+
+def test_grant_racing_a_timeout_keeps_the_slot(monkeypatch):
+    controller = AdmissionController(max_in_flight=1, max_wait=0.01)
+    holder = controller.acquire("holder")
+    abandon = controller._abandon
+
+    def grant_then_abandon(waiter, timed_out=True):
+        holder.release()        # the slot is handed over just as the wait times out
+        return abandon(waiter, timed_out)
+    monkeypatch.setattr(controller, "_abandon", grant_then_abandon)
+
+    ticket = controller.acquire("b")
+    stats = controller.stats()
+    assert stats["in_flight"] == 1 and stats["queue_depth"] == 0
+    assert stats["timed_out"] == 0
+    ticket.release()
+    ticket.release()            # idempotent
+    assert controller.stats()["in_flight"] == 0
+
+
+def test_stats_counts():
+    controller = AdmissionController(max_in_flight=1, max_queue_per_user=1)
+    holder = controller.acquire("holder")
+    order = []
+    thread = queue_in_thread(controller, "a", order)
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("a")                 # user limit
+    controller.max_wait = 0.05                  # "a" is already waiting with the default
+    with pytest.raises(AdmissionRejected):
+        controller.acquire("b")                 # timeout
+    stats = controller.stats()
+    assert stats["queue_depth"] == 1 and stats["queued_users"] == 1
+    holder.release()
+    thread.join(2)
+    stats = controller.stats()
+    assert {k: stats[k] for k in ("admitted", "queued", "rejected_queue_full", "rejected_user_limit", "timed_out")} == \
+        {"admitted": 2, "queued": 2, "rejected_queue_full": 0, "rejected_user_limit": 1, "timed_out": 1}
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert stats["wait_ms"]["max"] > 0
+
+
+# ---------------------------
+# Asyncio
+# ---------------------------
+async def queue_task(controller, user, order):
+    """Start a task that waits for a slot, records its user once admitted and releases straight away."""
+    async def run():
+        async with await controller.aacquire(user):
+            order.append(user)
+    task = asyncio.create_task(run())
+    await asyncio.sleep(0)      # let it reach the queue
+    return task
+
+
+def test_async_slots_go_round_robin_across_users():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue_per_user=2)
+        holder = await controller.aacquire("holder")
+        order = []
+        tasks = [await queue_task(controller, user, order) for user in ("heavy", "heavy", "light")]
+        assert controller.stats()["queue_depth"] == 3
+        holder.release()
+        await asyncio.wait_for(asyncio.gather(*tasks), 2)
+        return order, controller.stats()
+    order, stats = asyncio.run(scenario())
+    assert order == ["heavy", "light", "heavy"]
+    assert stats["in_flight"] == 0
+
+
+def test_async_timeout_is_a_503():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_wait=0.05)
+        async with await controller.aacquire("a"):
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.aacquire("b")
+        return rejected.value, controller.stats()
+    rejected, stats = asyncio.run(scenario())
+    assert rejected.status == 503 and rejected.retry_after >= 1
+    assert stats["timed_out"] == 1 and stats["queue_depth"] == 0
+
+
+def test_async_per_user_limit_is_a_429():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue_per_user=1)
+        holder = await controller.aacquire("holder")
+        task = await queue_task(controller, "a", [])
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.aacquire("a")
+        holder.release()
+        await asyncio.wait_for(task, 2)
+        return rejected.value
+    assert asyncio.run(scenario()).status == 429
+
+
+def test_async_cancel_while_queued_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1)
+        holder = await controller.aacquire("holder")
+        task = asyncio.create_task(controller.aacquire("b"))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        stats = controller.stats()
+        holder.release()
+        return stats, controller.stats()
+    during, after = asyncio.run(scenario())
+    assert during["queue_depth"] == 0 and during["in_flight"] == 1
+    assert during["timed_out"] == 0
+    assert after["in_flight"] == 0
+
+
+def test_async_grant_racing_a_cancel_hands_the_slot_back():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1)
+        holder = await controller.aacquire("holder")
+        task = asyncio.create_task(controller.aacquire("b"))
+        await asyncio.sleep(0)
+        holder.release()        # grants "b"; its future is only set on the next loop turn
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return controller.stats()
+    stats = asyncio.run(scenario())
+    assert stats["admitted"] == 2
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+
+
+def test_async_grant_racing_a_timeout_keeps_the_slot(monkeypatch):
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_wait=0.01)
+        holder = await controller.aacquire("holder")
+        abandon = controller._abandon
+
+        def grant_then_abandon(waiter, timed_out=True):
+            holder.release()
+            return abandon(waiter, timed_out)
+        monkeypatch.setattr(controller, "_abandon", grant_then_abandon)
+        ticket = await controller.aacquire("b")
+        in_flight = controller.stats()["in_flight"]
+        ticket.release()
+        return in_flight, controller.stats()
+    in_flight, stats = asyncio.run(scenario())
+    assert in_flight == 1
+    assert stats["in_flight"] == 0 and stats["timed_out"] == 0
+
+
+@pytest.mark.parametrize("session, expected", [
+    ({"user_id": 7, "session_id": "s"}, "7"),
+    ({"session_id": "s"}, "s"),
+    ({}, "anonymous"),
+])
+def test_user_key(session, expected):
+    assert user_key(session) == expected
@@ -0,0 +1,111 @@
+# test_catalogue_index.py
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import catalogue_index
+from catalogue_index import CatalogueIndex
+
+
+def table(*columns):
+    return {"columns": [{"name": c} for c in ("id",) + columns], "primary_key": ["id"], "foreign_keys": []}
+
+
+SNAPSHOT = {
+    "tables": {
+        "Universities": table("name", "countryID", "location"),
+        "Scholarships": table("name", "universityID"),
+        "VisaInfo": table("details", "countryID"),
+    }
+}
+
+
+class FakeEngine:
+    """engine.connect() serving SELECT * FROM "<table>" from in-memory rows, recording which tables were read."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.loaded = []
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement):
+        name = str(statement).split('"')[1]
+        self.loaded.append(name)
+        return [SimpleNamespace(_mapping=row) for row in self.tables[name]]
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine({
+        "Universities": [{"id": 1, "name": "Universiti Malaya", "countryID": 14, "location": "Kuala Lumpur"},
+                         {"id": 2, "name": "Universiti Sains Malaysia", "countryID": 14, "location": "Penang"}],
+        "Scholarships": [{"id": 1, "name": "Merit scholarship", "universityID": 1}],
+        "VisaInfo": [{"id": 1, "details": "Student pass via EMGS", "countryID": 14}],
+    })
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    current = {"Universities": "1:0", "Scholarships": "2:0", "VisaInfo": "3:0"}
+    monkeypatch.setattr(catalogue_index, "table_versions", lambda engine, tables: dict(current))
+    return current
+
+
+@pytest.fixture
+def index(engine, versions):
+    return CatalogueIndex(engine, SNAPSHOT, tables=list(SNAPSHOT["tables"]), refresh_interval=3600)
+
+
+def test_first_search_builds_the_index(index, engine):
+    assert engine.loaded == []
+    results = index.search("penang")
+    assert results[0]["details"]["name"] == "Universiti Sains Malaysia"
+    assert sorted(engine.loaded) == ["Scholarships", "Universities", "VisaInfo"]
+    assert index.stats()["built"]
+
+
+def test_refresh_reloads_only_changed_tables(index, engine, versions):
+    index.refresh()
+    engine.loaded.clear()
+    assert index.refresh() == 0
+    assert engine.loaded == []
+
+    engine.tables["Scholarships"].append({"id": 2, "name": "Penang research grant", "universityID": 2})
+    versions["Scholarships"] = "2:1"
+    assert index.refresh() == 1                      # only USM's document changed
+    assert engine.loaded == ["Scholarships"]
+    top = index.search("research grant")[0]
+    assert top["details"]["name"] == "Universiti Sains Malaysia"
+    assert top["matches"]["Scholarships"][0]["name"] == "Penang research grant"
+
+
+def test_unchanged_tables_keep_their_rows(index, engine, versions):
+    index.refresh()
+    engine.tables["Universities"] = []             # would empty the index if it were reloaded
+    versions["VisaInfo"] = "3:1"
+    index.refresh()
+    assert index.stats()["documents"] == 3
+
+
+def test_failed_first_build_is_retried_later(engine, versions, monkeypatch):
+    def unavailable(engine, tables):
+        raise ConnectionError("database unavailable")
+
+    monkeypatch.setattr(catalogue_index, "table_versions", unavailable)
+    index = CatalogueIndex(engine, SNAPSHOT, tables=list(SNAPSHOT["tables"]))
+    assert index.search("penang") == []
+    assert index.stats()["refresh_errors"] == 1
+    assert index.search("penang") == []            # within CATALOGUE_INDEX_RETRY: no new attempt
+    assert index.stats()["refresh_errors"] == 1
+
+    monkeypatch.setattr(catalogue_index, "table_versions", lambda engine, tables: dict(versions))
+    index._checked_at -= catalogue_index.CATALOGUE_INDEX_RETRY
+    assert index.search("penang")[0]["details"]["name"] == "Universiti Sains Malaysia"
+
+
+def test_import_builds_nothing():
+    assert catalogue_index.catalogue_index is None or not catalogue_index.catalogue_index.stats()["built"]
@@ -0,0 +1,177 @@
+# test_chat_history.py
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import chat_history
+from caching import TTLCache
+from chat_history import (
+    MAX_PAGE_SIZE, SimplePostgresChatMessageHistory, _note_written, decode_cursor, encode_cursor,
+    get_user_chat_sessions, get_user_chat_sessions_page, page_size, verify_session_ownership,
+)
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_cursor_round_trip():
+    created_at = T0 + timedelta(microseconds=123456)
+    assert decode_cursor(encode_cursor(created_at, "session-1")) == (created_at, "session-1")
+    assert decode_cursor(encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", encode_cursor(T0, "x")[:-3], "W1tdXQ"])
+def test_malformed_cursor_raises_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize("limit, expected", [(None, 50), ("20", 20), ("abc", 50), (0, 1), (-5, 1), (10_000, MAX_PAGE_SIZE)])
+def test_page_size_is_clamped(limit, expected):
+    assert page_size(limit, 50) == expected
+
+
+@pytest.fixture
+def sessions(monkeypatch):
+    """Seven sessions, newest first, two of them sharing a first_time; served like the keyset query would."""
+    rows = [{"session_id": f"s{i}", "first_time": T0 + timedelta(minutes=i // 2 * 2)} for i in range(7)]
+    rows.sort(key=lambda r: (r["first_time"], r["session_id"]), reverse=True)
+
+    def fake_sessions(user_id, limit=None, cursor=None):
+        page = rows
+        if cursor:
+            after = decode_cursor(cursor)
+            page = [r for r in rows if (r["first_time"], r["session_id"]) < after]
+        return page[:limit] if limit is not None else list(page)
+
+    monkeypatch.setattr(chat_history, "get_user_chat_sessions", fake_sessions)
+    return rows
+
+
+def test_session_pages_cover_every_session_once(sessions):
+    seen, cursor = [], None
+    while True:
+        page, cursor = get_user_chat_sessions_page("u1", limit=3, cursor=cursor)
+        assert len(page) <= 3
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == sessions
+
+
+def test_last_full_page_has_no_cursor(sessions):
+    page, cursor = get_user_chat_sessions_page("u1", limit=7)
+    assert len(page) == 7 and cursor is None
+
+
+def test_unpaged_by_default(sessions):
+    page, cursor = get_user_chat_sessions_page("u1")
+    assert page == sessions and cursor is None
+
+
+class FakeSessionsDB:
+    """get_pool() stand-in holding chat_sessions titles; counts the queries that reach it."""
+
+    def __init__(self):
+        self.titles = {}        # (user_id, session_id) -> title, None until the first user message
+        self.queries = 0
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        yield self
+
+    def commit(self):
+        pass
+
+    def execute(self, query, params=None):
+        self.queries += 1
+        self.params = params
+        if "INSERT INTO" in query:
+            user_id, session_id, role, content = params
+            if self.titles.get((user_id, session_id)) is None:
+                self.titles[(user_id, session_id)] = content if role == "user" else None
+
+    def fetchall(self):
+        return [{"session_id": session_id, "title": title}
+                for (user_id, session_id), title in self.titles.items() if user_id == self.params[0]]
+
+    def fetchone(self):
+        key = (self.params[0], self.params[1])
+        return (self.titles[key] is not None,) if key in self.titles else None
+
+
+@pytest.fixture
+def sessions_db(monkeypatch):
+    """Inline writes against FakeSessionsDB, with empty session caches."""
+    db = FakeSessionsDB()
+    monkeypatch.setattr(chat_history, "get_pool", lambda: db)
+    monkeypatch.setattr(chat_history, "_writer", lambda: None)
+    monkeypatch.setattr(chat_history, "_ensure_schema", lambda: None)
+    monkeypatch.setattr(chat_history, "_session_lists", TTLCache(ttl=3600))
+    monkeypatch.setattr(chat_history, "_session_owners", TTLCache(ttl=3600))
+    return db
+
+
+def titles(user_id):
+    return [s["title"] for s in get_user_chat_sessions(user_id)]
+
+
+def test_session_list_is_cached(sessions_db):
+    SimplePostgresChatMessageHistory("u1", "s1").add_user_message("visa?")
+    assert titles("u1") == ["visa?"]
+    queries = sessions_db.queries
+    assert titles("u1") == ["visa?"]
+    assert sessions_db.queries == queries
+
+
+def test_new_session_invalidates_its_users_lists(sessions_db):
+    SimplePostgresChatMessageHistory("u1", "s1").add_user_message("visa?")
+    SimplePostgresChatMessageHistory("u2", "s2").add_user_message("fees?")
+    titles("u1"), titles("u2")
+    queries = sessions_db.queries
+    SimplePostgresChatMessageHistory("u1", "s3").add_user_message("scholarships?")
+    assert titles("u2") == ["fees?"]                     # another user's list stays cached
+    assert sessions_db.queries == queries + 1            # just the insert
+    assert titles("u1") == ["visa?", "scholarships?"]
+
+
+def test_later_messages_keep_the_list_cached(sessions_db):
+    history = SimplePostgresChatMessageHistory("u1", "s1")
+    history.add_user_message("visa?")
+    titles("u1")
+    queries = sessions_db.queries
+    history.add_ai_message("Apply through EMGS.")
+    history.add_user_message("how long does it take?")
+    assert titles("u1") == ["visa?"]
+    assert sessions_db.queries == queries + 2
+
+
+def test_first_user_message_after_an_answer_sets_the_title(sessions_db):
+    history = SimplePostgresChatMessageHistory("u1", "s1")
+    history.add_ai_message("Hello! How can I help?")
+    assert titles("u1") == [None]
+    history.add_user_message("visa?")
+    assert titles("u1") == ["visa?"]
+
+
+def test_written_sessions_are_known_owned(sessions_db):
+    SimplePostgresChatMessageHistory("u1", "s1").add_user_message("visa?")
+    queries = sessions_db.queries
+    assert verify_session_ownership("u1", "s1")
+    assert sessions_db.queries == queries
+    assert not verify_session_ownership("u2", "s1")
+    assert sessions_db.queries == queries + 1
+
+
+def test_write_behind_batches_invalidate_too(sessions_db):
+    sessions_db.titles[("u1", "s1")] = "visa?"
+    assert titles("u1") == ["visa?"]
+    sessions_db.titles[("u1", "s2")] = "fees?"           # flushed by the background writer, then:
+    _note_written([{"user_id": "u1", "session_id": "s2", "role": "user"},
+                   {"user_id": "u1", "session_id": "s2", "role": "assistant"}])
+    assert titles("u1") == ["visa?", "fees?"]
+    assert chat_history.session_cache_stats()["owners"]["entries"] == 1
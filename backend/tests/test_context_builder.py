@@ -0,0 +1,72 @@
+# test_context_builder.py
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+import context_builder
+from context_builder import TRUNCATION_MARKER, build_context, select_messages
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def char_estimate(monkeypatch):
+    """Count tokens as chars/4 (what the code falls back to without tiktoken), so sizes are predictable."""
+    monkeypatch.setattr(context_builder, "_get_encoding", lambda: None)
+
+
+def words(tokens):
+    return "abc " * tokens      # 4 chars, one estimated token each
+
+
+def test_newest_messages_fill_the_budget():
+    candidates = [HumanMessage(content=words(40)), AIMessage(content=words(40)), HumanMessage(content=words(10))]
+    window = select_messages(candidates, token_budget=60, max_message_tokens=100)
+    assert window.messages == candidates[1:]
+    assert window.token_count == 50
+    assert window.dropped == 1
+
+
+def test_long_answers_are_truncated():
+    candidates = [AIMessage(content=words(500)), HumanMessage(content=words(5))]
+    window = select_messages(candidates, token_budget=1000, max_message_tokens=50)
+    assert window.truncated == 1
+    assert window.messages[0].content.endswith(TRUNCATION_MARKER)
+    assert window.messages[1] is candidates[1]
+
+
+def test_current_question_is_kept_whole_even_over_budget():
+    question = HumanMessage(content=words(500))
+    window = select_messages([AIMessage(content="hi"), question], token_budget=100, max_message_tokens=50)
+    assert window.messages == [question]
+    assert window.dropped == 1
+
+
+class FakeHistory:
+    """recent_rows over in-memory rows, applying only the limit; records the arguments it was called with."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def recent_rows(self, limit=None, max_tokens=None, max_message_tokens=None):
+        self.calls.append({"limit": limit, "max_tokens": max_tokens, "max_message_tokens": max_message_tokens})
+        return self.rows[-limit:] if limit else list(self.rows)
+
+
+def test_build_context_passes_the_token_budget_to_the_query():
+    history = FakeHistory([{"role": "user", "content": "hello", "created_at": T0}])
+    build_context(history, token_budget=1000, max_message_tokens=200, max_messages=20)
+    assert history.calls == [{"limit": 20, "max_tokens": 1500, "max_message_tokens": 200}]
+
+
+def test_build_context_reports_the_oldest_kept_message():
+    rows = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": words(30), "created_at": T0 + timedelta(minutes=i)}
+        for i in range(6)
+    ]
+    window = build_context(FakeHistory(rows), token_budget=100, max_message_tokens=200, max_messages=20)
+    assert len(window.messages) == 3
+    assert window.start_time == rows[3]["created_at"]
+    assert isinstance(window.messages[-1], AIMessage)
@@ -0,0 +1,219 @@
+# test_db.py
+import threading
+import time
+
+import psycopg2.extensions
+import pytest
+
+import db
+from db import ConnectionPool, PoolTimeout
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+INTRANS = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        if self.conn.broken:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.status = INTRANS
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class FakeConnection:
+    """psycopg2 connection stand-in with PooledConnection's close()/really_close() contract."""
+    _pool = None
+
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.broken = False
+        self.status = IDLE
+        self.rollbacks = 0
+
+    def close(self):
+        if self._pool is None:
+            self.closed = 1
+        else:
+            self._pool.putconn(self)
+
+    def really_close(self):
+        self._pool = None
+        self.closed = 1
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return self.status
+
+    def commit(self):
+        self.status = IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = IDLE
+
+
+class FakeConnect:
+    """connect() factory for the pool; remembers every connection it opened."""
+
+    def __init__(self):
+        self.opened = []
+
+    def __call__(self):
+        conn = FakeConnection(len(self.opened))
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def connect():
+    return FakeConnect()
+
+
+def test_closed_connection_is_reused(connect):
+    pool = ConnectionPool(connect, min_size=1, max_size=2)
+    first = pool.getconn()
+    first.close()                       # code written for plain connections
+    assert not first.closed
+    assert pool.getconn() is first
+    assert len(connect.opened) == 1
+    assert pool.stats()["checkouts"] == 2
+
+
+def test_pool_never_exceeds_max_size(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=2)
+    pool.getconn(), pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    stats = pool.stats()
+    assert stats["size"] == 2 and stats["in_use"] == 2
+    assert stats["checkout_timeouts"] == 1
+    assert len(connect.opened) == 2
+
+
+def test_waiting_checkout_gets_the_returned_connection(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    held = pool.getconn()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn(timeout=2)))
+    waiter.start()
+    time.sleep(0.05)
+    pool.putconn(held)
+    waiter.join(2)
+    assert got == [held]
+    assert pool.stats()["checkout_waits"] == 1
+
+
+def test_open_transaction_is_rolled_back_on_return(connect):
+    pool = ConnectionPool(connect)
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("UPDATE ...")
+            raise RuntimeError("boom")
+    assert conn.status == IDLE and conn.rollbacks >= 1
+    conn = pool.getconn()
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+    pool.putconn(conn)                  # returned mid-transaction
+    assert conn.status == IDLE
+
+
+def test_closed_connection_is_discarded_on_return(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=1)
+    conn = pool.getconn()
+    conn.closed = 2                     # the server went away while it was checked out
+    pool.putconn(conn)
+    assert pool.stats()["size"] == 0
+    assert pool.getconn() is not conn
+    assert len(connect.opened) == 2
+
+
+def test_broken_idle_connection_is_replaced(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=1, check_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    conn.broken = True
+    fresh = pool.getconn()
+    assert fresh is not conn and conn.closed
+    stats = pool.stats()
+    assert stats["failed_health_checks"] == 1
+    assert stats["size"] == 1 and stats["connections_closed"] == 1
+
+
+def test_idle_connections_are_reaped_down_to_min_size(connect):
+    pool = ConnectionPool(connect, min_size=1, max_size=3, max_idle=0.02)
+    conns = [pool.getconn() for _ in range(3)]
+    for conn in conns:
+        pool.putconn(conn)
+    time.sleep(0.05)
+    pool.reap()
+    stats = pool.stats()
+    assert stats["idle"] == 1 and stats["connections_closed"] == 2
+    assert [c.closed for c in conns] == [1, 1, 0]    # the most recently returned one is kept
+
+
+def test_closeall_closes_idle_and_returned_connections(connect):
+    pool = ConnectionPool(connect, min_size=0, max_size=2)
+    idle, busy = pool.getconn(), pool.getconn()
+    pool.putconn(idle)
+    pool.closeall()
+    assert idle.closed
+    pool.putconn(busy)
+    assert busy.closed
+    with pytest.raises(RuntimeError):
+        pool.getconn()
+
+
+def test_invalid_sizes_are_rejected(connect):
+    with pytest.raises(ValueError):
+        ConnectionPool(connect, min_size=3, max_size=2)
+
+
+def test_new_pool_after_fork(monkeypatch):
+    monkeypatch.setattr(db, "_pool", None)
+    monkeypatch.setattr(db, "_pool_pid", None)
+    parent = db.get_pool()
+    assert db.get_pool() is parent
+    child_pid = db._pool_pid + 1
+    monkeypatch.setattr(db.os, "getpid", lambda: child_pid)
+    child = db.get_pool()
+    assert child is not parent
+    assert db.get_pool() is child
+
+
+@pytest.fixture
+def fake_engine(monkeypatch, connect):
+    """
+    get_engine() over a pool of fake connections. The psycopg2 dialect's
+    first-connect queries and on-connect type registration need a real server,
+    so they are switched off; everything else is SQLAlchemy's own checkout path.
+    """
+    from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+    monkeypatch.setattr(PGDialect_psycopg2, "on_connect", lambda self: None)
+    monkeypatch.setattr(PGDialect_psycopg2, "initialize", lambda self, connection: None)
+    pool = ConnectionPool(connect, min_size=0, max_size=2)
+    monkeypatch.setattr(db, "_pool", pool)
+    monkeypatch.setattr(db, "_pool_pid", db.os.getpid())
+    monkeypatch.setattr(db, "_engine", None)
+    return db.get_engine()
+
+
+def test_engine_checkouts_reuse_the_pooled_connection(fake_engine, connect):
+    for _ in range(3):
+        with fake_engine.connect():
+            assert db.get_pool().stats()["in_use"] == 1
+    stats = db.get_pool().stats()
+    assert len(connect.opened) == 1
+    assert stats["checkouts"] == 3 and stats["in_use"] == 0 and stats["idle"] == 1
+    assert not connect.opened[0].closed
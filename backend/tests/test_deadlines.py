@@ -0,0 +1,217 @@
+# test_deadlines.py
+import time
+import asyncio
+import threading
+import contextvars
+from typing import Any, List
+
+import pytest
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langgraph.graph import StateGraph, START, END, MessagesState
+
+import deadlines
+from deadlines import (
+    Deadline, DeadlineExceeded, DeadlineGuard, HedgedChatModel, aiterate_with_deadline, current_deadline, iterate_with_deadline,
+)
+
+
+class SlowChatModel(BaseChatModel):
+    """Answers `reply` word by word, sleeping `delays[i]` before call i's first word and `word_delay` between words."""
+    reply: str = "one two three four five six seven eight"
+    delays: List[float] = [0.0]
+    word_delay: float = 0.0
+    calls: List[Any] = []
+    words_sent: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "slow-fake"
+
+    def _start(self):
+        call = len(self.calls)
+        self.calls.append(call)
+        time.sleep(self.delays[min(call, len(self.delays) - 1)])
+        return call
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        call = self._start()
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=f"{self.reply} ({call})"))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self._start()
+        for word in self.reply.split():
+            self.words_sent.append(word)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(word + " ", chunk=chunk)
+            yield chunk
+            time.sleep(self.word_delay)
+
+
+def ticking(counter, closed, interval=0.02):
+    """An endless stream that counts the items it produced and notes when it is closed."""
+    try:
+        while True:
+            time.sleep(interval)
+            counter.append(current_deadline())
+            yield len(counter)
+    finally:
+        closed.set()
+
+
+def test_deadline_stops_the_producer():
+    counter, closed = [], threading.Event()
+    deadline = Deadline(0.15)
+    received = []
+    with pytest.raises(DeadlineExceeded):
+        for item in iterate_with_deadline(lambda: ticking(counter, closed), deadline):
+            received.append(item)
+    assert received
+    assert closed.wait(1)
+    produced = len(counter)
+    time.sleep(0.1)
+    assert len(counter) == produced
+    # The producer ran with the request's deadline as the current one
+    assert counter[0] is deadline
+
+
+def test_consumer_going_away_stops_the_producer():
+    counter, closed = [], threading.Event()
+    stream = iterate_with_deadline(lambda: ticking(counter, closed), Deadline(10))
+    assert [next(stream), next(stream)] == [1, 2]
+    stream.close()   # what a web server does when the client disconnects
+    assert closed.wait(1)
+    produced = len(counter)
+    time.sleep(0.1)
+    assert len(counter) == produced
+
+
+def test_slow_model_in_a_graph_is_cut_off_at_the_deadline():
+    model = SlowChatModel(word_delay=0.05, calls=[], words_sent=[])
+    graph = (
+        StateGraph(MessagesState)
+        .add_node("agent", lambda state: {"messages": [model.invoke(state["messages"])]})
+        .add_edge(START, "agent")
+        .add_edge("agent", END)
+        .compile()
+    )
+    tokens = []
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        for message, _metadata in iterate_with_deadline(
+            lambda: graph.stream({"messages": [HumanMessage(content="hi")]}, stream_mode="messages"),
+            Deadline(0.12),
+        ):
+            tokens.append(message.content)
+    assert time.monotonic() - started < 0.5
+    assert 0 < len(tokens) < 8
+
+
+def test_fast_run_finishes_normally():
+    items = list(iterate_with_deadline(lambda: iter([1, 2, 3]), Deadline(5)))
+    assert items == [1, 2, 3]
+
+
+def test_hedged_call_answers_from_the_backup_request():
+    model = SlowChatModel(delays=[1.0, 0.0], calls=[], words_sent=[])
+    started = time.monotonic()
+    reply = HedgedChatModel(model=model, hedge_after=0.05).invoke("hi")
+    assert time.monotonic() - started < 0.5
+    assert reply.content.endswith("(1)")
+
+
+def test_hedged_stream_follows_the_first_attempt_to_answer():
+    model = SlowChatModel(delays=[1.0, 0.0], calls=[], words_sent=[])
+    started = time.monotonic()
+    text = "".join(chunk.content for chunk in HedgedChatModel(model=model, hedge_after=0.05).stream("hi"))
+    assert time.monotonic() - started < 0.5
+    assert text.split() == model.reply.split()
+
+
+def test_async_deadline_cancels_the_producer():
+    produced = []
+
+    async def slow():
+        while True:
+            await asyncio.sleep(0.02)
+            produced.append(1)
+            yield len(produced)
+
+    async def consume():
+        async for _item in aiterate_with_deadline(slow, Deadline(0.1)):
+            pass
+
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(consume())
+    count = len(produced)
+    time.sleep(0.1)
+    assert len(produced) == count
+
+
+def looping_graph(model, calls=5):
+    """One node that makes `calls` LLM calls in a row without yielding anything in between."""
+    def agent(state):
+        messages = list(state["messages"])
+        for _ in range(calls):
+            messages.append(model.invoke(messages))
+        return {"messages": messages[len(state["messages"]):]}
+
+    return StateGraph(MessagesState).add_node("agent", agent).add_edge(START, "agent").add_edge("agent", END).compile()
+
+
+def test_abandoned_run_stops_making_llm_calls():
+    model = SlowChatModel(delays=[0.1], calls=[], words_sent=[])
+    graph = looping_graph(model)
+    deadline = Deadline(0.15)
+    config = {"callbacks": [DeadlineGuard(deadline)]}
+    with pytest.raises(DeadlineExceeded):
+        for _item in iterate_with_deadline(
+            lambda: graph.stream({"messages": [HumanMessage(content="hi")]}, config=config, stream_mode="updates"),
+            deadline,
+        ):
+            pass
+    started = len(model.calls)
+    time.sleep(0.5)
+    # The call in flight at the deadline finishes, but no new one starts
+    assert started >= 1
+    assert len(model.calls) == started
+
+
+def test_consumer_going_away_cancels_the_run():
+    model = SlowChatModel(delays=[0.05], calls=[], words_sent=[])
+    graph = looping_graph(model)
+    deadline = Deadline(10)
+    config = {"callbacks": [DeadlineGuard(deadline)]}
+    stream = iterate_with_deadline(
+        lambda: graph.stream({"messages": [HumanMessage(content="hi")]}, config=config, stream_mode="messages"),
+        deadline,
+    )
+    next(stream)
+    stream.close()
+    time.sleep(0.3)
+    assert len(model.calls) == 1
+
+
+def test_without_the_guard_the_run_keeps_going():
+    model = SlowChatModel(delays=[0.05], calls=[], words_sent=[])
+    graph = looping_graph(model)
+    deadline = Deadline(0.08)
+    with pytest.raises(DeadlineExceeded):
+        for _item in iterate_with_deadline(
+            lambda: graph.stream({"messages": [HumanMessage(content="hi")]}, stream_mode="updates"), deadline,
+        ):
+            pass
+    time.sleep(0.4)
+    assert len(model.calls) == 5
+
+
+def test_hedged_model_makes_no_call_after_the_deadline():
+    model = SlowChatModel(calls=[], words_sent=[])
+    deadline = Deadline(0)
+    context = contextvars.copy_context()
+    context.run(deadlines._current_deadline.set, deadline)
+    with pytest.raises(DeadlineExceeded):
+        context.run(HedgedChatModel(model=model, hedge_after=0.05).invoke, "hi")
+    assert model.calls == []
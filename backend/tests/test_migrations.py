@@ -0,0 +1,233 @@
+# test_migrations.py
+import json
+import re
+from contextlib import contextmanager
+
+import pytest
+
+import migrations
+from migrations import SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME, TABLE_NAME
+
+
+class FakeDatabase:
+    """
+    get_pool() stand-in that records every statement and answers the catalogue
+    lookups migrations.py makes: to_regclass, pg_index and EXPLAIN (FORMAT JSON).
+    """
+
+    def __init__(self, tables=(), primary_key=True, plans=None, fail_on=None):
+        self.tables = set(tables)
+        self.primary_key = primary_key
+        self.plans = plans or {}        # hot query name -> plan, as EXPLAIN (FORMAT JSON) returns it
+        self.fail_on = fail_on
+        self.statements = []
+        self.rolled_back = False
+        self.rowcount = 3
+        self._result = None
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self):
+        yield self
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.statements.append(sql)
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError("could not create unique index")
+        created = re.match(r"CREATE TABLE IF NOT EXISTS (\w+)", sql)
+        if created:
+            self.tables.add(created.group(1))
+        elif sql.startswith("SELECT to_regclass(%s) IS NOT NULL"):
+            self._result = tuple(name in self.tables for name in params)
+        elif sql.startswith("SELECT to_regclass(%s)"):
+            self._result = (params[0] if params[0] in self.tables else None,)
+        elif "FROM pg_index" in sql:
+            self._result = (1,) if self.primary_key else None
+        elif sql.startswith("EXPLAIN"):
+            name = next(n for n, (query, _) in migrations.HOT_QUERIES.items() if sql.endswith(" ".join(query.split())))
+            self._result = (self.plans[name],)
+
+    def fetchone(self):
+        return self._result
+
+    def executed(self, prefix):
+        return [s for s in self.statements if s.startswith(prefix)]
+
+
+@pytest.fixture
+def use_db(monkeypatch):
+    def use(db):
+        monkeypatch.setattr(migrations, "get_pool", lambda: db)
+        return db
+    return use
+
+
+# ---------------------------
+# DDL and backfill
+# ---------------------------
+def test_new_database_gets_every_table_and_index(use_db):
+    db = use_db(FakeDatabase())
+    migrations.ensure_schema(check=False)
+    assert db.tables == {TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME}
+    assert "id BIGSERIAL PRIMARY KEY" in db.executed(f"CREATE TABLE IF NOT EXISTS {TABLE_NAME}")[0]
+    assert "PRIMARY KEY (user_id, session_id)" in db.executed(f"CREATE TABLE IF NOT EXISTS {SESSIONS_TABLE_NAME}")[0]
+    assert db.executed("CREATE INDEX") == [
+        f"CREATE INDEX IF NOT EXISTS {TABLE_NAME}_session_created_idx ON {TABLE_NAME} (session_id, created_at, id)",
+        f"CREATE INDEX IF NOT EXISTS {SESSIONS_TABLE_NAME}_user_first_time_session_idx "
+        f"ON {SESSIONS_TABLE_NAME} (user_id, first_time DESC, session_id DESC)",
+    ]
+    assert db.executed("DROP INDEX") == [f"DROP INDEX IF EXISTS {SESSIONS_TABLE_NAME}_user_first_time_idx"]
+    # Each table's DDL runs under its own advisory lock, in a fixed order
+    assert [s for s in db.statements if "pg_advisory_xact_lock" in s] == \
+        ["SELECT pg_advisory_xact_lock(hashtext(%s))"] * 3
+
+
+def test_sessions_table_and_sidebar_index(use_db):
+    db = use_db(FakeDatabase(tables={SESSIONS_TABLE_NAME}))
+    migrations.ensure_chat_sessions()
+    assert "PRIMARY KEY (user_id, session_id)" in db.executed(f"CREATE TABLE IF NOT EXISTS {SESSIONS_TABLE_NAME}")[0]
+    assert db.executed("CREATE INDEX") == [
+        f"CREATE INDEX IF NOT EXISTS {SESSIONS_TABLE_NAME}_user_first_time_session_idx "
+        f"ON {SESSIONS_TABLE_NAME} (user_id, first_time DESC, session_id DESC)"
+    ]
+    assert db.executed("DROP INDEX") == [f"DROP INDEX IF EXISTS {SESSIONS_TABLE_NAME}_user_first_time_idx"]
+
+
+def test_new_sessions_table_is_backfilled_under_a_share_lock(use_db):
+    db = use_db(FakeDatabase(tables={TABLE_NAME}))
+    migrations.ensure_chat_sessions()
+    lock = db.statements.index(f"LOCK TABLE {TABLE_NAME} IN SHARE MODE")
+    insert = db.statements.index(db.executed(f"INSERT INTO {SESSIONS_TABLE_NAME}")[0])
+    assert lock < insert
+
+
+def test_backfill_statement():
+    db = FakeDatabase()
+    assert migrations.backfill_chat_sessions(db) == 3
+    backfill = db.statements[-1]
+    assert backfill == " ".join(f"""
+        INSERT INTO {SESSIONS_TABLE_NAME} (user_id, session_id, title, first_time, last_time, message_count)
+        SELECT user_id, session_id,
+               (ARRAY_AGG(content ORDER BY created_at) FILTER (WHERE role = 'user'))[1],
+               MIN(created_at), MAX(created_at), COUNT(*)
+        FROM {TABLE_NAME}
+        GROUP BY user_id, session_id
+        ON CONFLICT (user_id, session_id) DO UPDATE SET
+            title = EXCLUDED.title, first_time = EXCLUDED.first_time,
+            last_time = EXCLUDED.last_time, message_count = EXCLUDED.message_count
+    """.split())
+
+
+@pytest.mark.parametrize("backfill, expected", [(False, 0), (True, 1)])
+def test_existing_sessions_table_is_backfilled_only_on_request(use_db, backfill, expected):
+    db = use_db(FakeDatabase(tables={TABLE_NAME, SESSIONS_TABLE_NAME}))
+    migrations.ensure_chat_sessions(backfill=backfill)
+    assert len(db.executed(f"INSERT INTO {SESSIONS_TABLE_NAME}")) == expected
+
+
+def test_no_backfill_without_chat_history(use_db):
+    db = use_db(FakeDatabase())
+    migrations.ensure_chat_sessions(backfill=True)
+    assert not db.executed("LOCK TABLE")
+
+
+def test_old_chat_history_gets_a_primary_key(use_db):
+    db = use_db(FakeDatabase(tables={TABLE_NAME}, primary_key=False))
+    migrations.ensure_chat_history()
+    start = db.statements.index("SAVEPOINT chat_history_pk")
+    assert db.statements[start:start + 4] == [
+        "SAVEPOINT chat_history_pk",
+        f"ALTER TABLE {TABLE_NAME} ADD COLUMN IF NOT EXISTS id BIGSERIAL",
+        f"ALTER TABLE {TABLE_NAME} ADD PRIMARY KEY (id)",
+        "RELEASE SAVEPOINT chat_history_pk",
+    ]
+
+
+def test_failed_primary_key_is_rolled_back_and_indexes_still_created(use_db):
+    db = use_db(FakeDatabase(tables={TABLE_NAME}, primary_key=False, fail_on="ADD PRIMARY KEY"))
+    migrations.ensure_chat_history()
+    assert "ROLLBACK TO SAVEPOINT chat_history_pk" in db.statements
+    assert db.executed("CREATE INDEX")
+
+
+def test_request_path_check_is_one_query_when_tables_exist(use_db):
+    db = use_db(FakeDatabase(tables={TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME}))
+    migrations.ensure_tables()
+    assert len(db.statements) == 1
+
+
+def test_request_path_creates_missing_tables_without_backfill(use_db):
+    db = use_db(FakeDatabase(tables={TABLE_NAME}))
+    migrations.ensure_tables()
+    assert db.tables == {TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME}
+    assert not db.executed("LOCK TABLE") and not db.executed("INSERT")
+
+
+# ---------------------------
+# Index check
+# ---------------------------
+def index_scan(index, relation=TABLE_NAME, node_type="Index Scan", direction="Forward"):
+    return {"Node Type": node_type, "Scan Direction": direction, "Relation Name": relation, "Index Name": index}
+
+
+def explain(plan):
+    """EXPLAIN (FORMAT JSON)'s shape: a one-element list holding {"Plan": ...}."""
+    return [{"Plan": plan}]
+
+
+GOOD_PLANS = {
+    "session messages": explain(index_scan("chat_history_session_created_idx")),
+    "recent window": explain({"Node Type": "Limit", "Plans": [
+        index_scan("chat_history_session_created_idx", direction="Backward")]}),
+    "messages page": explain({"Node Type": "Limit", "Plans": [
+        index_scan("chat_history_session_created_idx", direction="Backward")]}),
+    "session owner": explain({"Node Type": "Limit", "Plans": [
+        index_scan("chat_sessions_pkey", SESSIONS_TABLE_NAME)]}),
+    "sessions page": explain({"Node Type": "Limit", "Plans": [
+        index_scan("chat_sessions_user_first_time_session_idx", SESSIONS_TABLE_NAME, "Index Only Scan")]}),
+}
+
+
+def test_index_backed_plans(use_db):
+    db = use_db(FakeDatabase(plans=GOOD_PLANS))
+    report = migrations.check_indexes()
+    assert report["session messages"] == (True, "chat_history_session_created_idx")
+    assert report["sessions page"] == (True, "chat_sessions_user_first_time_session_idx")
+    assert all(backed for backed, _ in report.values())
+    # The planner is pushed off scans only inside the check's own transaction
+    assert db.statements[:2] == ["SET LOCAL enable_seqscan = off", "SET LOCAL enable_bitmapscan = off"]
+    assert db.rolled_back
+
+
+def test_seq_scan_and_sort_are_reported(use_db):
+    plans = dict(GOOD_PLANS)
+    plans["session messages"] = explain({"Node Type": "Sort", "Plans": [
+        {"Node Type": "Seq Scan", "Relation Name": TABLE_NAME}]})
+    plans["sessions page"] = explain({"Node Type": "Limit", "Plans": [{"Node Type": "Incremental Sort", "Plans": [
+        index_scan("chat_sessions_pkey", SESSIONS_TABLE_NAME)]}]})
+    use_db(FakeDatabase(plans=plans))
+    report = migrations.check_indexes()
+    assert report["session messages"] == (False, f"seq scan on {TABLE_NAME}")
+    assert report["sessions page"] == (True, "chat_sessions_pkey + sort")
+
+
+def test_plan_returned_as_text_is_parsed(use_db):
+    plans = {name: json.dumps(plan) for name, plan in GOOD_PLANS.items()}
+    use_db(FakeDatabase(plans=plans))
+    assert all(backed for backed, _ in migrations.check_indexes().values())
+
+
+def test_cli_check_fails_on_a_slow_query(use_db, capsys):
+    plans = dict(GOOD_PLANS, **{"recent window": explain({"Node Type": "Seq Scan", "Relation Name": TABLE_NAME})})
+    use_db(FakeDatabase(tables={TABLE_NAME, SESSIONS_TABLE_NAME, SUMMARY_TABLE_NAME}, plans=plans))
+    with pytest.raises(SystemExit) as exited:
+        migrations.main(["--check"])
+    assert exited.value.code == 1
+    assert f"SLOW recent window: seq scan on {TABLE_NAME}" in capsys.readouterr().out
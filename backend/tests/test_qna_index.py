@@ -0,0 +1,49 @@
+# test_qna_index.py
+import pytest
+
+from qna_data import PREDEFINED_QAS
+from qna_index import match_predefined
+
+MAJORS = "What are the most popular majors in Malaysia?"
+UNIVERSITIES = "What are the top universities in Malaysia?"
+COST = "What is the cost of living for a student in Malaysia?"
+SCHOLARSHIPS = "What are the scholarship opportunities for international students?"
+VISA = "How do I apply for a student visa in Malaysia?"
+
+
+@pytest.mark.parametrize("question", list(PREDEFINED_QAS))
+def test_predefined_questions_match_themselves(question):
+    assert match_predefined(question) == (question, PREDEFINED_QAS[question], 1.0)
+
+
+@pytest.mark.parametrize("text, question", [
+    ("what are popular majors in malaysia", MAJORS),
+    ("Popular majors in Malaysia?", MAJORS),
+    ("is engineering a popular major in malaysia", MAJORS),
+    ("What are the most popular engineering majors in Malaysia?", MAJORS),
+    ("is medicine a popular major in Malaysia", MAJORS),
+    ("top universities in malaysia", UNIVERSITIES),
+    ("top private universities in Malaysia", UNIVERSITIES),
+    ("cost of living for students in malaysia", COST),
+    ("how much is the cost of living in Malaysia for a student?", COST),
+    ("scholarships for international students", SCHOLARSHIPS),
+    ("Are there scholarships for international students in Malaysia?", SCHOLARSHIPS),
+    ("how to apply for a student visa in malaysia", VISA),
+])
+def test_paraphrases_match(text, question):
+    match = match_predefined(text)
+    assert match is not None and match[0] == question
+
+
+@pytest.mark.parametrize("text", [
+    "top universities for engineering in malaysia",      # the canned list is not per subject
+    "scholarships for medicine students",
+    "how much does it cost to study medicine at Monash Malaysia",
+    "cost of living in penang vs kl",
+    "visa requirements for my spouse",
+    "When is the intake deadline for UM?",
+    "",
+    "the",
+])
+def test_other_questions_do_not_match(text):
+    assert match_predefined(text) is None
@@ -0,0 +1,63 @@
+# test_request_dedup.py
+import time
+import threading
+
+from request_dedup import RequestDeduplicator, INTERRUPTED_REPLY
+
+
+def run_turn(run, events, release=None):
+    def produce():
+        for event in events:
+            if release is not None and event["event"] == "final":
+                release.wait(5)
+            yield event
+
+    return list(run.relay(produce()))
+
+
+def test_duplicate_of_a_long_running_turn_follows_it():
+    dedup = RequestDeduplicator(window=0.05)
+    release = threading.Event()
+    run, leader = dedup.claim("s1", "What are UM's fees?")
+    assert leader
+    events = [{"event": "token", "delta": "About"}, {"event": "final", "reply": "About RM 30,000."}]
+    worker = threading.Thread(target=run_turn, args=(run, events, release))
+    worker.start()
+
+    # Much longer than the window (and, in production, than any fixed TTL): still the same turn
+    time.sleep(0.2)
+    duplicate, leader = dedup.claim("s1", "  what are UM's FEES? ")
+    assert not leader and duplicate is run
+    release.set()
+    assert [e["event"] for e in duplicate.follow(timeout=5)][-1] == "final"
+    worker.join()
+    assert dedup.stats()["running"] == 0
+
+
+def test_finished_turn_absorbs_duplicates_for_the_window_only():
+    dedup = RequestDeduplicator(window=0.1)
+    run, _ = dedup.claim("s1", "hello there")
+    run_turn(run, [{"event": "final", "reply": "Hi!"}])
+    duplicate, leader = dedup.claim("s1", "hello there")
+    assert not leader
+    assert list(duplicate.follow(timeout=1)) == [{"event": "final", "reply": "Hi!"}]
+    time.sleep(0.15)
+    _, leader = dedup.claim("s1", "hello there")
+    assert leader
+
+
+def test_failed_turn_is_forgotten_at_once():
+    dedup = RequestDeduplicator(window=10)
+    run, _ = dedup.claim("s1", "hello there")
+    follower, _ = dedup.claim("s1", "hello there")
+    run.abandon()
+    assert list(follower.follow(timeout=1)) == [{"event": "error", "reply": INTERRUPTED_REPLY}]
+    _, leader = dedup.claim("s1", "hello there")
+    assert leader
+
+
+def test_other_sessions_are_independent():
+    dedup = RequestDeduplicator(window=10)
+    _, first = dedup.claim("s1", "hello there")
+    _, second = dedup.claim("s2", "hello there")
+    assert first and second
@@ -0,0 +1,73 @@
+# test_router.py
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from qna_data import PREDEFINED_QAS
+from router import (
+    REFUSAL_REPLY, classify, predefined_node, predefined_reply, record_route_latency, refusal_node, route_question,
+    route_stats,
+)
+
+
+@pytest.mark.parametrize("text, route", [
+    # Canned answers
+    ("What are the most popular majors in Malaysia?", "predefined"),
+    ("popular majors in malaysia", "predefined"),
+    # Real-time and on-topic: straight to the web search agent
+    ("When is the intake deadline for UM?", "internet_agent"),
+    ("What's the weather in Kuala Lumpur today?", "internet_agent"),
+    ("Latest QS ranking for Malaysian universities", "internet_agent"),
+    # Off-topic: refused without an LLM call
+    ("Write me a poem", "refusal"),
+    ("Tell me a joke", "refusal"),
+    ("Who will win the football match tonight?", "refusal"),
+    # Everything else, including off-topic words in a study question, goes to the supervisor
+    ("Can you help with my python university assignment?", "supervisor"),
+    ("Which university in Malaysia is best for computer science?", "supervisor"),
+    ("What's the latest iPhone?", "supervisor"),
+    ("current weather", "supervisor"),
+    ("Hello", "supervisor"),
+])
+def test_classify(text, route):
+    assert classify(text)[0] == route
+
+
+def test_route_question_reads_the_last_user_message():
+    state = {"messages": [HumanMessage(content="Write me a poem"), AIMessage(content="No."),
+                          HumanMessage(content="When is the intake deadline for UM?")]}
+    assert route_question(state) == "internet_agent"
+
+
+def test_category_click_gets_its_canned_answer():
+    answer, is_category_click = predefined_reply("I'm interested in scholarship-options")
+    assert answer == PREDEFINED_QAS["What are the scholarship opportunities for international students?"]
+    assert is_category_click
+
+
+@pytest.mark.parametrize("text, question", [
+    ("What are the top universities in Malaysia?", "What are the top universities in Malaysia?"),
+    ("popular majors in malaysia", "What are the most popular majors in Malaysia?"),
+])
+def test_typed_near_duplicate_gets_its_canned_answer(text, question):
+    assert predefined_reply(text) == (PREDEFINED_QAS[question], False)
+
+
+@pytest.mark.parametrize("text", ["I'm interested in unknown-category", "When is the intake deadline for UM?"])
+def test_no_canned_answer(text):
+    assert predefined_reply(text) == (None, False)
+
+
+def test_nodes_answer_without_an_llm():
+    state = {"messages": [HumanMessage(content="top universities in malaysia")]}
+    assert predefined_node(state)["messages"][0].content == PREDEFINED_QAS["What are the top universities in Malaysia?"]
+    reply = refusal_node({"messages": [HumanMessage(content="Write me a poem")]})["messages"][0]
+    assert reply.content == REFUSAL_REPLY and reply.name == "refusal"
+
+
+def test_route_latency_is_recorded():
+    record_route_latency("test-route", 0.1)
+    record_route_latency("test-route", 0.3)
+    stats = route_stats()["test-route"]
+    assert stats["count"] == 2
+    assert stats["avg_ms"] == pytest.approx(200)
+    assert stats["max_ms"] == pytest.approx(300)
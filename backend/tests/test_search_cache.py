@@ -0,0 +1,66 @@
+# test_search_cache.py
+import threading
+import time
+
+import pytest
+
+from deadlines import ToolTimeout
+from search_cache import CachedSearch, cache_key
+
+
+class FakeSearch:
+    """Search backend stand-in: counts invoke() calls, optionally slow or returning an error result."""
+
+    def __init__(self, delay=0.0, error=False):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def invoke(self, args):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            return {"error": "rate limited"}
+        return {"query": args["query"], "results": [{"title": "EMGS", "url": "https://example.com"}]}
+
+
+def test_normalized_queries_share_an_entry():
+    backend = FakeSearch()
+    search = CachedSearch(backend)
+    search.search(query="Student visa Malaysia?")
+    search.search(query="  student   visa malaysia ")
+    assert backend.calls == 1
+    assert search.stats()["hits"] == 1
+
+
+def test_other_options_are_part_of_the_key():
+    assert cache_key({"query": "visa", "topic": "news"}) != cache_key({"query": "visa"})
+    assert cache_key({"query": "visa", "topic": None}) == cache_key({"query": "visa"})
+
+
+def test_error_results_are_not_cached():
+    backend = FakeSearch(error=True)
+    search = CachedSearch(backend)
+    search.search(query="visa")
+    search.search(query="visa")
+    assert backend.calls == 2
+
+
+def test_concurrent_misses_make_one_call():
+    backend = FakeSearch(delay=0.2)
+    search = CachedSearch(backend)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(search.search(query="visa"))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert backend.calls == 1
+    assert len(results) == 5 and all(r == results[0] for r in results)
+
+
+def test_slow_search_times_out():
+    search = CachedSearch(FakeSearch(delay=1.0), timeout=0.1)
+    with pytest.raises(ToolTimeout):
+        search.search(query="visa")
+    assert search.stats()["timeouts"] == 1
@@ -0,0 +1,42 @@
+# test_search_compression.py
+from search_compression import compress_results
+
+PAYLOAD = {
+    "query": "universiti malaya tuition fees",
+    "results": [
+        {
+            "title": "UM fees",
+            "url": "https://um.example/fees",
+            "content": "Tuition fees at Universiti Malaya start at RM 30,000 per year for international students. "
+                       "The campus has a lake and several cafeterias for students.",
+        },
+        {
+            "title": "KL weather",
+            "url": "https://weather.example/kl",
+            "content": "Kuala Lumpur is hot and humid with frequent afternoon thunderstorms all year round.",
+        },
+        {"title": "No text", "url": "https://empty.example", "content": ""},
+    ],
+}
+
+
+def test_relevant_sentences_survive_and_unrelated_ones_are_dropped():
+    output = compress_results("universiti malaya tuition fees", PAYLOAD)
+    first = output["results"][0]
+    assert "RM 30,000" in first["content"]
+    assert "lake" not in first["content"]
+
+
+def test_every_source_keeps_its_citation():
+    output = compress_results("universiti malaya tuition fees", PAYLOAD)
+    assert [(r["title"], r["url"]) for r in output["results"]] == [
+        (r["title"], r["url"]) for r in PAYLOAD["results"]
+    ]
+    assert "content" not in output["results"][1]
+    assert "content" not in output["results"][2]
+
+
+def test_budget_caps_the_kept_text():
+    output = compress_results("universiti malaya tuition fees", PAYLOAD, token_budget=5)
+    assert all("content" not in r for r in output["results"])
+    assert len(output["results"]) == 3
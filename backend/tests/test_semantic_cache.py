@@ -0,0 +1,124 @@
+# test_semantic_cache.py
+import math
+from contextlib import contextmanager
+
+from semantic_cache import SemanticCache, is_cacheable, normalize_question
+from sql_templates import UniversityNames
+
+
+class FakeEmbeddings:
+    """Fixed 2-d vectors: a question's cosine similarity with "base" is its angle's cosine."""
+
+    def __init__(self, similarities):
+        self.vectors = {q: [s, math.sqrt(1 - s * s)] for q, s in similarities.items()}
+        self.calls = []
+
+    def embed_query(self, text):
+        self.calls.append(text)
+        return self.vectors[normalize_question(text)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+SIMILARITIES = {
+    "what are the fees at universiti malaya": 1.0,
+    "how much does universiti malaya cost": 0.95,
+    "which universities are in penang": 0.80,
+}
+
+
+def make_cache(**kwargs):
+    embeddings = FakeEmbeddings(SIMILARITIES)
+    return SemanticCache(embeddings, threshold=0.92, **kwargs), embeddings
+
+
+def test_paraphrase_above_threshold_hits_and_below_misses():
+    cache, _ = make_cache()
+    cache.store("What are the fees at Universiti Malaya?", "About RM 30,000 a year.")
+    assert cache.lookup("How much does Universiti Malaya cost?") == "About RM 30,000 a year."
+    assert cache.lookup("Which universities are in Penang?") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["exact_hits"] == 0
+
+
+def test_exact_question_hits_without_embedding():
+    cache, embeddings = make_cache()
+    cache.store("What are the fees at Universiti Malaya?", "About RM 30,000 a year.")
+    embeddings.calls.clear()
+    assert cache.lookup("what are the fees at universiti malaya") == "About RM 30,000 a year."
+    assert embeddings.calls == []
+
+
+def test_miss_then_store_embeds_the_question_once():
+    cache, embeddings = make_cache()
+    cache.store("What are the fees at Universiti Malaya?", "About RM 30,000 a year.")
+    embeddings.calls.clear()
+    question = "Which universities are in Penang?"
+    answer, vector = cache.lookup_with_vector(question)
+    assert answer is None and vector is not None
+    cache.store(question, "USM is in Penang.", vector=vector)
+    assert embeddings.calls == [question]
+    assert cache.lookup(question) == "USM is in Penang."
+
+
+def test_time_sensitive_answers_expire_sooner():
+    clock = Clock()
+    cache, _ = make_cache(ttl=3600, time_sensitive_ttl=60, clock=clock)
+    today = "what are the fees at universiti malaya today"
+    cache.embeddings.vectors[today] = [1.0, 0.0]
+    cache.store(today, "Today's fees.")
+    cache.store("How much does Universiti Malaya cost?", "About RM 30,000 a year.")
+    clock.now = 120
+    # The paraphrase's entry is alive, but older than a time-sensitive question accepts
+    assert cache.lookup(today) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.lookup("What are the fees at Universiti Malaya?") == "About RM 30,000 a year."
+
+
+def test_time_sensitive_question_accepts_a_recent_answer():
+    clock = Clock()
+    cache, _ = make_cache(ttl=3600, time_sensitive_ttl=60, clock=clock)
+    cache.embeddings.vectors["what are the fees at universiti malaya today"] = [1.0, 0.0]
+    cache.store("How much does Universiti Malaya cost?", "About RM 30,000 a year.")
+    clock.now = 30
+    assert cache.lookup("What are the fees at Universiti Malaya today?") == "About RM 30,000 a year."
+
+
+class FakeEngine:
+    """engine.connect() returning the university name rows for UniversityNames."""
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement, parameters=None):
+        return self
+
+    def fetchall(self):
+        return [(1, "Universiti Malaya"), (2, "Universiti Sains Malaysia")]
+
+
+def test_questions_about_different_universities_never_match():
+    snapshot = {"tables": {"Universities": {"columns": [{"name": "id"}], "primary_key": ["id"], "foreign_keys": []}}}
+    names = UniversityNames(FakeEngine(), snapshot)
+    embeddings = FakeEmbeddings({
+        "what are the fees at um": 1.0,
+        "what are the fees at usm": 0.97,
+        "how much are the fees at um": 0.96,
+    })
+    cache = SemanticCache(embeddings, threshold=0.92, entities=names.ids_in)
+    cache.store("What are the fees at UM?", "UM's fees.")
+    assert cache.lookup("What are the fees at USM?") is None
+    assert cache.lookup("How much are the fees at UM?") == "UM's fees."
+
+
+def test_follow_ups_are_not_cacheable():
+    assert is_cacheable("What are the fees at Universiti Malaya?")
+    assert not is_cacheable("fees?")
+    assert not is_cacheable("What about their fees?", has_history=True)
@@ -0,0 +1,130 @@
+# test_session_summary.py
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+import session_summary
+from session_summary import SUMMARY_MIN_NEW_MESSAGES, unsummarized_messages, update_summary, with_summary
+
+T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def row(i, content=None):
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": content or f"message {i}",
+            "created_at": T0 + timedelta(minutes=i)}
+
+
+class FakeHistory:
+    """rows_between over in-memory rows (oldest first)."""
+    session_id = "s1"
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def rows_between(self, after=None, before=None, limit=None, newest=False):
+        rows = [r for r in self.rows
+                if (after is None or r["created_at"] > after) and (before is None or r["created_at"] < before)]
+        if limit is None:
+            return rows
+        return rows[-limit:] if newest else rows[:limit]
+
+
+class FakePool:
+    """get_pool() stand-in that records the statements executed through it."""
+
+    def __init__(self):
+        self.executed = []
+
+    @contextmanager
+    def connection(self):
+        yield self
+
+    @contextmanager
+    def cursor(self, **kwargs):
+        yield self
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(session_summary, "get_pool", lambda: pool)
+    return pool
+
+
+class FakeSummaryModel:
+    """The summary LLM: records the prompts it gets and answers with a fixed summary."""
+
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        return AIMessage(content="The student wants to study data science in Penang.")
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    model = FakeSummaryModel()
+    monkeypatch.setattr(session_summary, "llm", model)
+    return model.calls
+
+
+def test_with_summary_adds_a_system_message():
+    window = [HumanMessage(content="hi")]
+    messages = with_summary(window, {"summary": "Earlier: asked about visas."})
+    assert isinstance(messages[0], SystemMessage)
+    assert "Earlier: asked about visas." in messages[0].content
+    assert messages[1:] == window
+    assert with_summary(window, None) == window
+
+
+def test_with_summary_puts_unsummarized_messages_between_summary_and_window():
+    bridge = [AIMessage(content="older answer")]
+    messages = with_summary([HumanMessage(content="now")], {"summary": "s"}, bridge)
+    assert [type(m) for m in messages] == [SystemMessage, AIMessage, HumanMessage]
+
+
+def test_few_evicted_messages_wait_for_a_batch(pool, llm):
+    history = FakeHistory([row(i) for i in range(10)])
+    window_start = history.rows[SUMMARY_MIN_NEW_MESSAGES - 1]["created_at"]
+    assert not update_summary(history, window_start)
+    assert llm == [] and pool.executed == []
+
+
+def test_evicted_messages_are_kept_until_summarized(pool, llm):
+    history = FakeHistory([row(i) for i in range(10)])
+    window_start = history.rows[3]["created_at"]          # rows 0-2 left the window
+    update_summary(history, window_start)
+    bridge = unsummarized_messages(history, None, window_start)
+    assert [m.content for m in bridge] == ["message 0", "message 1", "message 2"]
+
+
+def test_summary_update_after_eviction(pool, llm):
+    history = FakeHistory([row(i) for i in range(12)])
+    window_start = history.rows[6]["created_at"]
+    assert update_summary(history, window_start)
+    assert len(llm) == 1
+    assert "message 5" in llm[0][-1].content and "message 6" not in llm[0][-1].content
+    _query, params = pool.executed[-1]
+    assert params == ("s1", "The student wants to study data science in Penang.", history.rows[5]["created_at"], 6)
+
+    # Only rows after summarized_until are pending; nothing left between summary and window
+    summary = {"summary": params[1], "summarized_until": params[2], "message_count": 6}
+    assert unsummarized_messages(history, summary, window_start) == []
+    assert not update_summary(history, history.rows[8]["created_at"], summary)
+
+
+def test_unsummarized_messages_are_bounded_and_truncated(monkeypatch):
+    monkeypatch.setattr(session_summary, "HISTORY_MAX_MESSAGE_TOKENS", 5)
+    history = FakeHistory([row(i, "word " * 100) for i in range(20)])
+    bridge = unsummarized_messages(history, None, history.rows[15]["created_at"])
+    assert len(bridge) == SUMMARY_MIN_NEW_MESSAGES
+    assert bridge[-1].content.startswith("word word")          # rows 11..14, newest last
+    answers = [m for m in bridge if isinstance(m, AIMessage)]
+    assert all(len(m.content) < 100 for m in answers)
+    assert unsummarized_messages(history, None, None) == []
@@ -0,0 +1,101 @@
+# test_sql_cache.py
+import pytest
+
+import sql_cache
+from sql_cache import SQLQueryCache, normalize_sql
+
+
+class FakeDB:
+    """SQLDatabase stand-in: run_no_throw returns a per-call result, or an error string for failing queries."""
+
+    def __init__(self):
+        self.calls = []
+
+    def run_no_throw(self, sql, include_columns=False, parameters=None):
+        self.calls.append(sql)
+        if "missing_column" in sql:
+            return "Error: column does not exist"
+        return f"[('row', {len(self.calls)})]"
+
+
+@pytest.fixture
+def versions(monkeypatch):
+    current = {"Universities": "1:0", "Programs": "2:0"}
+    monkeypatch.setattr(sql_cache, "table_versions", lambda engine, tables: dict(current))
+    return current
+
+
+@pytest.fixture
+def db():
+    return FakeDB()
+
+
+@pytest.fixture
+def cache(db, versions):
+    return SQLQueryCache(db, engine=None, tables=["Universities", "Programs"], version_interval=0)
+
+
+def test_repeated_query_is_served_from_cache(cache, db):
+    first = cache.query('SELECT name FROM "Universities"')
+    assert cache.query('select  name\nfrom "Universities";') == first
+    assert len(db.calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_change_to_a_read_table_invalidates(cache, db, versions):
+    first = cache.query('SELECT name FROM "Universities"')
+    versions["Universities"] = "1:1"
+    second = cache.query('SELECT name FROM "Universities"')
+    assert second != first
+    assert len(db.calls) == 2
+    assert cache.stats()["stale"] == 1
+    assert cache.query('SELECT name FROM "Universities"') == second
+
+
+def test_change_to_another_table_keeps_the_entry(cache, db, versions):
+    cache.query('SELECT name FROM "Universities"')
+    versions["Programs"] = "2:1"
+    cache.query('SELECT name FROM "Universities"')
+    assert len(db.calls) == 1
+
+
+def test_rewritten_table_invalidates(cache, db, versions):
+    cache.query('SELECT name FROM "Programs"')
+    versions["Programs"] = "99:0"              # TRUNCATE: new file node, counters unchanged
+    cache.query('SELECT name FROM "Programs"')
+    assert len(db.calls) == 2
+
+
+def test_version_checks_are_throttled(db, versions):
+    cache = SQLQueryCache(db, engine=None, tables=["Universities"], version_interval=3600)
+    cache.query('SELECT name FROM "Universities"')
+    versions["Universities"] = "1:1"
+    cache.query('SELECT name FROM "Universities"')
+    assert len(db.calls) == 1                  # change not seen until the next check
+    cache.invalidate()
+    cache.query('SELECT name FROM "Universities"')
+    assert len(db.calls) == 2
+
+
+@pytest.mark.parametrize("sql", [
+    'DELETE FROM "Universities"',
+    'SELECT name FROM "Universities"; DROP TABLE "Programs"',
+    'SELECT name, random() FROM "Universities"',
+    "SELECT 1",                                # reads no cached table
+])
+def test_uncacheable_statements_always_run(cache, db, sql):
+    cache.query(sql)
+    cache.query(sql)
+    assert len(db.calls) == 2
+    assert cache.stats()["uncacheable"] == 2
+
+
+def test_errors_are_not_cached(cache, db):
+    cache.query('SELECT missing_column FROM "Universities"')
+    cache.query('SELECT missing_column FROM "Universities"')
+    assert len(db.calls) == 2
+
+
+def test_normalize_keeps_literals():
+    assert normalize_sql("SELECT  *\nFROM \"Universities\" WHERE name = 'Universiti  Malaya';") == \
+        "select * from \"Universities\" where name = 'Universiti  Malaya'"
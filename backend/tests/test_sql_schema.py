@@ -0,0 +1,115 @@
+# test_sql_schema.py
+import json
+
+import pytest
+from sqlalchemy import create_engine, text
+
+import sql_schema
+from sql_schema import (
+    SQL_INCLUDE_TABLES, build_snapshot, is_current, load_or_build_snapshot, load_snapshot, make_schema_tool,
+    render_schema, save_snapshot,
+)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite stand-in for the catalogue: every included table, with a university and a program."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'catalogue.db'}")
+    with engine.begin() as conn:
+        for name in SQL_INCLUDE_TABLES:
+            if name not in ("Universities", "Programs"):
+                conn.execute(text(f'CREATE TABLE "{name}" (id INTEGER PRIMARY KEY, "universityID" INTEGER)'))
+        conn.execute(text('CREATE TABLE "Universities" (id INTEGER PRIMARY KEY, name TEXT NOT NULL, "countryID" INTEGER)'))
+        conn.execute(text('CREATE TABLE "Programs" (id INTEGER PRIMARY KEY, '
+                          '"universityID" INTEGER REFERENCES "Universities" (id), name TEXT)'))
+        conn.execute(text("""INSERT INTO "Universities" VALUES (1, 'Universiti Malaya', 14)"""))
+        conn.execute(text("""INSERT INTO "Programs" VALUES (1, 1, 'Data Science')"""))
+    return engine
+
+
+def add_column(engine):
+    with engine.begin() as conn:
+        conn.execute(text('ALTER TABLE "Universities" ADD COLUMN "website" TEXT'))
+
+
+def test_snapshot_survives_a_round_trip(engine, tmp_path):
+    snapshot = build_snapshot(engine)
+    path = tmp_path / "snapshot.json"
+    save_snapshot(snapshot, path)
+    assert load_snapshot(path) == json.loads(json.dumps(snapshot, default=str))
+    assert is_current(snapshot, engine)
+
+
+def test_structure_change_makes_the_snapshot_stale(engine):
+    snapshot = build_snapshot(engine)
+    add_column(engine)
+    assert not is_current(snapshot, engine)
+    assert build_snapshot(engine)["version"] != snapshot["version"]
+
+
+def test_new_rows_keep_the_snapshot_current(engine):
+    snapshot = build_snapshot(engine)
+    with engine.begin() as conn:
+        conn.execute(text("""INSERT INTO "Universities" VALUES (2, 'Universiti Sains Malaysia', 14)"""))
+    assert is_current(snapshot, engine)
+
+
+def test_cli_detects_a_stale_snapshot_and_rebuilds_it(engine, tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "snapshot.json")
+    monkeypatch.setattr(sql_schema, "SQL_SCHEMA_SNAPSHOT", path)
+    monkeypatch.setattr(sql_schema, "get_engine", lambda: engine)
+    sql_schema.main(["--refresh"])
+    sql_schema.main(["--check"])
+    assert "Snapshot matches the database" in capsys.readouterr().out
+
+    add_column(engine)
+    with pytest.raises(SystemExit) as exited:
+        sql_schema.main(["--check"])
+    assert exited.value.code == 1
+    assert 'website TEXT' not in render_schema(load_snapshot(path))
+
+    sql_schema.main(["--refresh"])
+    sql_schema.main(["--check"])
+    assert "Snapshot matches the database" in capsys.readouterr().out
+    assert 'website TEXT' in render_schema(load_snapshot(path))
+
+
+def test_missing_table_triggers_a_rebuild(engine, tmp_path):
+    path = tmp_path / "snapshot.json"
+    save_snapshot(build_snapshot(engine, ["Universities"]), path)
+    snapshot = load_or_build_snapshot(engine, ["Universities", "Programs"], path)
+    assert set(snapshot["tables"]) == {"Universities", "Programs"}
+    assert set(load_snapshot(path)["tables"]) == {"Universities", "Programs"}
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"format": 0, "tables": {}})])
+def test_unreadable_or_old_snapshot_is_ignored(tmp_path, content):
+    path = tmp_path / "snapshot.json"
+    path.write_text(content)
+    assert load_snapshot(path) is None
+
+
+def test_render_schema_is_stable(engine, tmp_path):
+    snapshot = build_snapshot(engine)
+    path = tmp_path / "snapshot.json"
+    save_snapshot(snapshot, path)
+    rendered = render_schema(snapshot)
+    # The same text from a rebuild and from disk: the prompt (and its cache prefix) only changes with the data
+    assert render_schema(build_snapshot(engine)) == rendered
+    assert render_schema(load_snapshot(path)) == rendered
+    assert rendered.startswith("- " + sql_schema.CONVENTIONS[0] + "\n- " + sql_schema.CONVENTIONS[1] + "\n\n")
+    assert rendered.index('CREATE TABLE "Scholarships"') < rendered.index('CREATE TABLE "Universities"')
+    assert "Universiti Malaya\t14" in rendered
+
+
+def test_render_schema_follows_the_requested_tables(engine):
+    snapshot = build_snapshot(engine)
+    rendered = render_schema(snapshot, ["Programs", "Universities"])
+    assert rendered.index('CREATE TABLE "Programs"') < rendered.index('CREATE TABLE "Universities"')
+    assert 'CREATE TABLE "Scholarships"' not in rendered
+
+
+def test_schema_tool_answers_from_the_snapshot(engine):
+    tool = make_schema_tool(build_snapshot(engine))
+    assert 'CREATE TABLE "Programs"' in tool.invoke({"table_names": '"Programs"'})
+    assert tool.invoke({"table_names": "Programs, Courses"}).startswith("Error:")
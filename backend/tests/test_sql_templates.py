@@ -0,0 +1,117 @@
+# test_sql_templates.py
+from contextlib import contextmanager
+
+import pytest
+
+import sql_templates
+from sql_templates import TemplateMatcher
+
+
+def table(*columns, pk="id"):
+    return {"columns": [{"name": c} for c in ("id",) + columns], "primary_key": [pk], "foreign_keys": []}
+
+
+SNAPSHOT = {
+    "tables": {
+        "Universities": table("name", "countryID", "location"),
+        "Scholarships": table("name", "universityID"),
+        "Programs": table("name", "tutionFees", "universityID"),
+        "DocumentsRequired": table("document", "universityID"),
+        "Admissions": table("intake", "universityID"),
+        "Eligibility": table("requirement", "universityID"),
+        "VisaInfo": table("details", "countryID"),
+        "HealthInsurance": table("provider", "countryID"),
+    }
+}
+
+UNIVERSITIES = [(1, "Universiti Malaya"), (2, "Universiti Sains Malaysia"), (3, "Taylor's University")]
+
+
+class FakeEngine:
+    """engine.connect() whose queries return the university list, failing the first `failures` times."""
+
+    def __init__(self, rows=UNIVERSITIES, failures=0):
+        self.rows = rows
+        self.failures = failures
+        self.queries = 0
+
+    @contextmanager
+    def connect(self):
+        yield self
+
+    def execute(self, statement, parameters=None):
+        self.queries += 1
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("database unavailable")
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+@pytest.fixture
+def matcher():
+    return TemplateMatcher(SNAPSHOT, FakeEngine())
+
+
+def test_named_university_and_intent_match(matcher):
+    match = matcher.match("What scholarships does Universiti Malaya offer?")
+    assert match.template.name == "scholarships"
+    assert match.parameters["university_id"] == 1
+    assert match.university == "Universiti Malaya"
+    assert '"Scholarships"' in match.sql and '"universityID"' in match.sql
+
+
+def test_acronym_names_a_university(matcher):
+    match = matcher.match("documents required for USM")
+    assert match.template.name == "documents_required"
+    assert match.parameters["university_id"] == 2
+
+
+def test_program_words_filter_the_fees_query(matcher):
+    match = matcher.match("tuition fees for data science at Universiti Malaya")
+    assert match.template.name == "program_fees"
+    assert match.parameters["program"] == ["%data%", "%science%"]
+
+
+def test_optional_university_falls_back_to_all(matcher):
+    match = matcher.match("scholarships for international students")
+    assert match.template.name == "scholarships"
+    assert "university_id" not in match.parameters
+
+
+def test_country_level_templates_need_no_university(matcher):
+    assert matcher.match("student visa requirements").template.name == "visa_info"
+
+
+@pytest.mark.parametrize("question, reason", [
+    ("compare fees at Universiti Malaya and USM", "too_specific"),
+    ("what are the fees", "no_university"),
+    ("scholarships at University of Melbourne", "no_university"),
+    ("how is the food in Penang", "no_intent"),
+    ("visa and insurance for students", "ambiguous"),
+])
+def test_questions_the_agent_must_answer(matcher, question, reason):
+    assert matcher.match(question) is None
+    assert matcher.stats()[reason] == 1
+
+
+def test_templates_without_their_columns_are_disabled():
+    snapshot = {"tables": dict(SNAPSHOT["tables"], Programs=table("title", "universityID"))}
+    matcher = TemplateMatcher(snapshot, FakeEngine())
+    assert "program_fees" not in matcher.stats()["templates"]
+
+
+def test_failed_name_load_is_retried_soon(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(sql_templates.time, "monotonic", lambda: clock[0])
+    engine = FakeEngine(failures=1)
+    matcher = TemplateMatcher(SNAPSHOT, engine, names_ttl=3600)
+    assert matcher.match("scholarships at Universiti Malaya") is None
+    clock[0] += sql_templates.UNIVERSITY_NAMES_RETRY + 1
+    assert matcher.match("scholarships at Universiti Malaya").parameters["university_id"] == 1
+    # Loaded: no more queries until the TTL is up
+    clock[0] += 60
+    matcher.match("scholarships at Universiti Malaya")
+    assert engine.queries == 2
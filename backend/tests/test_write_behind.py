@@ -0,0 +1,139 @@
+# test_write_behind.py
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+import write_behind
+from write_behind import WriteBehindWriter
+
+
+class FakeCursor:
+    """Stores inserted rows; like psycopg2, refuses strings containing NUL."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, query, values):
+        if self.db.unreachable:
+            self.db.unreachable -= 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        for value in values:
+            if any(isinstance(v, str) and "\x00" in v for v in value):
+                raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+        self.db.rows.extend(values)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakePool:
+    def __init__(self):
+        self.rows = []
+        self.unreachable = 0
+
+    @contextmanager
+    def connection(self):
+        yield FakeConnection(self)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    pool = FakePool()
+    monkeypatch.setattr(write_behind, "get_pool", lambda: pool)
+    monkeypatch.setattr(write_behind, "execute_values", lambda cur, query, values, page_size: cur.execute(query, values))
+    return pool
+
+
+def make_writer(**kwargs):
+    kwargs.setdefault("linger", 0.01)
+    return WriteBehindWriter("chat_history", **kwargs)
+
+
+def contents(db):
+    return [row[3] for row in db.rows]
+
+
+def test_flush_writes_rows_in_order(db):
+    writer = make_writer()
+    for i in range(5):
+        writer.append("u1", "s1", "human", f"m{i}")
+    assert writer.flush(timeout=5)
+    assert contents(db) == ["m0", "m1", "m2", "m3", "m4"]
+    timestamps = [row[4] for row in db.rows]
+    assert timestamps == sorted(timestamps) and len(set(timestamps)) == 5
+    assert writer.pending_rows("s1") == []
+    writer.close()
+
+
+def test_rows_stay_pending_until_committed(db):
+    db.unreachable = 1
+    writer = make_writer(max_retries=5)
+    writer.append("u1", "s1", "human", "hello")
+    assert [row["content"] for row in writer.pending_rows("s1")] == ["hello"]
+    assert writer.flush(timeout=5)
+    assert writer.pending_rows("s1") == []
+    assert contents(db) == ["hello"]
+    writer.close()
+
+
+def test_poisoned_row_is_dropped_and_the_rest_drain(db):
+    commits = []
+    writer = make_writer(max_retries=1, on_commit=lambda rows: commits.extend(r["content"] for r in rows))
+    writer.append("u1", "s1", "human", "before")
+    writer.append("u1", "s1", "ai", "bad\x00row")
+    writer.append("u1", "s2", "human", "after")
+    assert writer.flush(timeout=10)
+    assert contents(db) == ["before", "after"]
+    assert commits == ["before", "after"]
+    stats = writer.stats()
+    assert stats["dropped"] == 1 and stats["flushed"] == 2 and stats["pending"] == 0
+
+    # Later messages are not held up
+    writer.append("u1", "s1", "human", "later")
+    assert writer.flush(timeout=5)
+    assert contents(db)[-1] == "later"
+    writer.close()
+
+
+def test_connection_errors_keep_rows_queued(db):
+    db.unreachable = 2
+    writer = make_writer(max_retries=1)
+    writer.append("u1", "s1", "human", "a")
+    writer.append("u1", "s1", "ai", "b")
+    assert writer.flush(timeout=10)
+    assert contents(db) == ["a", "b"]
+    assert writer.stats()["dropped"] == 0
+    writer.close()
+
+
+def test_get_writer_rejects_different_hooks(db, monkeypatch):
+    monkeypatch.setattr(write_behind, "CHAT_WRITE_BEHIND", True)
+    monkeypatch.setattr(write_behind, "_writers", {})
+    monkeypatch.setattr(write_behind, "_writers_pid", None)
+
+    def on_batch(cur, rows):
+        pass
+
+    writer = write_behind.get_writer("chat_history", on_batch=on_batch)
+    assert write_behind.get_writer("chat_history", on_batch=on_batch) is writer
+    with pytest.raises(ValueError):
+        write_behind.get_writer("chat_history")
+    writer.close()
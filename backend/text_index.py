@@ -0,0 +1,96 @@
+# text_index.py
+import math
+import re
+from collections import Counter, defaultdict
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "at", "by", "from", "about", "as",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "can", "could", "should", "would", "will",
+    "i", "me", "my", "we", "our", "you", "your", "what", "which", "who", "whom", "how", "when", "where", "why",
+    "this", "that", "these", "those", "there", "it", "its", "any", "some", "most", "more", "much", "many",
+    "please", "tell", "give", "list", "show", "know", "want", "like", "get", "s", "opportunity", "opportunities",
+}
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def stem(word):
+    """Very light plural stemming, enough to match 'universities'/'university' and 'scholarships'/'scholarship'."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in _WORD.findall((text or "").lower()) if w not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring. Documents can be added,
+    replaced and removed at any time; term statistics are kept incrementally.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = defaultdict(dict)   # term -> {doc_id: term frequency}
+        self._doc_lengths = {}
+        self._doc_terms = {}
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._doc_lengths)
+
+    def __contains__(self, doc_id):
+        return doc_id in self._doc_lengths
+
+    def add(self, doc_id, text):
+        """Index text under doc_id, replacing any previous version of the document."""
+        if doc_id in self._doc_lengths:
+            self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self._postings[term][doc_id] = tf
+        length = sum(counts.values())
+        self._doc_lengths[doc_id] = length
+        self._doc_terms[doc_id] = list(counts)
+        self._total_length += length
+
+    def remove(self, doc_id):
+        if doc_id not in self._doc_lengths:
+            return
+        for term in self._doc_terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def idf(self, term):
+        n = len(self._doc_lengths)
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query, top_k=5):
+        """Return up to top_k (doc_id, score) pairs, best first."""
+        if not self._doc_lengths:
+            return []
+        avg_length = self._total_length / len(self._doc_lengths) or 1.0
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf(term)
+            for doc_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def score(self, query, doc_id):
+        for found, value in self.search(query, top_k=len(self._doc_lengths)):
+            if found == doc_id:
+                return value
+        return 0.0
@@ -0,0 +1,263 @@
+# write_behind.py
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+import psycopg2
+from psycopg2.extras import execute_values
+
+from db import get_pool, PoolTimeout
+
+# Load environment variables
+load_dotenv()
+
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+CHAT_WRITE_BEHIND_MAX_PENDING = int(os.getenv("CHAT_WRITE_BEHIND_MAX_PENDING", "5000"))  # buffered rows before writers block
+CHAT_WRITE_BEHIND_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BEHIND_BATCH_SIZE", "200"))
+CHAT_WRITE_BEHIND_LINGER = float(os.getenv("CHAT_WRITE_BEHIND_LINGER", "0.05"))          # seconds to gather a batch
+CHAT_WRITE_BEHIND_BLOCK = float(os.getenv("CHAT_WRITE_BEHIND_BLOCK", "2"))               # max wait for buffer space
+CHAT_WRITE_BEHIND_FLUSH_TIMEOUT = float(os.getenv("CHAT_WRITE_BEHIND_FLUSH_TIMEOUT", "10"))
+CHAT_WRITE_BEHIND_MAX_RETRIES = int(os.getenv("CHAT_WRITE_BEHIND_MAX_RETRIES", "3"))     # batch attempts before writing rows one by one
+
+_ONE_MICROSECOND = timedelta(microseconds=1)
+# The database (not the rows) is the problem: keep the rows and retry later
+_TRANSIENT_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolTimeout)
+
+
+class WriteBehindWriter:
+    """
+    Buffers chat rows in memory and inserts them from a background thread in
+    batched multi-row INSERTs. created_at is assigned on append (strictly
+    increasing within a session), so a session's order never depends on when
+    its rows reach the database. Rows stay visible through pending_rows() until
+    their batch is committed. When max_pending rows are buffered, append()
+    blocks for up to block seconds and then writes the row itself.
+    on_batch(cursor, rows), if given, runs in the same transaction as each insert;
+    on_commit(rows) runs after that transaction has committed.
+    A batch that fails max_retries times is written row by row; a row that
+    still fails with anything but a connection error is logged and dropped,
+    so one bad message can't hold up everything queued behind it.
+    """
+
+    def __init__(self, table, on_batch=None, on_commit=None, max_pending=CHAT_WRITE_BEHIND_MAX_PENDING,
+                 batch_size=CHAT_WRITE_BEHIND_BATCH_SIZE, linger=CHAT_WRITE_BEHIND_LINGER, block=CHAT_WRITE_BEHIND_BLOCK,
+                 max_retries=CHAT_WRITE_BEHIND_MAX_RETRIES):
+        self.table = table
+        self.on_batch = on_batch
+        self.on_commit = on_commit
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.linger = linger
+        self.block = block
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._queue = deque()      # rows in append order
+        self._pending = {}         # session_id -> deque of its rows not yet committed
+        self._closing = False
+        self._stats = {"appended": 0, "flushed": 0, "batches": 0, "failures": 0, "direct_writes": 0,
+                       "dropped": 0}
+        self._thread = threading.Thread(target=self._run, name="chat-write-behind", daemon=True)
+        self._thread.start()
+
+    def append(self, user_id, session_id, role, content):
+        with self._cond:
+            row = {
+                "user_id": user_id,
+                "session_id": session_id,
+                "role": role,
+                "content": content,
+                "created_at": self._next_timestamp_locked(session_id),
+            }
+            # Backpressure: wait for the writer to make room, then fall back to writing inline
+            deadline = time.monotonic() + self.block
+            while len(self._queue) >= self.max_pending and not self._closing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            self._stats["appended"] += 1
+            if len(self._queue) < self.max_pending and not self._closing:
+                self._queue.append(row)
+                self._pending.setdefault(session_id, deque()).append(row)
+                self._cond.notify_all()
+                return row
+            self._stats["direct_writes"] += 1
+        logging.warning("Chat write-behind buffer full, writing message inline")
+        self._insert([row])
+        return row
+
+    def _next_timestamp_locked(self, session_id):
+        now = datetime.now(timezone.utc)
+        rows = self._pending.get(session_id)
+        if rows and now <= rows[-1]["created_at"]:
+            now = rows[-1]["created_at"] + _ONE_MICROSECOND
+        return now
+
+    def pending_rows(self, session_id):
+        """Rows of session_id that are not committed yet, oldest first."""
+        with self._cond:
+            return list(self._pending.get(session_id, ()))
+
+    def flush(self, timeout=CHAT_WRITE_BEHIND_FLUSH_TIMEOUT):
+        """Wait until everything appended so far is committed; False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.notify_all()
+                self._cond.wait(remaining)
+        return True
+
+    def close(self, timeout=CHAT_WRITE_BEHIND_FLUSH_TIMEOUT):
+        flushed = self.flush(timeout)
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+        if not flushed:
+            logging.error("Chat write-behind closed with %d unflushed messages", len(self._queue))
+        return flushed
+
+    def _run(self):
+        backoff = 0.5
+        attempts = 0
+        while True:
+            with self._cond:
+                while not self._queue and not self._closing:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                linger = len(self._queue) < self.batch_size and not self._closing
+            if linger:
+                # Give concurrent requests a moment to join this batch
+                time.sleep(self.linger)
+            with self._cond:
+                batch = [self._queue[i] for i in range(min(self.batch_size, len(self._queue)))]
+            if attempts < self.max_retries:
+                try:
+                    self._insert(batch)
+                    done, dropped = len(batch), 0
+                except Exception:
+                    attempts += 1
+                    logging.exception("Chat write-behind flush of %d messages failed (attempt %d of %d)",
+                                      len(batch), attempts, self.max_retries)
+                    done, dropped = 0, 0
+            else:
+                done, dropped = self._insert_each(batch)
+            if not done:
+                with self._cond:
+                    self._stats["failures"] += 1
+                    if self._closing:
+                        return
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+            backoff = 0.5
+            attempts = 0
+            with self._cond:
+                for row in batch[:done]:
+                    self._queue.popleft()
+                    rows = self._pending[row["session_id"]]
+                    rows.popleft()
+                    if not rows:
+                        del self._pending[row["session_id"]]
+                self._stats["flushed"] += done - dropped
+                self._stats["dropped"] += dropped
+                self._stats["batches"] += 1
+                self._cond.notify_all()
+
+    def _insert_each(self, rows):
+        """
+        Insert rows one at a time after their batch kept failing. Returns how
+        many leading rows are done (written or dropped) and how many of those
+        were dropped; stops at a connection error, leaving the rest queued.
+        """
+        dropped = 0
+        for done, row in enumerate(rows):
+            try:
+                self._insert([row])
+            except _TRANSIENT_ERRORS:
+                logging.exception("Chat write-behind cannot reach the database, keeping %d messages queued",
+                                  len(rows) - done)
+                return done, dropped
+            except Exception:
+                logging.exception(
+                    "Chat write-behind dropped a message it cannot store: user_id=%s session_id=%s role=%s "
+                    "created_at=%s content=%r",
+                    row["user_id"], row["session_id"], row["role"], row["created_at"], str(row["content"])[:200],
+                )
+                dropped += 1
+        return len(rows), dropped
+
+    def _insert(self, rows):
+        query = f"INSERT INTO {self.table} (user_id, session_id, role, content, created_at) VALUES %s"
+        values = [(r["user_id"], r["session_id"], r["role"], r["content"], r["created_at"]) for r in rows]
+        with get_pool().connection() as conn, conn.cursor() as cur:
+            execute_values(cur, query, values, page_size=len(values))
+            if self.on_batch is not None:
+                self.on_batch(cur, rows)
+        if self.on_commit is not None:
+            # The rows are in; a failing hook must not make the flusher insert them again
+            try:
+                self.on_commit(rows)
+            except Exception:
+                logging.exception("Chat write-behind on_commit hook failed")
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data["pending"] = len(self._queue)
+            data["pending_sessions"] = len(self._pending)
+        data["avg_batch"] = data["flushed"] / data["batches"] if data["batches"] else 0.0
+        return data
+
+
+# ---------------------------
+# Process-wide writer
+# ---------------------------
+_writers = {}
+_writers_pid = None
+_writers_lock = threading.Lock()
+
+
+def get_writer(table, on_batch=None, on_commit=None):
+    """
+    The writer for table, or None when write-behind is off. Recreated after a fork.
+    Every caller must pass the same hooks: whoever came first would otherwise
+    decide whether they run.
+    """
+    global _writers_pid
+    if not CHAT_WRITE_BEHIND:
+        return None
+    with _writers_lock:
+        if _writers_pid != os.getpid():
+            _writers.clear()
+            _writers_pid = os.getpid()
+        writer = _writers.get(table)
+        if writer is None:
+            writer = _writers[table] = WriteBehindWriter(table, on_batch=on_batch, on_commit=on_commit)
+        elif writer.on_batch is not on_batch or writer.on_commit is not on_commit:
+            raise ValueError(f"Write-behind writer for {table} already exists with different hooks")
+        return writer
+
+
+def flush_all(timeout=CHAT_WRITE_BEHIND_FLUSH_TIMEOUT):
+    with _writers_lock:
+        writers = list(_writers.values()) if _writers_pid == os.getpid() else []
+    for writer in writers:
+        writer.close(timeout)
+
+
+# Flush buffered messages when the process exits normally (including gunicorn/uvicorn shutdown)
+atexit.register(flush_all)
+
+
+def writer_stats():
+    with _writers_lock:
+        writers = dict(_writers) if _writers_pid == os.getpid() else {}
+    return {table: writer.stats() for table, writer in writers.items()}
@@ -45,6 +45,40 @@ export const sendMessageWithToken = async (message, token) => {
   }
 };
 
+// ---- Streaming chat (server-sent events) ----
+// onEvent receives each event object: session, start, node, handoff, tool_call, token, final, error
+export const streamMessage = async (message, onEvent, token) => {
+  const response = await fetch(`${API.defaults.baseURL}/api/chat/stream`, {
+    method: "POST",
+    credentials: "include",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(token ? { message, token } : { message }),
+  });
+  if (!response.ok || !response.body) {
+    throw { detail: "Chat request failed" };
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let final = null;
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const frames = buffer.split("\n\n");
+    buffer = frames.pop();
+    for (const frame of frames) {
+      const data = frame.split("\n").find((line) => line.startsWith("data: "));
+      if (!data) continue;
+      const event = JSON.parse(data.slice(6));
+      if (event.event === "final" || event.event === "error") final = event;
+      onEvent?.(event);
+    }
+  }
+  return final;
+};
+
 // ---- Chat sessions (sidebar) ----
 export const fetchSessions = async () => {
   try {
@@ -76,10 +110,12 @@ export const createNewChatSession = async () => {
 
 
 // ---- Get Session Messages ----
-export const getSessionMessages = async (sessionId) => {
+export const getSessionMessages = async (sessionId, cursor) => {
   try {
-    const response = await API.get(`/api/chat/session/${sessionId}/messages`);
-    return response.data; // { messages: [...], session_id: ... }
+    const response = await API.get(`/api/chat/session/${sessionId}/messages`, {
+      params: cursor ? { cursor } : undefined
+    });
+    return response.data; // { messages: [...], session_id: ..., next_cursor: ... }
   } catch (error) {
     throw error.response?.data || { detail: "Failed to load session messages" };
   }